@@ -8,6 +8,12 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
+# Each function instance serves one request at a time; keep at most one warm
+# database connection per instance (see app/database.py)
+os.environ.setdefault('DB_PROFILE', 'serverless')
+# The deployment bundle is read-only; keep presence and similar state in memory
+os.environ.setdefault('LOCAL_STORE', 'memory')
+
 # Import your Flask app
 from app import create_app
 
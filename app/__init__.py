@@ -1,18 +1,16 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from .cache import TTLCache
+from .routing import RoutingSession
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-this-in-production'
-<<<<<<< HEAD
-    # Use absolute path to database in instance folder
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'smart_edu.db')
-=======
     
     # Database configuration for Vercel deployment
     database_url = os.environ.get('DATABASE_URL')
@@ -21,16 +19,125 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     else:
         # Fallback to SQLite for local development
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smart_edu.db'
+        # Use absolute path to database in instance folder
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'smart_edu.db')
     
->>>>>>> 20d6cadbcc532909d2d934043a38f1396fab3925
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
     app.config['SESSION_COOKIE_SECURE'] = True  # Enable for production
     app.config['SESSION_COOKIE_HTTPONLY'] = True
-    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+    # Idle timeout: server-side sessions slide forward while in use (app/sessions.py)
+    app.config['PERMANENT_SESSION_LIFETIME'] = int(os.environ.get('SESSION_LIFETIME', 8 * 3600))
+    # Where session payloads live: local (shared local store), database (main database) or cookie
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND') or ('database' if database_url else 'local')
+    # Minimum seconds between expiry refreshes of an unchanged session
+    app.config['SESSION_REFRESH_INTERVAL'] = int(os.environ.get('SESSION_REFRESH_INTERVAL', 300))
+    # Seconds a logged-in user's row is served from the per-process cache (0 disables)
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+    # Seconds a teacher's classes/subjects/students are reused across requests (0 disables; see app/scope.py)
+    app.config['TEACHER_SCOPE_CACHE_TTL'] = int(os.environ.get('TEACHER_SCOPE_CACHE_TTL', 60))
+    # Seconds the forum rooms a user may read/post in are reused (0 disables; see app/membership.py)
+    app.config['ROOM_MEMBERSHIP_CACHE_TTL'] = int(os.environ.get('ROOM_MEMBERSHIP_CACHE_TTL', 60))
+    # Seconds the /admin/api/stats counts are reused between dashboard polls (0 disables)
+    app.config['ADMIN_STATS_CACHE_TTL'] = int(os.environ.get('ADMIN_STATS_CACHE_TTL', 30))
+    # Default seconds a {% cache %} template fragment is reused (0 disables; see app/fragments.py)
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+    # Login throttling (app/throttle.py): free failures per account and per IP within the window,
+    # then exponential backoff capped at LOGIN_THROTTLE_MAX_DELAY seconds
+    app.config['LOGIN_THROTTLE_ACCOUNT_ATTEMPTS'] = int(os.environ.get('LOGIN_THROTTLE_ACCOUNT_ATTEMPTS', 5))
+    app.config['LOGIN_THROTTLE_IP_ATTEMPTS'] = int(os.environ.get('LOGIN_THROTTLE_IP_ATTEMPTS', 50))
+    app.config['LOGIN_THROTTLE_WINDOW'] = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 900))
+    app.config['LOGIN_THROTTLE_MAX_DELAY'] = int(os.environ.get('LOGIN_THROTTLE_MAX_DELAY', 300))
+    # Password hashing pool (app/passwords.py): inline, thread or process
+    app.config['LOGIN_HASH_POOL'] = os.environ.get('LOGIN_HASH_POOL', 'thread')
+    app.config['LOGIN_HASH_WORKERS'] = int(os.environ.get('LOGIN_HASH_WORKERS', 2))
+    app.config['LOGIN_HASH_QUEUE'] = int(os.environ.get('LOGIN_HASH_QUEUE', 8))
+    app.config['LOGIN_HASH_TIMEOUT'] = int(os.environ.get('LOGIN_HASH_TIMEOUT', 10))
+    # Gzip dynamic responses from this many bytes up (-1 disables, e.g. when a proxy compresses)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    # Number of reverse proxies in front of the app whose X-Forwarded-For/-Proto to trust
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # Short-lived state shared by the workers on this machine (app/local_store.py): 'sqlite' or 'memory'
+    app.config['LOCAL_STORE'] = os.environ.get('LOCAL_STORE', 'sqlite')
+    app.config['LOCAL_STORE_PATH'] = os.environ.get('LOCAL_STORE_PATH') or os.path.join(app.instance_path, 'local_store.db')
+    # Forum presence (app/presence.py): seconds a member stays "active" after their last request,
+    # and the minimum seconds between heartbeat writes for the same member and room
+    app.config['PRESENCE_TTL'] = int(os.environ.get('PRESENCE_TTL', 300))
+    app.config['PRESENCE_HEARTBEAT_INTERVAL'] = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', 30))
+    # Background jobs (app/jobs.py): 'inline' runs them inside the request, 'worker' queues them
+    # in the database for `flask jobs worker` (thread or process pool)
+    app.config['JOBS_MODE'] = os.environ.get('JOBS_MODE', 'inline')
+    app.config['JOBS_WORKER_POOL'] = os.environ.get('JOBS_WORKER_POOL', 'thread')
+    app.config['JOBS_WORKER_CONCURRENCY'] = int(os.environ.get('JOBS_WORKER_CONCURRENCY', 4))
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get('JOBS_POLL_INTERVAL', 1.0))
+    # Tries per job, with the wait doubling from JOBS_RETRY_DELAY up to JOBS_RETRY_MAX_DELAY seconds
+    app.config['JOBS_MAX_ATTEMPTS'] = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+    app.config['JOBS_RETRY_DELAY'] = int(os.environ.get('JOBS_RETRY_DELAY', 10))
+    app.config['JOBS_RETRY_MAX_DELAY'] = int(os.environ.get('JOBS_RETRY_MAX_DELAY', 3600))
+    # Seconds after which a running job whose worker died is queued again
+    app.config['JOBS_LOCK_TIMEOUT'] = int(os.environ.get('JOBS_LOCK_TIMEOUT', 600))
+    # Preview images of uploads (app/previews.py): longest side in pixels and JPEG quality
+    app.config['PREVIEW_MAX_SIZE'] = int(os.environ.get('PREVIEW_MAX_SIZE', 320))
+    app.config['PREVIEW_QUALITY'] = int(os.environ.get('PREVIEW_QUALITY', 75))
+    # Estimated similarity from which two students' submissions are flagged on the review page (app/duplicates.py)
+    app.config['SIMILARITY_THRESHOLD'] = float(os.environ.get('SIMILARITY_THRESHOLD', 0.6))
+    # Notifications deleted per transaction by `flask notifications purge` (policies: app/retention.py)
+    app.config['NOTIFICATION_RETENTION_BATCH_SIZE'] = int(os.environ.get('NOTIFICATION_RETENTION_BATCH_SIZE', 500))
 
+    # SQLite tuning for multi-worker deployments (see app/database.py); ignored for other databases
+    app.config['SQLITE_PRODUCTION_MODE'] = os.environ.get('SQLITE_PRODUCTION_MODE', '1') == '1'
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+    # PostgreSQL connection handling (see app/database.py); unset pool values use the profile's
+    app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE', 'gunicorn')
+    app.config['DB_EXTERNAL_POOLER'] = os.environ.get('DB_EXTERNAL_POOLER', '0') == '1'
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    app.config['DB_CONNECT_TIMEOUT'] = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+    for key in ('DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_RECYCLE', 'DB_POOL_TIMEOUT'):
+        app.config[key] = int(os.environ[key]) if os.environ.get(key) else None
+
+    # Optional read replica for reporting views (see app/routing.py)
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+    # Overrides used by scripts and benchmarks (e.g. a throwaway database)
+    if test_config:
+        app.config.update(test_config)
+
+    from .database import configure_engine_options, configure_database
+    configure_engine_options(app)
     db.init_app(app)
+    configure_database(app)
+    app.extensions['user_cache'] = TTLCache(ttl=app.config['USER_CACHE_TTL'])
+    app.extensions['teacher_scope_cache'] = TTLCache(ttl=app.config['TEACHER_SCOPE_CACHE_TTL'])
+    app.extensions['room_membership_cache'] = TTLCache(ttl=app.config['ROOM_MEMBERSHIP_CACHE_TTL'])
+    app.extensions['admin_stats_cache'] = TTLCache(ttl=app.config['ADMIN_STATS_CACHE_TTL'])
+    from .fragments import init_fragment_cache
+    init_fragment_cache(app)
+    from .file_cleanup import init_file_cleanup
+    init_file_cleanup(app)
+    from .jobs import init_jobs
+    init_jobs(app)
+    from .previews import init_previews
+    init_previews(app)
+    from .duplicates import init_duplicates
+    init_duplicates(app)
+    from .local_store import init_local_store
+    init_local_store(app)
+    from .sessions import init_sessions
+    init_sessions(app)
+    from .passwords import init_hash_pool
+    init_hash_pool(app)
+    from .assets import init_assets
+    init_assets(app)
+    from .compression import init_compression
+    init_compression(app)
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -57,4 +164,7 @@ def create_app():
     from .forum import forum as forum_blueprint
     app.register_blueprint(forum_blueprint)
 
+    from .search import search as search_blueprint
+    app.register_blueprint(search_blueprint)
+
     return app
@@ -2,8 +2,18 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 from app import db
-from models.models import User, Task, Assignment, Submission, Notification, Class, Subject, ContactMessage, ChatRoom, ChatMessage
+from models.models import User, Task, Assignment, Submission, Notification, Class, Subject, ContactMessage, loader_profile, invalidate_cached_user
+from .routing import read_replica
+from .database import serialized_write
+from .assignments import assign_missing_students
+from .jobs import enqueue
+from .file_cleanup import remove_files_later
+from .scope import invalidate_teacher_scope, invalidate_teacher_scopes
+from .fragments import invalidate_fragments
+from .conditional import conditional_json
+from . import cascade
 from .forms import AdminUserForm, SystemConfigForm, BulkOperationForm, ClassForm, SubjectForm, AssignTeacherToSubjectForm, TaskForm
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
@@ -81,6 +91,7 @@ def edit_user(user_id):
         form.teaching_subjects.data = [s.id for s in user.selected_subjects]
 
     if form.validate_on_submit():
+        was_student = user.user_type == 'student'
         user.name = form.name.data
         user.email = form.email.data
         user.user_type = form.user_type.data
@@ -123,6 +134,11 @@ def edit_user(user_id):
             user.set_password(form.new_password.data)
 
         db.session.commit()
+        invalidate_cached_user(user.id)
+        if was_student or user.user_type == 'student':
+            invalidate_teacher_scopes()
+        else:
+            invalidate_teacher_scope(user.id)
         flash(f'User {user.name} updated successfully!')
         return redirect(url_for('admin.manage_users'))
 
@@ -137,25 +153,16 @@ def delete_user(user_id):
         flash('You cannot delete your own account.')
         return redirect(url_for('admin.manage_users'))
     
-    # Delete related data first
-    # Delete submissions for assignments belonging to this user
-    assignment_ids = [assignment.id for assignment in Assignment.query.filter_by(student_id=user.id).all()]
-    if assignment_ids:
-        Submission.query.filter(Submission.assignment_id.in_(assignment_ids)).delete(synchronize_session=False)
-    
-    Assignment.query.filter_by(student_id=user.id).delete()
-    Task.query.filter_by(created_by=user.id).delete()
-    Notification.query.filter_by(user_id=user.id).delete()
-    
-    # Delete chat messages sent by this user
-    ChatMessage.query.filter_by(user_id=user.id).delete()
-    
-    # Delete chat rooms created by this user
-    ChatRoom.query.filter_by(created_by=user.id).delete()
-    
-    db.session.delete(user)
+    name, user_type = user.name, user.user_type
+    result = cascade.delete_user(user)
     db.session.commit()
-    flash(f'User {user.name} and all related data deleted successfully!')
+    remove_files_later(result.files)
+    invalidate_cached_user(user_id)
+    if user_type == 'student':
+        invalidate_teacher_scopes()
+    else:
+        invalidate_teacher_scope(user_id)
+    flash(f'User {name} and all related data deleted successfully!')
     return redirect(url_for('admin.manage_users'))
 
 @admin.route('/user/create', methods=['GET', 'POST'])
@@ -206,6 +213,9 @@ def create_user():
         
         db.session.add(user)
         db.session.commit()
+        invalidate_cached_user(user.id)
+        if user.user_type == 'student':
+            invalidate_teacher_scopes()
         flash(f'User {user.name} created successfully!')
         return redirect(url_for('admin.manage_users'))
 
@@ -213,6 +223,7 @@ def create_user():
 
 @admin.route('/analytics')
 @login_required
+@read_replica
 def analytics():
     # User analytics
     user_stats = db.session.query(
@@ -247,7 +258,9 @@ def analytics():
 @admin.route('/tasks')
 @login_required
 def manage_tasks():
-    tasks = Task.query.join(User, Task.created_by == User.id).add_entity(User).order_by(desc(Task.created_at)).all()
+    tasks = Task.query.join(User, Task.created_by == User.id).add_entity(User).options(
+        *loader_profile('admin_tasks')
+    ).order_by(desc(Task.created_at)).all()
     current_time = datetime.utcnow()
     return render_template('admin_tasks.html', tasks=tasks, current_time=current_time)
 
@@ -256,67 +269,21 @@ def manage_tasks():
 def delete_task(task_id):
     task = Task.query.get_or_404(task_id)
     
-    # Delete related data
-    # Delete submissions for assignments belonging to this task
-    assignment_ids = [assignment.id for assignment in Assignment.query.filter_by(task_id=task.id).all()]
-    if assignment_ids:
-        Submission.query.filter(Submission.assignment_id.in_(assignment_ids)).delete(synchronize_session=False)
-    
-    Assignment.query.filter_by(task_id=task.id).delete()
-    
-    db.session.delete(task)
+    title = task.title
+    result = cascade.delete_tasks([task.id])
     db.session.commit()
-    flash(f'Task "{task.title}" and all related data deleted successfully!')
+    remove_files_later(result.files)
+    flash(f'Task "{title}" and all related data deleted successfully!')
     return redirect(url_for('admin.manage_tasks'))
 
 @admin.route('/task/<int:task_id>/reassign', methods=['POST'])
 @login_required
+@serialized_write
 def reassign_task(task_id):
-    """Reassign overdue/completed tasks to newly registered students."""
+    """Assign a task to students who joined its classes after it was handed out."""
     task = Task.query.get_or_404(task_id)
     
-    # Get already assigned student IDs
-    assigned_student_ids = [a.student_id for a in task.assignments]
-    
-    # Find students registered after the task deadline who are in the assigned classes
-    # and don't have an assignment for this task
-    new_students = Student.query.join(User).filter(
-        User.id.notin_(assigned_student_ids) if assigned_student_ids else True,
-        User.created_at > task.deadline
-    ).all()
-    
-    # Also get all students who were not assigned (registered before or after deadline)
-    all_students = Student.query.join(User).filter(
-        User.id.notin_(assigned_student_ids) if assigned_student_ids else True
-    ).all()
-    
-    # Get the classes this task was assigned to
-    assigned_classes = [c.id for c in task.assigned_classes]
-    
-    assignments_created = 0
-    
-    for student in all_students:
-        # Check if student is in any of the assigned classes
-        if student.class_id in assigned_classes:
-            # Create new assignment
-            assignment = Assignment(
-                task_id=task.id,
-                student_id=student.id,
-                status='pending',
-                priority=task.priority
-            )
-            db.session.add(assignment)
-            assignments_created += 1
-            
-            # Create notification for student
-            notification = Notification(
-                user_id=student.user_id,
-                title='New Task Assignment',
-                message=f'You have been assigned a new task: "{task.title}". Deadline: {task.deadline.strftime("%Y-%m-%d %H:%M")}',
-                notification_type='task'
-            )
-            db.session.add(notification)
-    
+    assignments_created = assign_missing_students(task)
     db.session.commit()
     
     if assignments_created > 0:
@@ -351,6 +318,7 @@ def create_notification():
 
 @admin.route('/export/users')
 @login_required
+@read_replica
 def export_users():
     """Export user data to CSV"""
     from io import StringIO
@@ -359,14 +327,14 @@ def export_users():
     writer = csv.writer(output)
     writer.writerow(['ID', 'Name', 'Email', 'User Type', 'Subject/Class', 'Created At'])
     
-    users = User.query.all()
+    users = User.query.options(joinedload(User.student_class)).all()
     for user in users:
         writer.writerow([
             user.id,
             user.name,
             user.email,
             user.user_type,
-            user.subject or user.class_name or '',
+            user.subject or (user.student_class.name if user.student_class else ''),
             user.created_at.strftime('%Y-%m-%d %H:%M:%S')
         ])
     
@@ -409,6 +377,7 @@ def create_subject():
             subject.classes.append(selected_class)
 
         db.session.commit()
+        invalidate_teacher_scopes()
         flash(f'Subject "{subject.name}" created and assigned to class "{selected_class.name}" successfully!')
         return redirect(url_for('admin.manage_subjects'))
 
@@ -436,6 +405,7 @@ def edit_subject(subject_id):
             subject.classes.append(selected_class)
 
         db.session.commit()
+        invalidate_teacher_scopes()
         flash(f'Subject "{subject.name}" updated successfully!')
         return redirect(url_for('admin.manage_subjects'))
 
@@ -451,9 +421,10 @@ def delete_subject(subject_id):
         flash('Cannot delete subject that is assigned to classes.')
         return redirect(url_for('admin.manage_subjects'))
 
-    db.session.delete(subject)
+    name = subject.name
+    cascade.delete_subject(subject)
     db.session.commit()
-    flash(f'Subject "{subject.name}" deleted successfully!')
+    flash(f'Subject "{name}" deleted successfully!')
     return redirect(url_for('admin.manage_subjects'))
 
 @admin.route('/class/create', methods=['GET', 'POST'])
@@ -485,6 +456,7 @@ def edit_class(class_id):
         class_obj.name = form.name.data
         class_obj.description = form.description.data
         db.session.commit()
+        invalidate_fragments('teacher-classes')
         flash(f'Class "{class_obj.name}" updated successfully!')
         return redirect(url_for('admin.manage_classes'))
 
@@ -500,9 +472,11 @@ def delete_class(class_id):
         flash('Cannot delete class that has students or teachers assigned.')
         return redirect(url_for('admin.manage_classes'))
 
-    db.session.delete(class_obj)
+    name = class_obj.name
+    cascade.delete_class(class_obj)
     db.session.commit()
-    flash(f'Class "{class_obj.name}" deleted successfully!')
+    invalidate_teacher_scopes()
+    flash(f'Class "{name}" deleted successfully!')
     return redirect(url_for('admin.manage_classes'))
 
 @admin.route('/task/create', methods=['GET', 'POST'])
@@ -516,7 +490,7 @@ def create_task():
     admins = User.query.filter_by(user_type='admin').all()
     
     form = TaskForm()
-    form.assigned_classes.choices = [(str(c.id), c.name) for c in classes]
+    form.assigned_classes.choices = [(c.id, c.name) for c in classes]
     form.assigned_students.choices = [(s.id, f"{s.name} ({s.student_class.name if s.student_class else 'No class'})") for s in students]
     form.assigned_teacher_id.choices = [(0, '-- No specific teacher --')] + [(t.id, t.name) for t in teachers]
     suggested_priority = None
@@ -552,61 +526,19 @@ def create_task():
             assigned_teacher_id=assigned_teacher_id
         )
         db.session.add(task)
-        db.session.commit()
 
         # Add assigned classes to the task
         if form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    task.assigned_classes.append(class_obj)
-            db.session.commit()
+            class_ids = set(form.assigned_classes.data)
+            task.assigned_classes = [c for c in classes if c.id in class_ids]
+        db.session.flush()
 
-        # Create assignments for students
-        assigned_students = []
-        
-        # First, assign to specific students if selected
+        # Assigning and notifying the selected students, or else everyone in the
+        # selected classes, runs as a background job
         if form.assigned_students.data:
-            for student_id in form.assigned_students.data:
-                student = User.query.get(int(student_id))
-                if student:
-                    existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                    if not existing:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
-        
-        # Then, assign to students in selected classes (if no specific students selected)
-        if not form.assigned_students.data and form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                        if not existing:
-                            assignment = Assignment(
-                                task_id=task.id,
-                                student_id=student.id
-                            )
-                            db.session.add(assignment)
-                            assigned_students.append(student.id)
-        
-        db.session.commit()
-
-        # Create notifications for assigned students
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notification = Notification(
-                    user_id=student_id,
-                    title="New Task Assigned",
-                    message=f"Task '{task.title}' has been assigned by {current_user.name}",
-                    notification_type='info'
-                )
-                db.session.add(notification)
+            enqueue('task_fan_out', task_id=task.id, student_ids=form.assigned_students.data)
+        elif form.assigned_classes.data:
+            enqueue('task_fan_out', task_id=task.id)
         
         # Notify the assigned teacher
         if assigned_teacher_id:
@@ -764,17 +696,25 @@ def assign_task_to_users(task_id):
 
 @admin.route('/api/stats')
 @login_required
+@read_replica
 def api_stats():
     """API endpoint for dashboard statistics"""
-    stats = {
-        'total_users': User.query.count(),
-        'total_teachers': User.query.filter_by(user_type='teacher').count(),
-        'total_students': User.query.filter_by(user_type='student').count(),
-        'total_classes': Class.query.count(),
-        'total_tasks': Task.query.count(),
-        'completed_assignments': Assignment.query.filter_by(status='completed').count()
-    }
-    return jsonify(stats)
+    # Counts across six tables have no cheap version stamp (deletes don't move max ids), so the
+    # snapshot is reused for ADMIN_STATS_CACHE_TTL seconds and its values form the ETag
+    cache = current_app.extensions['admin_stats_cache']
+    stats = cache.get('stats')
+    if stats is None:
+        stats = {
+            'total_users': User.query.count(),
+            'total_teachers': User.query.filter_by(user_type='teacher').count(),
+            'total_students': User.query.filter_by(user_type='student').count(),
+            'total_classes': Class.query.count(),
+            'total_tasks': Task.query.count(),
+            'completed_assignments': Assignment.query.filter_by(status='completed').count()
+        }
+        cache.set('stats', stats)
+    etag = 'stats-' + '-'.join(str(stats[key]) for key in sorted(stats))
+    return conditional_json(etag, lambda: stats)
 
 @admin.route('/class/<int:class_id>/subjects')
 @login_required
@@ -906,6 +846,7 @@ def assign_teacher_to_subject(class_id, subject_id):
             ))
         
         db.session.commit()
+        invalidate_teacher_scope(teacher.id)
         flash(f'Teacher "{teacher.name}" has been assigned to subject "{subject.name}" in class "{class_obj.name}".', 'success')
     else:
         flash('Error assigning teacher. Please try again.', 'danger')
@@ -932,5 +873,6 @@ def remove_teacher_from_subject(class_id, subject_id, teacher_id):
             teacher.teaching_classes.remove(class_obj)
     
     db.session.commit()
+    invalidate_teacher_scope(teacher.id)
     flash(f'Teacher "{teacher.name}" has been removed from subject "{subject.name}".', 'success')
     return redirect(url_for('admin.manage_class_subjects', class_id=class_id))
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Fingerprinted, precompressed static files.
+
+`flask assets build` copies every file in static/ to static/dist/ under a
+name that contains a hash of its content (style.css -> style.3f2a9c1b7d4e.css).
+Text files also get .gz and, if the optional `brotli` package is installed,
+.br siblings. It then writes static/dist/manifest.json. When the manifest
+exists, url_for('static', filename='style.css') points at the fingerprinted
+copy. Those URLs change whenever the file does, so they are served with a
+one-year "immutable" Cache-Control and, when the browser accepts it, from
+the precompressed sibling without compressing anything per request.
+
+Without a build (or after deleting static/dist) the original files are
+served as before. Run the build as part of each deploy.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE_SUFFIXES = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+assets_cli = AppGroup('assets', help='Build fingerprinted, precompressed static files.')
+
+
+def build_assets(static_folder):
+    """Write static/dist and its manifest; returns {original name: fingerprinted name}"""
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            original = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            stem, suffix = os.path.splitext(original)
+            fingerprinted = f'{DIST}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{suffix}'
+            target = os.path.join(static_folder, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+            if suffix.lower() in COMPRESSIBLE_SUFFIXES:
+                _write_smaller(target + '.gz', content, gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write_smaller(target + '.br', content, brotli.compress(content))
+            manifest[original] = fingerprinted
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _write_smaller(path, content, compressed):
+    # Only keep encodings that actually save bytes
+    if len(compressed) < len(content):
+        with open(path, 'wb') as f:
+            f.write(compressed)
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    manifest = load_manifest(app.static_folder)
+    app.extensions['static_manifest'] = manifest
+    app.cli.add_command(assets_cli)
+    if not manifest:
+        return
+    fingerprinted = frozenset(manifest.values())
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def static(filename):
+        if filename not in fingerprinted:
+            return app.send_static_file(filename)
+        # Pick the precompressed sibling the client accepts, if the build wrote one
+        path, encoding = filename, None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+                path, encoding = filename + suffix, candidate
+                break
+        response = send_from_directory(app.static_folder, path, mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    app.view_functions['static'] = static
+
+
+@assets_cli.command('build')
+def build_command():
+    """Fingerprint and precompress everything in the static folder"""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f'Built {len(manifest)} static files into static/{DIST}'
+               + ('' if brotli is not None else ' (gzip only; install brotli for .br files)'))
@@ -0,0 +1,208 @@
+"""
+Set-based assignment operations and the assignment status machine.
+
+These run a fixed number of statements however many students are involved:
+the rows to create are selected and inserted by the database in one
+INSERT ... SELECT instead of being built one ORM object at a time.
+
+Status changes go through transition() for one assignment or
+bulk_transition() for many. Both check the move against TRANSITIONS and
+append one AssignmentEvent per changed assignment, which is what
+task_timings() reads.
+
+task_fan_out() is the background job (app/jobs.py) through which views
+assign a new or edited task and notify its students.
+
+work_queue() pages through a student's assignments in dashboard order.
+Tasks keep their priority as a precomputed Task.priority_rank, so the order
+is a plain ORDER BY in SQL. The (student_id, task_id) index finds the
+student's assignments; the database then sorts those rows (one student's,
+not the whole table) and returns a single page.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, exists, literal, func, case
+
+from app import db
+from app.jobs import job_handler
+from models.models import Assignment, AssignmentEvent, Notification, Task, User, task_classes, loader_profile
+
+WORK_QUEUE_PAGE_SIZE = 20
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'pending': frozenset({'in_progress', 'completed', 'overdue'}),
+    'in_progress': frozenset({'completed', 'overdue'}),
+    'overdue': frozenset({'in_progress', 'completed'}),
+    'completed': frozenset(),
+}
+
+
+class InvalidTransition(ValueError):
+    """The assignment can't move from its current status to the requested one"""
+
+    def __init__(self, assignment, status):
+        super().__init__(f'Assignment {assignment.id} cannot go from {assignment.status} to {status}')
+        self.assignment = assignment
+        self.status = status
+
+
+def unassigned_students(task, student_ids=None):
+    """SELECT of the students in the task's classes (or of student_ids) who have no assignment for it"""
+    if student_ids is not None:
+        students = select(User.id).where(User.id.in_(student_ids))
+    else:
+        students = select(User.id).join(
+            task_classes, task_classes.c.class_id == User.class_id
+        ).where(task_classes.c.task_id == task.id)
+    return students.where(
+        User.user_type == 'student',
+        ~exists().where(Assignment.task_id == task.id, Assignment.student_id == User.id),
+    ).distinct()
+
+
+def assign_missing_students(task, notify=True, student_ids=None):
+    """Assign the task to every student in its classes (or in student_ids) who doesn't have it yet.
+
+    Notifies those students with one bulk insert. Returns the number of
+    assignments created; the caller commits.
+    """
+    missing = unassigned_students(task, student_ids)
+    if notify:
+        # Notify first: once the assignments exist the same SELECT matches nobody
+        Notification.bulk_create(
+            missing,
+            title='New Task Assignment',
+            message=f'You have been assigned a new task: "{task.title}". '
+                    f'Deadline: {task.deadline.strftime("%Y-%m-%d %H:%M")}',
+            notification_type='task',
+            expires_at=datetime.utcnow() + timedelta(hours=168),
+        )
+    missing = missing.subquery()
+    result = db.session.execute(Assignment.__table__.insert().from_select(
+        ['task_id', 'student_id', 'status', 'assigned_at'],
+        select(literal(task.id), missing.c.id, literal('pending'), literal(datetime.utcnow())),
+    ))
+    return result.rowcount
+
+
+@job_handler('task_fan_out')
+def task_fan_out(task_id, student_ids=None, assign=True, updated_by=None):
+    """Notify and assign the students a task reaches; views queue it with enqueue('task_fan_out', ...).
+
+    updated_by (a teacher's name) first tells the students who already have the
+    task that it was edited. assign then gives it to student_ids, or to everyone
+    in the task's classes, who doesn't have it yet.
+    """
+    task = db.session.get(Task, task_id)
+    if task is None:
+        return  # deleted before the job ran
+    if updated_by:
+        from app.notifications import notify_task_updated
+        notify_task_updated(select(Assignment.student_id).where(Assignment.task_id == task.id),
+                            task.title, updated_by)
+    if assign:
+        assign_missing_students(task, student_ids=student_ids)
+
+
+def transition(assignment, status, actor=None, at=None):
+    """Move one assignment to status and log it; the caller commits.
+
+    Returns False (and logs nothing) if it already has that status;
+    raises InvalidTransition for moves TRANSITIONS doesn't allow.
+    """
+    current = assignment.status or 'pending'
+    if current == status:
+        return False
+    if status not in TRANSITIONS[current]:
+        raise InvalidTransition(assignment, status)
+    at = at or datetime.utcnow()
+    assignment.status = status
+    if status == 'completed':
+        assignment.submitted_at = at
+    db.session.add(AssignmentEvent(assignment_id=assignment.id, status=status, created_at=at,
+                                   actor_id=actor.id if actor is not None else None))
+    return True
+
+
+def bulk_transition(status, *where, actor=None):
+    """Move every assignment matching where (and allowed to move) to status.
+
+    Two statements whatever the number of rows: one UPDATE ... RETURNING id,
+    then one bulk INSERT of events for exactly the ids it moved. A concurrent
+    sweep's UPDATE re-checks the status and skips rows already moved, so no
+    assignment is logged twice. Assignments whose current status can't move
+    to status are skipped. Returns the number moved; the caller commits.
+    """
+    allowed_from = [source for source, targets in TRANSITIONS.items() if status in targets]
+    criteria = (Assignment.status.in_(allowed_from),) + where
+    update = Assignment.__table__.update().where(*criteria).values(status=status)
+    if db.engine.dialect.update_returning:
+        moved = db.session.scalars(update.returning(Assignment.id)).all()
+    else:
+        # SQLite before 3.35: writers are serialized, so the rows read here are the ones the UPDATE moves
+        moved = db.session.scalars(select(Assignment.id).where(*criteria)).all()
+        db.session.execute(update)
+    if moved:
+        now = datetime.utcnow()
+        actor_id = actor.id if actor is not None else None
+        db.session.execute(AssignmentEvent.__table__.insert(), [
+            {'assignment_id': assignment_id, 'status': status, 'created_at': now, 'actor_id': actor_id}
+            for assignment_id in moved
+        ])
+    return len(moved)
+
+
+def mark_overdue(*where):
+    """Move pending assignments whose task deadline has passed to overdue (e.g. Assignment.student_id == 3)"""
+    past_deadline = select(Task.id).where(Task.deadline < datetime.utcnow())
+    return bulk_transition('overdue', Assignment.status == 'pending', Assignment.task_id.in_(past_deadline), *where)
+
+
+def task_timings(task_id):
+    """{assignment id: (seconds to start, seconds to submit)} from the event log, None where not reached"""
+    events = AssignmentEvent.__table__
+    first = lambda status: func.min(case((events.c.status == status, events.c.created_at)))
+    rows = db.session.execute(
+        select(Assignment.id, Assignment.assigned_at, first('in_progress'), first('completed'))
+        .join(events, events.c.assignment_id == Assignment.id)
+        .where(Assignment.task_id == task_id)
+        .group_by(Assignment.id, Assignment.assigned_at)
+    )
+    seconds = lambda start, end: (end - start).total_seconds() if start and end else None
+    return {assignment_id: (seconds(assigned_at, started), seconds(assigned_at, submitted))
+            for assignment_id, assigned_at, started, submitted in rows}
+
+
+def _queue_criteria(student_id, due_after):
+    criteria = [Assignment.student_id == student_id]
+    if due_after is not None:
+        criteria.append(Task.deadline > due_after)
+    return criteria
+
+
+def work_queue(student_id, page=1, per_page=WORK_QUEUE_PAGE_SIZE, due_after=None):
+    """One page of the student's assignments, highest priority then earliest deadline first
+
+    due_after limits the queue to tasks whose deadline is later than it.
+    """
+    return (
+        Assignment.query.join(Assignment.task)
+        .options(*loader_profile('student_dashboard'))
+        .filter(*_queue_criteria(student_id, due_after))
+        .order_by(Task.priority_rank, Task.deadline, Assignment.id)
+        .limit(per_page).offset((page - 1) * per_page)
+        .all()
+    )
+
+
+def queue_status_counts(student_id, due_after=None):
+    """{status: count} over the whole of the student's queue, in one grouped query"""
+    rows = db.session.execute(
+        select(Assignment.status, func.count())
+        .join(Task, Task.id == Assignment.task_id)
+        .where(*_queue_criteria(student_id, due_after))
+        .group_by(Assignment.status)
+    )
+    return dict(rows.all())
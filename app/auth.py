@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
 from datetime import datetime
 from app import db
-from models.models import User, Class, Task, Assignment, Notification, task_classes
+from models.models import User, Class, Task, Assignment, Notification, task_classes, invalidate_cached_user
 from .forms import LoginForm, TeacherRegistrationForm, StudentRegistrationForm
+from .scope import invalidate_teacher_scopes
+from .sessions import regenerate_session
+from .throttle import login_retry_after, record_login_failure, record_login_success
+from .passwords import verify_password, HashPoolBusy
+import click
 
 auth = Blueprint('auth', __name__)
 
@@ -15,11 +20,25 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        ip = request.remote_addr or 'unknown'
+        retry_after = login_retry_after(form.email.data, ip)
+        if retry_after:
+            flash(f'Too many failed sign-in attempts. Please try again in {retry_after} seconds.')
+            return _login_unavailable(form, 429, retry_after)
+        
         user = User.query.filter_by(email=form.email.data).first()
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and verify_password(user, form.password.data)
+        except HashPoolBusy:
+            flash('Many people are signing in right now. Please try again in a moment.')
+            return _login_unavailable(form, 503, 5)
+        if not valid:
+            record_login_failure(form.email.data, ip)
             flash('Invalid email or password')
             return redirect(url_for('auth.login'))
         
+        record_login_success(form.email.data, ip)
+        regenerate_session(session)
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         if not next_page or urlparse(next_page).netloc != '':
@@ -28,6 +47,11 @@ def login():
     
     return render_template('login.html', title='Sign In', form=form)
 
+def _login_unavailable(form, status, retry_after):
+    response = make_response(render_template('login.html', title='Sign In', form=form), status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 @auth.route('/logout')
 @login_required
 def logout():
@@ -46,6 +70,7 @@ def register_teacher():
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
+        invalidate_cached_user(user.id)
 
         flash('Congratulations, you are now a registered teacher!')
         return redirect(url_for('auth.login'))
@@ -66,6 +91,8 @@ def register_student():
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
+        invalidate_cached_user(user.id)
+        invalidate_teacher_scopes()
         
         # Auto-assign tasks to the new student based on class assignments
         student_class_id = form.class_id.data
@@ -100,4 +127,14 @@ def register_student():
         flash('Congratulations, you are now a registered student!')
         return redirect(url_for('auth.login'))
 
-    return render_template('register_student.html', title='Register as Student', form=form)
\ No newline at end of file
+    return render_template('register_student.html', title='Register as Student', form=form)
+
+
+@auth.cli.command('purge-sessions')
+def purge_sessions_command():
+    """Delete expired server-side sessions"""
+    store = current_app.extensions.get('session_store')
+    if store is None:
+        click.echo('SESSION_BACKEND=cookie: sessions live in the browser, nothing to purge')
+        return
+    click.echo(f'Expired sessions removed: {store.purge()}')
@@ -0,0 +1,86 @@
+"""
+Small in-process caches shared by the app.
+
+Each gunicorn worker keeps its own copy, so entries are short-lived and
+carry a version stamp: bumping a key's version makes every cached value for
+it stale immediately in this process, while the TTL bounds how long other
+workers can keep serving the previous value.
+"""
+
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe mapping with per-entry expiry and per-key version stamps"""
+
+    def __init__(self, ttl=30, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}   # key -> (expires_at, version, value)
+        self._versions = {}  # key -> int
+        self._generation = 0  # bumped by bump_all()
+        self._lock = threading.Lock()
+
+    def version(self, key):
+        return self._generation, self._versions.get(key, 0)
+
+    def get(self, key):
+        """Return the cached value, or None if missing, expired or stale"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, version, value = entry
+        if expires_at < time.monotonic() or version != self.version(key):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        return value
+
+    def set(self, key, value, ttl=None, version=None):
+        """Cache value under key.
+
+        Pass the version read before loading the value so that a bump racing
+        with the load leaves the entry stale instead of resurrecting old data.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if version is None:
+                version = self.version(key)
+            if len(self._entries) >= self.maxsize:
+                self._evict()
+            self._entries[key] = (time.monotonic() + ttl, version, value)
+
+    def bump(self, key):
+        """Invalidate key by moving it to a new version"""
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def bump_all(self):
+        """Invalidate every key, including values being loaded right now"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def _evict(self):
+        # Drop expired entries first; if still full, drop the oldest tenth
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _, _) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+        if len(self._entries) >= self.maxsize:
+            oldest = sorted(self._entries.items(), key=lambda item: item[1][0])
+            for key, _ in oldest[:max(1, self.maxsize // 10)]:
+                del self._entries[key]
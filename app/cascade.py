@@ -0,0 +1,130 @@
+"""
+Set-based cascade deletes for tasks, assignments, users, classes and subjects.
+
+Each function deletes a row and everything that depends on it with
+DELETE ... WHERE ... IN (SELECT ...) statements in dependency order, inside
+the caller's transaction, so the number of statements does not grow with the
+number of assignments or submissions. It returns a CascadeResult with the
+rows removed per table and the upload paths the deleted rows referenced;
+commit, then pass result.files to remove_files_later().
+"""
+
+from sqlalchemy import select, update
+
+from app import db
+from models.models import (User, Task, Assignment, AssignmentEvent, Submission, SubmissionSignature, Notification,
+                           NotificationCounter, NotificationArchive, ChatRoom, ChatMessage, Class, Subject, task_classes,
+                           teacher_classes, class_subjects, teacher_subjects, teacher_class_subjects,
+                           bump_room_versions)
+
+
+class CascadeResult:
+    """Rows deleted per table and upload files orphaned by the delete"""
+
+    def __init__(self):
+        self.deleted = {}
+        self.files = []
+
+    def delete(self, table, *where):
+        result = db.session.execute(table.delete().where(*where))
+        self.deleted[table.name] = self.deleted.get(table.name, 0) + result.rowcount
+
+    def collect_files(self, column, *where):
+        self.files.extend(path for (path,) in db.session.execute(select(column).where(*where)) if path)
+
+    @property
+    def total(self):
+        return sum(self.deleted.values())
+
+
+def _assignment_rows(*where, result):
+    """Delete the assignments matching where with their submissions, signatures and status events"""
+    assignment_ids = select(Assignment.id).where(*where)
+    result.collect_files(Submission.file_path, Submission.assignment_id.in_(assignment_ids))
+    result.delete(SubmissionSignature.__table__, SubmissionSignature.submission_id.in_(
+        select(Submission.id).where(Submission.assignment_id.in_(assignment_ids))))
+    result.delete(Submission.__table__, Submission.assignment_id.in_(assignment_ids))
+    result.delete(AssignmentEvent.__table__, AssignmentEvent.assignment_id.in_(assignment_ids))
+    result.delete(Assignment.__table__, *where)
+
+
+def _task_rows(task_ids, result):
+    """Delete tasks (ids or a SELECT of ids) with their assignments and submissions"""
+    result.collect_files(Task.file_path, Task.id.in_(task_ids))
+    _assignment_rows(Assignment.task_id.in_(task_ids), result=result)
+    result.delete(task_classes, task_classes.c.task_id.in_(task_ids))
+    result.delete(Task.__table__, Task.id.in_(task_ids))
+
+
+def _room_rows(room_ids, result):
+    result.delete(ChatMessage.__table__, ChatMessage.room_id.in_(room_ids))
+    result.delete(ChatRoom.__table__, ChatRoom.id.in_(room_ids))
+
+
+def delete_tasks(task_ids):
+    """Delete tasks by id with everything that hangs off them"""
+    result = CascadeResult()
+    _task_rows(list(task_ids), result)
+    return result
+
+
+def delete_assignments(*where):
+    """Delete the assignments matching where (e.g. students removed from a task) with their work"""
+    result = CascadeResult()
+    _assignment_rows(*where, result=result)
+    return result
+
+
+def delete_user(user):
+    """Delete a user, the tasks they created, their work, messages and memberships.
+
+    Forum rooms they created are removed with their messages, as before;
+    grading and teacher-assignment references to them are cleared.
+    """
+    result = CascadeResult()
+    uid = user.id
+
+    _task_rows(select(Task.id).where(Task.created_by == uid), result)
+
+    _assignment_rows(Assignment.student_id == uid, result=result)
+
+    db.session.execute(update(Task).where(Task.assigned_teacher_id == uid).values(assigned_teacher_id=None))
+    db.session.execute(update(Submission).where(Submission.graded_by == uid).values(graded_by=None))
+
+    result.delete(Notification.__table__, Notification.user_id == uid)
+    result.delete(NotificationCounter.__table__, NotificationCounter.user_id == uid)
+    result.delete(NotificationArchive.__table__, NotificationArchive.user_id == uid)
+
+    _room_rows(select(ChatRoom.id).where(ChatRoom.created_by == uid), result)
+    bump_room_versions(db.session, select(ChatMessage.room_id).where(ChatMessage.user_id == uid))
+    result.delete(ChatMessage.__table__, ChatMessage.user_id == uid)
+
+    result.delete(teacher_classes, teacher_classes.c.teacher_id == uid)
+    result.delete(teacher_subjects, teacher_subjects.c.teacher_id == uid)
+    result.delete(teacher_class_subjects, teacher_class_subjects.c.teacher_id == uid)
+    result.delete(User.__table__, User.id == uid)
+    return result
+
+
+def delete_class(class_obj):
+    """Delete a class with its subject links, task links and forum"""
+    result = CascadeResult()
+    cid = class_obj.id
+    result.delete(class_subjects, class_subjects.c.class_id == cid)
+    result.delete(teacher_class_subjects, teacher_class_subjects.c.class_id == cid)
+    result.delete(teacher_classes, teacher_classes.c.class_id == cid)
+    result.delete(task_classes, task_classes.c.class_id == cid)
+    _room_rows(select(ChatRoom.id).where(ChatRoom.class_id == cid), result)
+    result.delete(Class.__table__, Class.id == cid)
+    return result
+
+
+def delete_subject(subject):
+    """Delete a subject with its class and teacher links"""
+    result = CascadeResult()
+    sid = subject.id
+    result.delete(teacher_class_subjects, teacher_class_subjects.c.subject_id == sid)
+    result.delete(teacher_subjects, teacher_subjects.c.subject_id == sid)
+    result.delete(class_subjects, class_subjects.c.subject_id == sid)
+    result.delete(Subject.__table__, Subject.id == sid)
+    return result
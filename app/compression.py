@@ -0,0 +1,121 @@
+"""
+Gzip for dynamic responses.
+
+CompressionMiddleware wraps the WSGI app and gzips HTML, JSON, CSS,
+JavaScript and SVG responses when the client accepts gzip. Responses with a
+Content-Length below COMPRESS_MIN_SIZE are passed through, since compressing
+a few hundred bytes costs more CPU than it saves on the wire. Streamed
+responses (no Content-Length) are compressed chunk by chunk and flushed
+after each chunk, so the client still sees every part as soon as it is
+produced. Responses that already carry a Content-Encoding, such as the
+precompressed static files (app/assets.py), are left alone.
+"""
+
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+COMPRESSIBLE_TYPES = frozenset({
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml',
+})
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=1024, level=6):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'HEAD' or not _accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            state['compress'] = self._should_compress(status, headers)
+            if state['compress']:
+                state['streaming'] = _header(headers, 'Content-Length') is None
+                headers = _compressed_headers(headers)
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, compressing_start_response)
+        if state.get('compress') is False:
+            return app_iter
+        return self._compress(app_iter, state)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES or _header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        length = _header(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _compress(self, app_iter, state):
+        compressor = None
+        try:
+            for chunk in app_iter:
+                # start_response has run by the time the first chunk is produced
+                if not state.get('compress'):
+                    yield chunk
+                    continue
+                if compressor is None:
+                    compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                data = compressor.compress(chunk)
+                if state['streaming']:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            if compressor is not None:
+                yield compressor.flush()
+            elif state.get('compress'):
+                yield zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS).flush()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def _accepts_gzip(accept_encoding):
+    return parse_accept_header(accept_encoding)['gzip'] > 0
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressed_headers(headers):
+    result = []
+    vary = []
+    for key, value in headers:
+        lowered = key.lower()
+        if lowered == 'content-length':
+            continue
+        if lowered == 'vary':
+            vary.append(value)
+            continue
+        if lowered == 'etag' and not value.startswith('W/'):
+            # The compressed bytes differ from the identity representation
+            value = 'W/' + value
+        result.append((key, value))
+    if not any(token.strip().lower() in ('accept-encoding', '*') for value in vary for token in value.split(',')):
+        vary.append('Accept-Encoding')
+    result.append(('Vary', ', '.join(vary)))
+    result.append(('Content-Encoding', 'gzip'))
+    return result
+
+
+def init_compression(app):
+    if app.config['COMPRESS_MIN_SIZE'] < 0:
+        return
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app, min_size=app.config['COMPRESS_MIN_SIZE'], level=app.config['COMPRESS_LEVEL'],
+    )
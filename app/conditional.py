@@ -0,0 +1,26 @@
+"""
+Conditional GET for polled JSON endpoints.
+
+The navbar, forum clients and the admin dashboard poll endpoints whose
+answer rarely changes between two polls. Each endpoint derives a weak ETag
+from a version stamp that is much cheaper to read than the answer itself
+(a counter row, a room's version column, a cached snapshot) and calls
+conditional_json(). If the client's If-None-Match already matches, the
+response is an empty 304 and the query behind the body never runs.
+
+Responses are marked "private, no-cache": browsers keep them but revalidate
+on every poll, and shared caches never store them.
+"""
+
+from flask import current_app, jsonify, request
+
+
+def conditional_json(etag, build):
+    """Respond 304 if the client holds etag, else jsonify(build())"""
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
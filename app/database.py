@@ -0,0 +1,246 @@
+"""
+Database engine tuning.
+
+PostgreSQL (DATABASE_URL) gets a connection pool sized for the deployment
+profile: DB_PROFILE=gunicorn keeps a small pool per worker, DB_PROFILE=serverless
+(the default for api/index.py) keeps at most one warm connection per function
+instance. Every profile pre-pings and recycles connections and caps statements
+with DB_STATEMENT_TIMEOUT_MS. Behind an external transaction pooler
+(DB_EXTERNAL_POOLER=1, e.g. PgBouncer or a managed pooler) the app stops
+pooling itself, sets the timeout per transaction instead of as a startup
+parameter, and turns off server-side prepared statements.
+
+SQLite production mode (SQLITE_PRODUCTION_MODE, on by default) sets WAL
+journaling, synchronous=NORMAL, a busy timeout and mmap/cache pragmas on
+every connection so several gunicorn workers can share one database file.
+Transactions are started explicitly: plain BEGIN normally, BEGIN IMMEDIATE
+inside views decorated with @serialized_write, so writers queue on the busy
+timeout up front instead of failing with "database is locked" when a read
+transaction tries to upgrade to a write.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from app import db
+from app.routing import REPLICA_BIND
+
+# Set while a @serialized_write view runs; read by the engine's begin hook
+_begin_immediate = ContextVar('sqlite_begin_immediate', default=False)
+
+
+# Pool settings per deployment profile; DB_POOL_SIZE etc. override single values
+POOL_PROFILES = {
+    # Long-lived workers: a few connections each, short wait when exhausted
+    'gunicorn': {'pool_size': 5, 'max_overflow': 5, 'pool_recycle': 1800, 'pool_timeout': 10},
+    # One request at a time per instance and many instances: keep a single
+    # warm connection and recycle it before idle connections get reaped
+    'serverless': {'pool_size': 1, 'max_overflow': 0, 'pool_recycle': 300, 'pool_timeout': 5},
+}
+
+POOL_OVERRIDES = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+}
+
+
+def normalize_database_url(url):
+    """Map Heroku/Render style postgres:// URLs, and URLs without a driver, to psycopg2.
+
+    SQLAlchemy rejects postgres:// and, from 2.1, picks psycopg 3 for a bare
+    postgresql:// while requirements.txt ships psycopg2.
+    """
+    for scheme in ('postgres://', 'postgresql://'):
+        if url.startswith(scheme):
+            return 'postgresql+psycopg2://' + url[len(scheme):]
+    return url
+
+
+def is_postgres(uri):
+    return uri.startswith('postgresql')
+
+
+def postgres_engine_options(app):
+    """Engine options for PostgreSQL according to DB_PROFILE and DB_EXTERNAL_POOLER"""
+    profile = app.config['DB_PROFILE']
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {', '.join(POOL_PROFILES)}")
+    driver = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_driver_name()
+    connect_args = {'connect_timeout': app.config['DB_CONNECT_TIMEOUT']}
+
+    if app.config['DB_EXTERNAL_POOLER']:
+        # The pooler owns the connections; holding our own would pin server slots
+        options = {'poolclass': NullPool}
+        if driver == 'psycopg':
+            # psycopg 3 prepares repeated statements server-side, which breaks
+            # when consecutive transactions land on different server connections
+            connect_args['prepare_threshold'] = None
+    else:
+        options = dict(POOL_PROFILES[profile])
+        for key, option in POOL_OVERRIDES.items():
+            if app.config.get(key) is not None:
+                options[option] = app.config[key]
+        if app.config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = f"-c statement_timeout={int(app.config['DB_STATEMENT_TIMEOUT_MS'])}"
+
+    options['pool_pre_ping'] = True
+    options['connect_args'] = connect_args
+    return options
+
+
+def install_postgres_hooks(app, engine):
+    """Behind a transaction pooler startup parameters are not forwarded, so set the timeout per transaction"""
+    timeout = int(app.config['DB_STATEMENT_TIMEOUT_MS'] or 0)
+    if not (app.config['DB_EXTERNAL_POOLER'] and timeout):
+        return
+
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
+
+
+def is_file_sqlite(uri):
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:'
+
+
+def sqlite_engine_options(app):
+    """Engine options for the SQLite production mode (merged into SQLALCHEMY_ENGINE_OPTIONS)"""
+    return {
+        'connect_args': {
+            # pysqlite's own lock wait, in seconds
+            'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0,
+            # Leave transaction control to the begin hook below
+            'isolation_level': None,
+        },
+    }
+
+
+def install_sqlite_hooks(app, engine):
+    """Apply the production pragmas to every new connection and take over BEGIN"""
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}",
+        # Negative values are KiB rather than pages
+        f"PRAGMA cache_size=-{int(app.config['SQLITE_CACHE_SIZE_KB'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if _begin_immediate.get() else 'BEGIN')
+
+
+def sqlite_production_mode(app, uri):
+    return app.config['SQLITE_PRODUCTION_MODE'] and is_file_sqlite(uri)
+
+
+def engine_options_for(app, uri):
+    if is_postgres(uri):
+        return postgres_engine_options(app)
+    if sqlite_production_mode(app, uri):
+        return sqlite_engine_options(app)
+    return {}
+
+
+def install_engine_hooks(app, uri, engine):
+    if is_postgres(uri):
+        install_postgres_hooks(app, engine)
+    elif sqlite_production_mode(app, uri):
+        install_sqlite_hooks(app, engine)
+
+
+def configure_engine_options(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS (and the replica bind) before db.init_app; explicit options win"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options_for(app, uri)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    if app.config.get('DATABASE_REPLICA_URL'):
+        replica_uri = app.config['DATABASE_REPLICA_URL'] = normalize_database_url(app.config['DATABASE_REPLICA_URL'])
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = dict(engine_options_for(app, replica_uri), url=replica_uri)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def configure_database(app):
+    """Install engine hooks after db.init_app"""
+    with app.app_context():
+        install_engine_hooks(app, app.config['SQLALCHEMY_DATABASE_URI'], db.engine)
+        if REPLICA_BIND in db.engines:
+            replica = db.engines[REPLICA_BIND]
+            install_engine_hooks(app, app.config['DATABASE_REPLICA_URL'], replica)
+            if replica.dialect.name == 'sqlite':
+                # A local copy standing in for a replica must stay read-only too
+                event.listen(replica, 'connect', lambda dbapi_connection, record:
+                             dbapi_connection.execute('PRAGMA query_only=ON'))
+
+
+@contextmanager
+def write_transaction():
+    """Run a read-then-write block in its own BEGIN IMMEDIATE transaction, committed on exit.
+
+    For views that only sometimes write, so the rest of the request keeps
+    ordinary read transactions.
+    """
+    if db.session().in_transaction():
+        db.session.commit()
+    token = _begin_immediate.set(True)
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        _begin_immediate.reset(token)
+
+
+def serialized_write(view=None, methods=None):
+    """Run a view's transactions as BEGIN IMMEDIATE on SQLite.
+
+    Use on views that read and then write (dashboards that create rows,
+    submissions). methods limits it to some HTTP methods, e.g. ('POST',) for
+    a view whose GET only renders a form. Elsewhere it does nothing.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return view(*args, **kwargs)
+            # A read transaction opened earlier in the request (e.g. loading
+            # current_user) would otherwise be the one upgraded to a write
+            if db.session().in_transaction():
+                db.session.commit()
+            token = _begin_immediate.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _begin_immediate.reset(token)
+                # A view that returned without committing (access denied, invalid
+                # input) must not hold the write lock while the response and the
+                # server-side session are saved; teardown would roll back anyway
+                if db.session().in_transaction():
+                    db.session.rollback()
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
@@ -0,0 +1,134 @@
+"""
+Near-duplicate submissions.
+
+Each submission's text is its content plus the text of an uploaded .txt,
+.docx or (with PyMuPDF) .pdf file. Once a submission is committed, a
+'submission_signature' job (run_after_commit(), never inside the request)
+stores the text's MinHash signature (ml/similarity.py) in
+submission_signature. Files are parsed and signatures computed outside any
+write transaction; only storing them takes SQLite's write lock. The review
+page loads a task's signatures with one query and pairs them by LSH banding,
+so only likely matches are compared instead of all n*(n-1)/2 pairs. Pairs of
+different students whose estimated similarity reaches SIMILARITY_THRESHOLD
+are listed for the teacher to look at. Texts shorter than MIN_SHINGLES
+shingles ("done", "see attached") are left out: they match each other
+without being copies.
+
+`flask duplicates index` computes signatures that are missing, e.g. for
+submissions made before this existed; --all recomputes every one after the
+parameters in ml/similarity.py change.
+"""
+
+from datetime import datetime
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import select, exists
+
+from app import db
+from app.database import write_transaction
+from app.jobs import job_handler
+from ml.similarity import NUM_PERM, shingle_hashes, minhash_signatures, lsh_pairs, extract_text
+from models.models import Assignment, Submission, SubmissionSignature
+
+MIN_SHINGLES = 10
+INDEX_BATCH_SIZE = 200
+
+duplicates_cli = AppGroup('duplicates', help='Find near-duplicate submissions.')
+
+
+def submission_text(submission):
+    parts = [submission.content or '']
+    if submission.file_path:
+        parts.append(extract_text(submission.file_path))
+    return '\n'.join(parts)
+
+
+def index_submissions(*where, reindex=False):
+    """Store signatures for the submissions matching where (only missing ones unless reindex).
+
+    Commits: each batch is read and computed without holding a write lock,
+    then stored in its own short write transaction.
+    """
+    query = (select(Submission.id, Submission.content, Submission.file_path, Assignment.task_id)
+             .join(Assignment, Assignment.id == Submission.assignment_id).where(*where))
+    if not reindex:
+        query = query.where(~exists().where(SubmissionSignature.submission_id == Submission.id))
+    rows = db.session.execute(query).all()
+    # End the read transaction before the slow part
+    db.session.commit()
+    table = SubmissionSignature.__table__
+    stored = 0
+    for start in range(0, len(rows), INDEX_BATCH_SIZE):
+        batch = rows[start:start + INDEX_BATCH_SIZE]
+        shingle_sets = [shingle_hashes(submission_text(row)) for row in batch]
+        signatures = minhash_signatures(shingle_sets)
+        now = datetime.utcnow()
+        with write_transaction():
+            # Submissions deleted while their signatures were computed are skipped
+            ids = set(db.session.scalars(select(Submission.id).where(Submission.id.in_([row.id for row in batch]))))
+            db.session.execute(table.delete().where(table.c.submission_id.in_(ids)))
+            values = [
+                {'submission_id': row.id, 'task_id': row.task_id, 'signature': signature.astype('<u4').tobytes(),
+                 'shingle_count': len(shingles), 'computed_at': now}
+                for row, shingles, signature in zip(batch, shingle_sets, signatures) if row.id in ids
+            ]
+            if values:
+                db.session.execute(table.insert(), values)
+        stored += len(values)
+    return stored
+
+
+@job_handler('submission_signature', serialized=False)
+def submission_signature(submission_id):
+    index_submissions(Submission.id == submission_id, reindex=True)
+
+
+def near_duplicates(task_id, threshold):
+    """Pairs of students whose submissions for the task look alike, most similar first.
+
+    Each pair is {'assignments': (id, id), 'students': (id, id), 'similarity': 0..1};
+    with resubmissions, a pair of students appears once with their closest match.
+    """
+    rows = db.session.execute(
+        select(SubmissionSignature.signature, Assignment.id, Assignment.student_id)
+        .join(Submission, Submission.id == SubmissionSignature.submission_id)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .where(SubmissionSignature.task_id == task_id, SubmissionSignature.shingle_count >= MIN_SHINGLES)
+    ).all()
+    if len(rows) < 2:
+        return []
+    signatures = np.vstack([np.frombuffer(signature, dtype='<u4') for signature, _, _ in rows])
+    if signatures.shape[1] != NUM_PERM:
+        return []  # made with other parameters; `flask duplicates index --all` rebuilds them
+    pairs = {}
+    for i, j, similarity in lsh_pairs(signatures, threshold):
+        (_, assignment_a, student_a), (_, assignment_b, student_b) = rows[i], rows[j]
+        if student_a == student_b:
+            continue  # a student's own resubmissions
+        if student_a > student_b:
+            (assignment_a, student_a), (assignment_b, student_b) = (assignment_b, student_b), (assignment_a, student_a)
+        # lsh_pairs is ordered by similarity, so the first pair seen per students is their closest
+        pairs.setdefault((student_a, student_b), {
+            'assignments': (assignment_a, assignment_b),
+            'students': (student_a, student_b),
+            'similarity': similarity,
+        })
+    return list(pairs.values())
+
+
+def init_duplicates(app):
+    app.cli.add_command(duplicates_cli)
+
+
+@duplicates_cli.command('index')
+@click.option('--task-id', type=int, default=None, help='Only submissions for this task.')
+@click.option('--all', 'reindex', is_flag=True, help='Recompute signatures that already exist.')
+def index_command(task_id, reindex):
+    """Compute missing submission signatures, task by task"""
+    task_ids = [task_id] if task_id else db.session.scalars(select(Assignment.task_id).distinct()).all()
+    total = 0
+    for tid in task_ids:
+        total += index_submissions(Assignment.task_id == tid, reindex=reindex)
+    click.echo(f'Indexed {total} submissions across {len(task_ids)} tasks')
@@ -0,0 +1,102 @@
+"""
+Background removal of uploaded files whose rows were deleted.
+
+Deleting a task or user can orphan hundreds of uploads; removing them inline
+would hold the request (and a worker) on the filesystem. Callers commit
+first and then hand the paths to remove_files_later(), which queues them for
+a daemon thread in the current worker process, or with JOBS_MODE=worker
+to a durable 'remove_files' job (app/jobs.py) that survives restarts of the
+web process. A file's preview image (app/previews.py) is removed with it.
+Only files inside UPLOAD_FOLDER are ever removed.
+"""
+
+import os
+import queue
+import threading
+
+from flask import current_app
+
+from app import db
+from app.jobs import enqueue, job_handler
+from app.previews import preview_path
+
+
+class FileCleanupQueue:
+    """Queue of file paths removed by one lazily started daemon thread"""
+
+    def __init__(self, upload_folder, logger):
+        self.upload_folder = os.path.realpath(upload_folder)
+        self.logger = logger
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, paths):
+        paths = [path for path in paths if path]
+        if not paths:
+            return
+        self._ensure_worker()
+        for path in paths:
+            self._queue.put(path)
+
+    def join(self):
+        """Block until everything queued so far has been processed (scripts and benchmarks)"""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, so gunicorn workers each start their own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='file-cleanup', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self.remove(path)
+            finally:
+                self._queue.task_done()
+
+    def remove(self, path):
+        real_path = os.path.realpath(path)
+        if os.path.commonpath([real_path, self.upload_folder]) != self.upload_folder:
+            self.logger.warning('Not removing %s: outside the upload folder', path)
+            return False
+        # The file's preview image goes with it
+        self._remove(preview_path(real_path))
+        return self._remove(real_path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            self.logger.warning('Could not remove %s: %s', path, e)
+            return False
+
+
+def init_file_cleanup(app):
+    app.extensions['file_cleanup'] = FileCleanupQueue(app.config['UPLOAD_FOLDER'], app.logger)
+
+
+def remove_files_later(paths):
+    """Queue files for removal; call after the transaction that deleted their rows has committed"""
+    if current_app.config['JOBS_MODE'] != 'worker':
+        current_app.extensions['file_cleanup'].enqueue(paths)
+        return
+    paths = [path for path in paths if path]
+    if paths:
+        enqueue('remove_files', paths=paths)
+        db.session.commit()
+
+
+@job_handler('remove_files', serialized=False)
+def remove_files(paths):
+    cleanup = current_app.extensions['file_cleanup']
+    for path in paths:
+        cleanup.remove(path)
@@ -1,48 +1,43 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app import db
 from models.models import ChatRoom, ChatMessage, User, Class
-from datetime import datetime, timedelta
+from .membership import room_membership, can_read_room, can_post_room
+from .presence import record_presence, online_members
+from .conditional import conditional_json
 
 forum = Blueprint('forum', __name__)
 
 
-def get_class_members(class_id):
-    """Get all members (students and teachers) of a class with their activity status"""
-    class_obj = Class.query.get(class_id)
-    if not class_obj:
-        return [], []
-    
+def get_class_members(class_obj, online):
+    """Get all members (students and teachers) of a class, flagged with their presence"""
     # Get students in the class
-    students = User.query.filter_by(class_id=class_id, user_type='student').all()
+    students = User.query.filter_by(class_id=class_obj.id, user_type='student').all()
     
     # Get teachers teaching this class
     teachers = list(class_obj.teachers)
     
-    # Determine active status (active if logged in within last 5 minutes)
-    active_time = datetime.utcnow() - timedelta(minutes=5)
-    
-    for student in students:
-        student.is_active_forum = student.created_at >= active_time
-    
-    for teacher in teachers:
-        teacher.is_active_forum = teacher.created_at >= active_time
+    for member in students + teachers:
+        member.is_active_forum = member.id in online
     
     return students, teachers
 
 
-def get_teacher_forum_members():
-    """Get all teachers with their activity status"""
+def get_teacher_forum_members(online):
+    """Get all teachers, flagged with their presence"""
     teachers = User.query.filter_by(user_type='teacher').all()
     
-    # Determine active status
-    active_time = datetime.utcnow() - timedelta(minutes=5)
-    
     for teacher in teachers:
-        teacher.is_active_forum = teacher.created_at >= active_time
+        teacher.is_active_forum = teacher.id in online
     
     return teachers
 
+
+def active_members(online):
+    """Online members for the sidebar, from the presence store only"""
+    return sorted(online.values(), key=lambda member: member['name'].lower())
+
 # ============================================
 # STUDENT FORUM ROUTES
 # ============================================
@@ -54,25 +49,19 @@ def class_forum(class_id):
     # Get the class
     class_obj = Class.query.get_or_404(class_id)
     
-    # Check if user is a student in this class
-    if current_user.user_type == 'student':
-        if current_user.class_id != class_id:
+    # Students see their own class, teachers the classes they teach
+    if not room_membership().can_access_class(class_id):
+        if current_user.user_type == 'student':
             flash('You can only access your own class forum.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type == 'teacher':
-        # Teachers can access class forums for classes they teach
-        teacher_classes = db.session.query(Class).join(
-            'teachers'
-        ).filter(User.id == current_user.id).all()
-        if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
+        elif current_user.user_type == 'teacher':
             flash('You can only access forums for classes you teach.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type != 'admin':
-        flash('Access denied.', 'danger')
+        else:
+            flash('Access denied.', 'danger')
         return redirect(url_for('main.dashboard'))
     
     # Get or create the chat room
     room = ChatRoom.get_or_create_class_room(class_id, current_user.id)
+    record_presence(room.id, current_user)
     
     # Get messages (most recent first)
     messages = ChatMessage.query.filter_by(
@@ -82,7 +71,8 @@ def class_forum(class_id):
     messages = list(reversed(messages))
     
     # Get class members
-    students, teachers = get_class_members(class_id)
+    online = online_members(room.id)
+    students, teachers = get_class_members(class_obj, online)
     
     return render_template(
         'forum_class.html', 
@@ -90,7 +80,8 @@ def class_forum(class_id):
         room=room, 
         messages=messages,
         students=students,
-        teachers=teachers
+        teachers=teachers,
+        active_members=active_members(online)
     )
 
 
@@ -102,19 +93,14 @@ def post_class_message(class_id):
     class_obj = Class.query.get_or_404(class_id)
     
     # Check if user can post
-    if current_user.user_type == 'student':
-        if current_user.class_id != class_id:
+    if not room_membership().can_access_class(class_id):
+        if current_user.user_type == 'student':
             flash('You can only post in your own class forum.', 'danger')
             return redirect(url_for('forum.class_forum', class_id=class_id))
-    elif current_user.user_type == 'teacher':
-        teacher_classes = db.session.query(Class).join(
-            'teachers'
-        ).filter(User.id == current_user.id).all()
-        if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
+        elif current_user.user_type == 'teacher':
             flash('You can only post in forums for classes you teach.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type != 'admin':
-        flash('Access denied.', 'danger')
+        else:
+            flash('Access denied.', 'danger')
         return redirect(url_for('main.dashboard'))
     
     # Get or create the chat room
@@ -147,12 +133,13 @@ def post_class_message(class_id):
 @login_required
 def teachers_forum():
     """Teacher institution-wide forum - only teachers and admins can access"""
-    if current_user.user_type not in ['teacher', 'admin']:
+    if not room_membership().teachers_room:
         flash('Access denied. Only teachers can access this forum.', 'danger')
         return redirect(url_for('main.dashboard'))
     
     # Get or create the teacher chat room
     room = ChatRoom.get_or_create_teacher_room(current_user.id)
+    record_presence(room.id, current_user)
     
     # Get messages (most recent first)
     messages = ChatMessage.query.filter_by(
@@ -162,13 +149,15 @@ def teachers_forum():
     messages = list(reversed(messages))
     
     # Get all teachers
-    teachers = get_teacher_forum_members()
+    online = online_members(room.id)
+    teachers = get_teacher_forum_members(online)
     
     return render_template(
         'forum_teachers.html', 
         room=room, 
         messages=messages,
-        teachers=teachers
+        teachers=teachers,
+        active_members=active_members(online)
     )
 
 
@@ -176,7 +165,7 @@ def teachers_forum():
 @login_required
 def post_teacher_message():
     """Post a message to the teachers forum"""
-    if current_user.user_type not in ['teacher', 'admin']:
+    if not room_membership().teachers_room:
         flash('Access denied.', 'danger')
         return redirect(url_for('main.dashboard'))
     
@@ -286,41 +275,41 @@ def my_class_forum():
 @login_required
 def api_get_messages(room_id):
     """API endpoint to get messages for a room (for potential real-time updates)"""
+    # Check access before touching the room: this endpoint is polled
+    if not can_read_room(room_id):
+        return jsonify({'error': 'Access denied'}), 403
     room = ChatRoom.query.get_or_404(room_id)
+    record_presence(room.id, current_user)
     
-    # Check access
-    if room.room_type == 'class':
-        class_obj = room.class_group
-        if current_user.user_type == 'student':
-            if current_user.class_id != class_obj.id:
-                return jsonify({'error': 'Access denied'}), 403
-        elif current_user.user_type == 'teacher':
-            teacher_classes = db.session.query(Class).join(
-                'teachers'
-            ).filter(User.id == current_user.id).all()
-            if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
-                return jsonify({'error': 'Access denied'}), 403
-        elif current_user.user_type != 'admin':
-            return jsonify({'error': 'Access denied'}), 403
-    elif room.room_type == 'teacher':
-        if current_user.user_type not in ['teacher', 'admin']:
-            return jsonify({'error': 'Access denied'}), 403
-    
-    # Get messages
+    # The room's version moves with every posted, edited or deleted message
     last_id = request.args.get('last_id', 0, type=int)
-    messages = ChatMessage.query.filter(
-        ChatMessage.room_id == room.id,
-        ChatMessage.is_deleted == False,
-        ChatMessage.id > last_id
-    ).order_by(ChatMessage.created_at.asc()).all()
     
-    return jsonify([{
-        'id': m.id,
-        'user_id': m.user_id,
-        'user_name': m.user.name,
-        'content': m.content,
-        'created_at': m.created_at.isoformat()
-    } for m in messages])
+    def build():
+        messages = ChatMessage.query.options(joinedload(ChatMessage.user)).filter(
+            ChatMessage.room_id == room.id,
+            ChatMessage.is_deleted == False,
+            ChatMessage.id > last_id
+        ).order_by(ChatMessage.created_at.asc()).all()
+        
+        return [{
+            'id': m.id,
+            'user_id': m.user_id,
+            'user_name': m.user.name,
+            'content': m.content,
+            'created_at': m.created_at.isoformat()
+        } for m in messages]
+    
+    return conditional_json(f'{room.id}-{room.version}-{last_id}', build)
+
+
+@forum.route('/api/forum/<int:room_id>/online')
+@login_required
+def api_online_members(room_id):
+    """API endpoint listing who is active in a room right now"""
+    if not can_read_room(room_id):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify([{'user_id': user_id, **member} for user_id, member in online_members(room_id).items()])
 
 
 # ============================================
@@ -332,22 +321,8 @@ def get_room_and_verify_access(message_id):
     message = ChatMessage.query.get_or_404(message_id)
     room = message.room
     
-    if room.room_type == 'class':
-        class_obj = room.class_group
-        if current_user.user_type == 'student':
-            if current_user.class_id != class_obj.id:
-                return None, None, False
-        elif current_user.user_type == 'teacher':
-            teacher_classes = db.session.query(Class).join(
-                'teachers'
-            ).filter(User.id == current_user.id).all()
-            if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
-                return None, None, False
-        elif current_user.user_type != 'admin':
-            return None, None, False
-    elif room.room_type == 'teacher':
-        if current_user.user_type not in ['teacher', 'admin']:
-            return None, None, False
+    if not can_post_room(room.id):
+        return None, None, False
     
     # Check if user owns the message or is admin
     if message.user_id != current_user.id and current_user.user_type != 'admin':
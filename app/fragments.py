@@ -0,0 +1,69 @@
+"""
+Cached template fragments.
+
+    {% cache 'navbar', current_user.user_type %} ... {% endcache %}
+    {% cache ('teacher-classes', current_user.id, scope.version), 300 %} ... {% endcache %}
+
+The first argument is the key: a string, or a tuple whose first item names
+the fragment and whose other items are whatever the markup depends on (the
+user's role, a scope version). The optional second argument is the TTL in
+seconds, FRAGMENT_CACHE_TTL by default; 0 renders the block every time.
+Rendered markup is kept per worker in a TTLCache (app/cache.py).
+
+Keys should capture everything the fragment shows. For data that changes
+under a stable key, such as a class being renamed, call
+invalidate_fragments(name) after the commit; invalidate_fragments() with no
+names drops every fragment. Never cache markup that holds a CSRF token or
+other per-request values.
+"""
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from .cache import TTLCache
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template_name, key, ttl, caller):
+        cache = current_app.extensions['fragment_cache']
+        ttl = cache.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return caller()
+        key = key if isinstance(key, tuple) else (key,)
+        name = key[0]
+        cache_key = (template_name,) + key
+        # Stamp with the fragment name's version so invalidate_fragments(name) reaches every key under it
+        stamp = cache.version(name)
+        entry = cache.get(cache_key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        markup = caller()
+        cache.set(cache_key, (stamp, markup), ttl)
+        return markup
+
+
+def init_fragment_cache(app):
+    app.extensions['fragment_cache'] = TTLCache(ttl=app.config['FRAGMENT_CACHE_TTL'], maxsize=5000)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+
+def invalidate_fragments(*names):
+    """Drop the cached fragments with the given names (all fragments when none are given)"""
+    cache = current_app.extensions['fragment_cache']
+    if not names:
+        cache.bump_all()
+    for name in names:
+        cache.bump(name)
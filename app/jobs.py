@@ -0,0 +1,359 @@
+"""
+Background jobs stored in the app's own database.
+
+Views hand work whose cost grows with the number of students involved
+(assignment and notification fan-out, file removal) to enqueue():
+
+    enqueue('task_fan_out', task_id=task.id)
+    db.session.commit()
+
+The job row is added to the caller's session, so it is committed or rolled
+back together with the change that caused it. `flask jobs worker` claims ready
+jobs and runs them on JOBS_WORKER_CONCURRENCY threads (JOBS_WORKER_POOL=thread)
+or forked processes (process). On PostgreSQL workers pick candidates with
+SELECT ... FOR UPDATE SKIP LOCKED, so they never wait on each other's rows;
+on SQLite writers are serialized anyway. Either way the claim is an UPDATE
+that only succeeds while the job is still queued.
+
+A handler's writes and the deletion of its job commit together. A failed job
+is retried up to JOBS_MAX_ATTEMPTS times, JOBS_RETRY_DELAY seconds after the
+first failure and twice as long after each further one (capped at
+JOBS_RETRY_MAX_DELAY). After that it stays in the table as 'failed': see
+`flask jobs status`, and requeue with `flask jobs retry`. Jobs whose worker
+died while running them go back to the queue after JOBS_LOCK_TIMEOUT seconds.
+
+JOBS_MODE=inline, the default for deployments without a worker process,
+runs the handler inside enqueue() instead, in the caller's transaction.
+Work that must not hold up the request (file parsing, image rendering) goes
+through run_after_commit() instead: with JOBS_MODE=worker it is queued like
+any job, inline it runs on a daemon thread of the web process.
+Handlers are registered with @job_handler('kind'), take JSON-serialisable
+keyword arguments and do their work in db.session without committing.
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, func, case
+
+from app import db
+from app.database import write_transaction
+from models.models import Job
+
+JOB_MODES = ('inline', 'worker')
+WORKER_POOLS = ('thread', 'process')
+
+# Seconds between sweeps for jobs left running by a dead worker
+STALE_SWEEP_INTERVAL = 60
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+# kind -> handler(**payload)
+HANDLERS = {}
+# kind -> whether the handler runs in a BEGIN IMMEDIATE transaction (see job_handler)
+SERIALIZED = {}
+
+
+def job_handler(kind, serialized=True):
+    """Register the decorated function as the handler for jobs of this kind.
+
+    Handlers run in a BEGIN IMMEDIATE transaction on SQLite, like views under
+    @serialized_write, because most read and then write. Pass serialized=False
+    for handlers that only work on files, so they don't hold the write lock
+    while they do.
+    """
+    def decorator(handler):
+        HANDLERS[kind] = handler
+        SERIALIZED[kind] = serialized
+        return handler
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Queue a job in the current transaction; the caller commits.
+
+    Returns the Job, or None when JOBS_MODE=inline ran the handler right away.
+    """
+    if kind not in HANDLERS:
+        raise LookupError(f'No job handler registered for {kind!r}')
+    encoded = json.dumps(payload)
+    if current_app.config['JOBS_MODE'] == 'inline':
+        # Round-trip the payload so handlers see what a worker would
+        HANDLERS[kind](**json.loads(encoded))
+        return None
+    job = Job(kind=kind, payload=encoded, max_attempts=current_app.config['JOBS_MAX_ATTEMPTS'])
+    db.session.add(job)
+    return job
+
+
+def run_after_commit(kind, **payload):
+    """Run a job in the background; call after the transaction it depends on has committed.
+
+    With JOBS_MODE=worker the job is queued and committed for the workers,
+    otherwise it goes to this process's BackgroundJobs thread.
+    """
+    if kind not in HANDLERS:
+        raise LookupError(f'No job handler registered for {kind!r}')
+    if current_app.config['JOBS_MODE'] != 'worker':
+        current_app.extensions['background_jobs'].enqueue(kind, json.dumps(payload))
+        return
+    enqueue(kind, **payload)
+    db.session.commit()
+
+
+def run_handler(kind, payload, finish=None):
+    """Run a handler on its JSON payload in its own transaction(s) and commit; the caller handles errors.
+
+    finish() runs in the same transaction as the handler's last writes.
+    """
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        raise LookupError(f'No job handler registered for {kind!r}')
+    if SERIALIZED.get(kind, True):
+        with write_transaction():
+            handler(**json.loads(payload))
+            if finish is not None:
+                finish()
+    else:
+        # End any read transaction first; such handlers open their own short writes
+        db.session.commit()
+        handler(**json.loads(payload))
+        if finish is not None:
+            finish()
+        db.session.commit()
+
+
+class BackgroundJobs:
+    """Jobs from run_after_commit() in inline mode, run one at a time by a lazily started daemon thread.
+
+    Unlike stored jobs they are lost if the process exits first.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind, payload):
+        self._ensure_worker()
+        self._queue.put((kind, payload))
+
+    def join(self):
+        """Block until everything queued so far has run (scripts and benchmarks)"""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, so gunicorn workers each start their own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='background-jobs', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            kind, payload = self._queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        run_handler(kind, payload)
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Background job %s failed', kind)
+                    finally:
+                        db.session.remove()
+            finally:
+                self._queue.task_done()
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try of a job that has failed `attempts` times"""
+    config = current_app.config
+    return min(config['JOBS_RETRY_MAX_DELAY'], config['JOBS_RETRY_DELAY'] * 2 ** min(attempts - 1, 30))
+
+
+def claim_job(worker_id):
+    """Mark the oldest ready job as running for worker_id; returns its id, or None when there is none"""
+    now = datetime.utcnow()
+    ready = (select(Job.id).where(Job.status == 'queued', Job.run_at <= now)
+             .order_by(Job.run_at, Job.id).limit(1))
+    if db.engine.dialect.name == 'postgresql':
+        ready = ready.with_for_update(skip_locked=True)
+    with write_transaction():
+        job_id = db.session.scalar(ready)
+        if job_id is None:
+            return None
+        claimed = db.session.execute(
+            Job.__table__.update().where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', attempts=Job.attempts + 1, locked_by=worker_id, locked_at=now)
+        ).rowcount
+    return job_id if claimed else None
+
+
+def run_job(job_id):
+    """Run a claimed job; returns True if it succeeded (and was deleted)"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'running':
+        return False
+    kind, payload, attempts, max_attempts = job.kind, job.payload, job.attempts, job.max_attempts
+
+    try:
+        # The job's deletion commits with the handler's (last) writes
+        run_handler(kind, payload, finish=lambda: db.session.execute(Job.__table__.delete().where(Job.id == job_id)))
+        return True
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed on attempt %s of %s', job_id, kind, attempts, max_attempts)
+        values = {'last_error': f'{type(e).__name__}: {e}', 'locked_by': None, 'locked_at': None}
+        if attempts >= max_attempts:
+            values['status'] = 'failed'
+        else:
+            values.update(status='queued', run_at=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)))
+        with write_transaction():
+            db.session.execute(Job.__table__.update().where(Job.id == job_id).values(**values))
+        return False
+
+
+def requeue_stale_jobs():
+    """Queue jobs again that have been running longer than JOBS_LOCK_TIMEOUT (their worker died)"""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config['JOBS_LOCK_TIMEOUT'])
+    with write_transaction():
+        return db.session.execute(
+            Job.__table__.update().where(Job.status == 'running', Job.locked_at < cutoff).values(
+                # A job that keeps killing its worker must not loop forever
+                status=case((Job.attempts >= Job.max_attempts, 'failed'), else_='queued'),
+                last_error='Worker stopped while running the job',
+                locked_by=None, locked_at=None, run_at=now,
+            )
+        ).rowcount
+
+
+def work(app, worker_id, stop, poll_interval, burst=False):
+    """Claim and run jobs until stop is set, or with burst until none is ready"""
+    with app.app_context():
+        while not stop.is_set():
+            job_id = None
+            try:
+                job_id = claim_job(worker_id)
+                if job_id is not None:
+                    run_job(job_id)
+            except Exception:
+                app.logger.exception('Job worker %s could not claim or record a job', worker_id)
+            finally:
+                # A fresh session per job keeps the identity map from growing
+                db.session.remove()
+            if job_id is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+
+
+def _work_in_child(app, worker_id, stop, poll_interval, burst):
+    # The supervisor turns Ctrl+C into stop, so the job in progress finishes
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with app.app_context():
+        # Pooled connections inherited from the parent must not be shared
+        db.engine.dispose(close=False)
+    work(app, worker_id, stop, poll_interval, burst)
+
+
+def run_workers(app, concurrency, pool='thread', poll_interval=1.0, burst=False):
+    """Run `concurrency` workers on threads or forked processes until stopped (SIGINT/SIGTERM)"""
+    if pool not in WORKER_POOLS:
+        raise ValueError(f'Unknown JOBS_WORKER_POOL {pool!r} (expected thread or process)')
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    with app.app_context():
+        requeue_stale_jobs()
+        db.session.remove()
+
+    if pool == 'process':
+        # Fork so each child starts with the configured app and its registered handlers
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        workers = [context.Process(target=_work_in_child, args=(app, f'{name}:{i}', stop, poll_interval, burst),
+                                   name=f'job-worker-{i}') for i in range(concurrency)]
+    else:
+        stop = threading.Event()
+        workers = [threading.Thread(target=work, args=(app, f'{name}:{i}', stop, poll_interval, burst),
+                                    name=f'job-worker-{i}', daemon=True) for i in range(concurrency)]
+
+    previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    for worker in workers:
+        worker.start()
+    next_sweep = time.monotonic() + STALE_SWEEP_INTERVAL
+    try:
+        while any(worker.is_alive() for worker in workers):
+            try:
+                if not stop.is_set() and time.monotonic() >= next_sweep:
+                    with app.app_context():
+                        requeue_stale_jobs()
+                    next_sweep = time.monotonic() + STALE_SWEEP_INTERVAL
+                time.sleep(0.5)
+            except KeyboardInterrupt:
+                stop.set()
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+
+def init_jobs(app):
+    if app.config['JOBS_MODE'] not in JOB_MODES:
+        raise ValueError(f"Unknown JOBS_MODE {app.config['JOBS_MODE']!r} (expected inline or worker)")
+    app.extensions['background_jobs'] = BackgroundJobs(app)
+    app.cli.add_command(jobs_cli)
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', type=int, default=None, help='Jobs run at once (default JOBS_WORKER_CONCURRENCY).')
+@click.option('--pool', type=click.Choice(WORKER_POOLS), default=None, help='Run jobs on threads or processes (default JOBS_WORKER_POOL).')
+@click.option('--burst', is_flag=True, help='Exit once no job is ready instead of waiting for more.')
+def worker_command(concurrency, pool, burst):
+    """Run queued jobs until stopped; Ctrl+C or SIGTERM let running jobs finish"""
+    config = current_app.config
+    concurrency = max(concurrency or config['JOBS_WORKER_CONCURRENCY'], 1)
+    pool = pool or config['JOBS_WORKER_POOL']
+    if config['JOBS_MODE'] != 'worker':
+        click.echo('Note: JOBS_MODE is not "worker", so the web app runs new jobs itself')
+    click.echo(f'Running jobs on {concurrency} {pool} worker(s)' + (' until the queue is empty' if burst else ''))
+    run_workers(current_app._get_current_object(), concurrency, pool, config['JOBS_POLL_INTERVAL'], burst)
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Count jobs per kind and status, and show the latest failures"""
+    rows = db.session.execute(
+        select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status).order_by(Job.kind, Job.status)
+    ).all()
+    if not rows:
+        click.echo('No jobs waiting, running or failed')
+        return
+    for kind, status, count in rows:
+        click.echo(f'{kind:<24} {status:<8} {count}')
+    for job in Job.query.filter_by(status='failed').order_by(Job.id.desc()).limit(10):
+        click.echo(f'  #{job.id} {job.kind} failed after {job.attempts} attempt(s): {job.last_error}')
+
+
+@jobs_cli.command('retry')
+@click.option('--kind', default=None, help='Only retry jobs of this kind.')
+def retry_command(kind):
+    """Queue failed jobs again with a fresh set of attempts"""
+    criteria = [Job.status == 'failed']
+    if kind:
+        criteria.append(Job.kind == kind)
+    with write_transaction():
+        count = db.session.execute(
+            Job.__table__.update().where(*criteria).values(status='queued', attempts=0, run_at=datetime.utcnow())
+        ).rowcount
+    click.echo(f'Requeued {count} failed job(s)')
@@ -0,0 +1,167 @@
+"""
+Small expiring key-value store shared by the workers on one machine.
+
+Gunicorn runs several worker processes, so per-process dictionaries (see
+app/cache.py) can't hold state every worker must agree on, such as who is
+online right now or how many sign-ins just failed. LocalStore keeps such
+short-lived entries in a SQLite file next to the database
+(LOCAL_STORE_PATH), opened in WAL mode so readers never wait for writers.
+Values are JSON and every key carries an expiry; expired entries are
+invisible to reads and swept out periodically.
+
+LOCAL_STORE=memory keeps everything in the current process instead, for
+single-process setups and serverless instances where the instance folder is
+read-only.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# UPDATE/INSERT ... RETURNING arrived in SQLite 3.35; older builds (e.g. Ubuntu 20.04's 3.31) lack it
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class MemoryStore:
+    """Process-local store with the LocalStore interface"""
+
+    def __init__(self):
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key, ttl):
+        with self._lock:
+            now = time.time()
+            expires_at, value = self._entries.get(key, (0, 0))
+            if expires_at <= now:
+                expires_at, value = now + ttl, 0
+            self._entries[key] = (expires_at, value + 1)
+            return value + 1
+
+    def items(self, prefix):
+        now = time.time()
+        return [(key, value) for key, (expires_at, value) in list(self._entries.items())
+                if key.startswith(prefix) and expires_at > now]
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class SQLiteStore:
+    """Store backed by a SQLite file that every worker process opens"""
+
+    PURGE_INTERVAL = 60  # seconds between sweeps of expired rows, per process
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._last_purge = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS store ('
+            ' key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM store WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO store (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), now + ttl)
+        )
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self.purge()
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM store WHERE key = ?', (key,))
+
+    def incr(self, key, ttl):
+        """Add one to an integer counter and return it; a new or expired counter starts a fresh ttl window"""
+        now = time.time()
+        connection = self._connection()
+        if HAS_RETURNING:
+            row = connection.execute(
+                'INSERT INTO store (key, value, expires_at) VALUES (?, 1, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                ' value = CASE WHEN expires_at > ? THEN CAST(value AS INTEGER) + 1 ELSE 1 END,'
+                ' expires_at = CASE WHEN expires_at > ? THEN expires_at ELSE excluded.expires_at END '
+                'RETURNING value',
+                (key, now + ttl, now, now)
+            ).fetchone()
+            return int(row[0])
+        # Read and write in one BEGIN IMMEDIATE transaction, so concurrent workers can't both count the same value
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, expires_at FROM store WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            value, expires_at = (int(row[0]) + 1, row[1]) if row else (1, now + ttl)
+            connection.execute(
+                'INSERT OR REPLACE INTO store (key, value, expires_at) VALUES (?, ?, ?)', (key, value, expires_at)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def items(self, prefix):
+        # Range scan on the primary key: every key starting with prefix sorts in [prefix, prefix + U+FFFF)
+        rows = self._connection().execute(
+            'SELECT key, value FROM store WHERE key >= ? AND key < ? AND expires_at > ?',
+            (prefix, prefix + '\uffff', time.time())
+        )
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def purge(self):
+        self._last_purge = time.time()
+        return self._connection().execute('DELETE FROM store WHERE expires_at <= ?', (self._last_purge,)).rowcount
+
+
+def init_local_store(app):
+    if app.config['LOCAL_STORE'] == 'memory':
+        store = MemoryStore()
+    else:
+        store = SQLiteStore(app.config['LOCAL_STORE_PATH'])
+    app.extensions['local_store'] = store
+    return store
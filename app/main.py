@@ -1,12 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from models.models import Assignment, Task, User, Class, Subject, teacher_class_subjects
+from models.models import Assignment, Task, User
+from .database import write_transaction
+from .routing import read_replica
+from .scope import teacher_scope
+from .assignments import mark_overdue, work_queue, queue_status_counts, WORK_QUEUE_PAGE_SIZE
 from datetime import datetime, timedelta
+import math
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
+@read_replica
 def index():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -108,23 +114,8 @@ def dashboard():
         # Render teacher dashboard with classes and subjects
         tasks = Task.query.filter_by(created_by=current_user.id).all()
         
-        # Get teacher's classes from teacher_class_subjects table
-        teacher_classes = []
-        class_subject_mapping = db.session.query(teacher_class_subjects).filter_by(teacher_id=current_user.id).all()
-        for tc in class_subject_mapping:
-            class_obj = Class.query.get(tc.class_id)
-            if class_obj and class_obj not in teacher_classes:
-                teacher_classes.append(class_obj)
-        
-        # Also get from teaching_classes relationship (backwards compatibility)
-        for class_obj in current_user.teaching_classes:
-            if class_obj not in teacher_classes:
-                teacher_classes.append(class_obj)
-        
-        students = []
-        for class_obj in teacher_classes:
-            students.extend(class_obj.students)
-        students = list(set(students))
+        scope = teacher_scope()
+        students = scope.students()
 
         student_stats = []
         for student in students:
@@ -144,68 +135,30 @@ def dashboard():
                 'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
             })
         
-        # Get teacher's classes with subject information
-        teacher_classes_info = []
-        for class_obj in teacher_classes:
-            available_subjects = class_obj.subjects
-            teaching_subjects = []
-            for subject in available_subjects:
-                entry = db.session.query(teacher_class_subjects).filter_by(
-                    teacher_id=current_user.id, 
-                    class_id=class_obj.id, 
-                    subject_id=subject.id
-                ).first()
-                if entry:
-                    teaching_subjects.append(subject)
-            
-            selected_subject_ids = [s.id for s in current_user.selected_subjects]
-            for subject in available_subjects:
-                if subject.id in selected_subject_ids and subject not in teaching_subjects:
-                    teaching_subjects.append(subject)
-
-            teacher_classes_info.append({
-                'class': class_obj,
-                'available_subjects': available_subjects,
-                'teaching_subjects': teaching_subjects,
-                'student_count': len(class_obj.students)
-            })
-        
-        return render_template('teacher_dashboard.html', tasks=tasks, student_stats=student_stats, teacher_classes_info=teacher_classes_info)
+        # The template asks the scope for class summaries only when its cached fragment is stale
+        return render_template('teacher_dashboard.html', tasks=tasks, student_stats=student_stats, scope=scope)
     
     if current_user.user_type == 'student':
         # Check for overdue assignments and update status
-        overdue_assignments = Assignment.query.filter_by(
+        overdue_query = Assignment.query.filter_by(
             student_id=current_user.id,
             status='pending'
-        ).join(Assignment.task).filter(
-            Assignment.task.has(datetime.utcnow() > Task.deadline)
-        ).all()
+        ).join(Assignment.task).filter(Task.deadline < datetime.utcnow())
 
-        if overdue_assignments:
-            for assignment in overdue_assignments:
-                assignment.status = 'overdue'
-            db.session.commit()
-            flash(f'You have {len(overdue_assignments)} overdue assignment(s)!', 'warning')
+        if overdue_query.first() is not None:
+            # The bulk transition logs only the rows its UPDATE moved, so concurrent workers can't move or log a row twice
+            with write_transaction():
+                overdue_count = mark_overdue(Assignment.student_id == current_user.id)
+            if overdue_count:
+                flash(f'You have {overdue_count} overdue assignment(s)!', 'warning')
         
-        # Render student dashboard
-        assignments = Assignment.query.filter_by(student_id=current_user.id).all()
-        # Filter out assignments with deleted tasks
-        assignments = [a for a in assignments if a.task is not None]
-        # Sort by priority and deadline
-        priority_order = {
-            'urgent_important': 1,
-            'important_not_urgent': 2,
-            'urgent_not_important': 3,
-            'high_priority': 4,
-            'medium_priority': 5,
-            'low_priority': 6,
-            'long_term': 7,
-            'group_task': 8,
-            'optional': 9,
-            'not_important_not_urgent': 10
-        }
-        assignments.sort(key=lambda x: (priority_order.get(x.task.priority, 99), x.task.deadline))
-        return render_template('student_dashboard.html', assignments=assignments)
+        # Render one page of the student's queue, ordered and paged by the database
+        page = max(request.args.get('page', 1, type=int), 1)
+        status_counts = queue_status_counts(current_user.id)
+        pages = max(math.ceil(sum(status_counts.values()) / WORK_QUEUE_PAGE_SIZE), 1)
+        assignments = work_queue(current_user.id, page) if status_counts else []
+        return render_template('student_dashboard.html', assignments=assignments,
+                               status_counts=status_counts, page=page, pages=pages)
     
     if current_user.user_type == 'admin':
         return redirect(url_for('admin.dashboard'))
@@ -0,0 +1,125 @@
+"""
+Forum room membership: which rooms a user may read and post in.
+
+Every forum page and the message polling endpoint authorize the current user
+against a RoomMembership, a set of room and class ids resolved once and cached
+per user (ROOM_MEMBERSHIP_CACHE_TTL), so an access check is a set lookup.
+
+- Admins may use every room.
+- Teachers may use the teachers' room and the rooms of the classes in their TeacherScope.
+- Students may use their own class's room.
+
+Memberships are invalidated together with teacher scopes (see app/scope.py).
+Rooms are created on first visit, so a membership remembers the highest room
+id that existed when it was built; a check against a newer room reloads it
+once instead of denying access, in every worker, without an invalidation.
+"""
+
+from flask import current_app, g
+from flask_login import current_user
+from sqlalchemy import select, func, or_
+
+from app import db
+from models.models import ChatRoom
+from .scope import teacher_scope
+
+
+class RoomMembership:
+    """Room and class ids a user may read and post in"""
+
+    def __init__(self, user_id, is_admin=False, room_ids=(), class_ids=(), teachers_room=False, max_room_id=0):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.room_ids = frozenset(room_ids)
+        self.class_ids = frozenset(class_ids)
+        self.teachers_room = teachers_room
+        self.max_room_id = max_room_id
+
+    @classmethod
+    def load(cls, user):
+        if user.user_type == 'admin':
+            return cls(user.id, is_admin=True, teachers_room=True)
+
+        max_room_id = db.session.scalar(select(func.max(ChatRoom.id))) or 0
+        if user.user_type == 'teacher':
+            class_ids = teacher_scope(user).class_ids
+            rooms = or_(ChatRoom.room_type == 'teacher',
+                        (ChatRoom.room_type == 'class') & ChatRoom.class_id.in_(class_ids))
+            teachers_room = True
+        elif user.user_type == 'student' and user.class_id:
+            class_ids = (user.class_id,)
+            rooms = (ChatRoom.room_type == 'class') & (ChatRoom.class_id == user.class_id)
+            teachers_room = False
+        else:
+            return cls(user.id, max_room_id=max_room_id)
+
+        room_ids = db.session.scalars(select(ChatRoom.id).where(rooms)).all()
+        return cls(user.id, room_ids=room_ids, class_ids=class_ids, teachers_room=teachers_room,
+                   max_room_id=max_room_id)
+
+    def can_read(self, room_id):
+        return self.is_admin or room_id in self.room_ids
+
+    def can_post(self, room_id):
+        # Anyone who can read a room may post in it
+        return self.can_read(room_id)
+
+    def can_access_class(self, class_id):
+        """Whether the user may use the forum of class_id (its room may not exist yet)"""
+        return self.is_admin or class_id in self.class_ids
+
+    def is_stale_for(self, room_id):
+        return not self.is_admin and room_id > self.max_room_id
+
+
+def room_membership(user=None):
+    """RoomMembership for user (default: the current user), cached per user"""
+    user = user or current_user
+    memo = g.setdefault('room_memberships', {})
+    membership = memo.get(user.id)
+    if membership is None:
+        cache = current_app.extensions['room_membership_cache']
+        membership = cache.get(user.id) if cache.ttl else None
+        if membership is None:
+            membership = _load(cache, user)
+        memo[user.id] = membership
+    return membership
+
+
+def can_read_room(room_id, user=None):
+    return _check(room_id, user, RoomMembership.can_read)
+
+
+def can_post_room(room_id, user=None):
+    return _check(room_id, user, RoomMembership.can_post)
+
+
+def _check(room_id, user, allowed):
+    membership = room_membership(user)
+    if not allowed(membership, room_id) and membership.is_stale_for(room_id):
+        # The room is newer than the cached membership: rebuild it once
+        user = user or current_user
+        cache = current_app.extensions['room_membership_cache']
+        cache.delete(user.id)
+        membership = _load(cache, user)
+        g.room_memberships[user.id] = membership
+    return allowed(membership, room_id)
+
+
+def _load(cache, user):
+    version = cache.version(user.id)
+    membership = RoomMembership.load(user)
+    cache.set(user.id, membership, version=version)
+    return membership
+
+
+def invalidate_room_membership(user_id):
+    """Call after changing which rooms one user may use"""
+    current_app.extensions['room_membership_cache'].bump(int(user_id))
+    g.pop('room_memberships', None)
+
+
+def invalidate_room_memberships():
+    """Call after changing class membership in bulk"""
+    current_app.extensions['room_membership_cache'].bump_all()
+    g.pop('room_memberships', None)
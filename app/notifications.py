@@ -1,8 +1,12 @@
 from flask import Blueprint, render_template, jsonify, request
+from sqlalchemy import select, func
 from flask_login import login_required, current_user
-from models.models import Notification
+from models.models import Notification, NotificationCounter
 from app import db
+from app.retention import purge_notifications
+from app.conditional import conditional_json
 from datetime import datetime, timedelta
+import click
 
 notifications = Blueprint('notifications', __name__)
 
@@ -11,33 +15,49 @@ notifications = Blueprint('notifications', __name__)
 def get_notifications():
     """API endpoint to get user notifications"""
     limit = request.args.get('limit', 10, type=int)
-    include_read = request.args.get('include_read', False, type=bool)
-    
-    query = Notification.query.filter_by(user_id=current_user.id)
-    
-    # Filter out expired notifications
-    query = query.filter(
-        (Notification.expires_at.is_(None)) | 
-        (Notification.expires_at > datetime.utcnow())
-    )
-    
-    if not include_read:
-        query = query.filter_by(is_read=False)
-    
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
-    
-    return jsonify({
-        'notifications': [{
-            'id': n.id,
-            'title': n.title,
-            'message': n.message,
-            'type': n.notification_type,
-            'is_read': n.is_read,
-            'created_at': n.created_at.isoformat(),
-            'expires_at': n.expires_at.isoformat() if n.expires_at else None,
-            'is_expired': n.is_expired()
-        } for n in notifications]
-    })
+    include_read = request.args.get('include_read', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Unread notifications only change together with the user's counter version, so that
+    # primary-key lookup answers repeat polls; read ones need a (cheaper) aggregate as stamp
+    _, version = NotificationCounter.unread_for(current_user.id)
+    etag = f'{current_user.id}-{version}-{limit}'
+    if include_read:
+        etag += '-{}-{}'.format(*db.session.execute(
+            select(func.count(Notification.id), func.max(Notification.id))
+            .where(Notification.user_id == current_user.id, _not_expired())
+        ).one())
+    
+    def build():
+        query = Notification.query.filter_by(user_id=current_user.id).filter(_not_expired())
+        if not include_read:
+            query = query.filter_by(is_read=False)
+        
+        notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+        
+        return {
+            'notifications': [{
+                'id': n.id,
+                'title': n.title,
+                'message': n.message,
+                'type': n.notification_type,
+                'is_read': n.is_read,
+                'created_at': n.created_at.isoformat(),
+                'expires_at': n.expires_at.isoformat() if n.expires_at else None,
+                'is_expired': n.is_expired()
+            } for n in notifications]
+        }
+    
+    return conditional_json(etag, build)
+
+def _not_expired():
+    return (Notification.expires_at.is_(None)) | (Notification.expires_at > datetime.utcnow())
+
+@notifications.route('/api/notifications/unread-count')
+@login_required
+def unread_count():
+    """Unread notification count for the navbar badge, served from the per-user counter"""
+    count, version = NotificationCounter.unread_for(current_user.id)
+    return conditional_json(f'{current_user.id}-{version}', lambda: {'unread_count': count})
 
 @notifications.route('/api/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
@@ -63,6 +83,7 @@ def mark_all_read():
     Notification.query.filter_by(user_id=current_user.id, is_read=False).update({
         'is_read': True
     })
+    NotificationCounter.reset(current_user.id)
     db.session.commit()
     
     return jsonify({'success': True})
@@ -77,14 +98,7 @@ def notification_center():
         (Notification.expires_at > datetime.utcnow())
     ).order_by(Notification.created_at.desc()).all()
     
-    # Count unread notifications
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).filter(
-        (Notification.expires_at.is_(None)) | 
-        (Notification.expires_at > datetime.utcnow())
-    ).count()
+    unread_count, _ = NotificationCounter.unread_for(current_user.id)
     
     return render_template('notification_center.html', 
                          notifications=notifications, 
@@ -112,6 +126,24 @@ def create_notification():
         'notification_id': notification.id
     })
 
+@notifications.cli.command('purge')
+@click.option('--batch-size', type=int, help='Rows deleted per transaction')
+@click.option('--dry-run', is_flag=True, help='Only count the notifications that would be reclaimed')
+def purge_command(batch_size, dry_run):
+    """Delete or archive expired and old read notifications"""
+    report = purge_notifications(batch_size=batch_size, dry_run=dry_run)
+    verb = 'would reclaim' if dry_run else 'reclaimed'
+    for name, stats in report['policies'].items():
+        line = f"{name:<10} {stats['action']:<8} {verb} {stats['deleted']}"
+        if stats['archived']:
+            line += f" ({stats['archived']} archived)"
+        if not dry_run:
+            line += f" in {stats['batches']} batches"
+        click.echo(line)
+    click.echo(f"Total {verb}: {report['total']}")
+    if not dry_run:
+        click.echo(f"Unread counters refreshed: {report['counters_refreshed']}")
+
 # Helper functions for common notification scenarios
 def notify_task_assigned(student_id, task_title, teacher_name):
     """Notify student when task is assigned"""
@@ -166,19 +198,14 @@ def send_system_announcement(title, message, target_users='all'):
     )
 
 def notify_task_updated(student_ids, task_title, teacher_name):
-    """Notify students when task is updated"""
-    notifications = []
-    for student_id in student_ids:
-        notification = Notification.create_notification(
-            user_id=student_id,
-            title="Task Updated",
-            message=f"Task '{task_title}' has been updated by {teacher_name}",
-            notification_type='info',
-            expires_in_hours=72  # 3 days
-        )
-        notifications.append(notification)
-    
-    return notifications
+    """Notify students (ids or a SELECT of ids) when task is updated; the caller commits"""
+    return Notification.bulk_create(
+        student_ids,
+        title="Task Updated",
+        message=f"Task '{task_title}' has been updated by {teacher_name}",
+        notification_type='info',
+        expires_at=datetime.utcnow() + timedelta(hours=72)  # 3 days
+    )
 
 def notify_feedback_received(student_id, task_title, score):
     """Notify student when teacher provides feedback"""
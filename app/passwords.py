@@ -0,0 +1,73 @@
+"""
+Password verification off the request thread.
+
+check_password_hash runs a deliberately slow key derivation. HashPool runs
+it on a small per-process pool (LOGIN_HASH_POOL=thread, or process) so that
+with threaded workers a login spike can use at most LOGIN_HASH_WORKERS cores
+per worker while other requests keep being served. At most
+LOGIN_HASH_QUEUE further logins wait for a slot. Beyond that, or after
+LOGIN_HASH_TIMEOUT seconds, verify() raises HashPoolBusy, and the login view
+answers 503 with Retry-After instead of piling up requests.
+LOGIN_HASH_POOL=inline hashes on the request thread as before.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+
+class HashPoolBusy(Exception):
+    """Too many password checks are already running or queued"""
+
+
+class HashPool:
+    def __init__(self, mode='thread', workers=2, max_waiting=8, timeout=10):
+        if mode not in ('inline', 'thread', 'process'):
+            raise ValueError(f'Unknown LOGIN_HASH_POOL {mode!r} (expected inline, thread or process)')
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_waiting)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def verify(self, pwhash, password):
+        if self.mode == 'inline':
+            return check_password_hash(pwhash, password)
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            return self._get_executor().submit(check_password_hash, pwhash, password).result(self.timeout)
+        except FutureTimeout:
+            raise HashPoolBusy()
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        # Pools don't survive a fork, so each gunicorn worker creates its own on first use
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+            return self._executor
+
+
+def init_hash_pool(app):
+    app.extensions['hash_pool'] = HashPool(
+        mode=app.config['LOGIN_HASH_POOL'],
+        workers=app.config['LOGIN_HASH_WORKERS'],
+        max_waiting=app.config['LOGIN_HASH_QUEUE'],
+        timeout=app.config['LOGIN_HASH_TIMEOUT'],
+    )
+
+
+def verify_password(user, password):
+    """user.check_password(password) on the hash pool; raises HashPoolBusy when saturated"""
+    return current_app.extensions['hash_pool'].verify(user.password_hash, password)
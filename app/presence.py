@@ -0,0 +1,48 @@
+"""
+Who is online in each forum room.
+
+Forum page views and message polls record a heartbeat for (room, user) in
+the shared LocalStore (app/local_store.py). A heartbeat expires after
+PRESENCE_TTL seconds, so "online in room R" is the set of unexpired
+heartbeats under the room's prefix. Entries carry the member's name and role,
+so the sidebar is built without loading User rows.
+
+A worker skips rewriting a heartbeat it stored less than
+PRESENCE_HEARTBEAT_INTERVAL seconds ago, so a page that polls often costs
+one write per interval, not one per request.
+"""
+
+import threading
+import time
+
+from flask import current_app
+
+_recent = {}  # (room_id, user_id) -> time this worker last stored the heartbeat
+_recent_lock = threading.Lock()
+
+
+def _key(room_id, user_id=None):
+    return f'presence:{room_id}:' if user_id is None else f'presence:{room_id}:{user_id}'
+
+
+def record_presence(room_id, user):
+    """Mark user as active in room_id now"""
+    now = time.monotonic()
+    marker = (room_id, user.id)
+    if now - _recent.get(marker, float('-inf')) < current_app.config['PRESENCE_HEARTBEAT_INTERVAL']:
+        return
+    current_app.extensions['local_store'].set(
+        _key(room_id, user.id), {'name': user.name, 'role': user.user_type},
+        current_app.config['PRESENCE_TTL'],
+    )
+    with _recent_lock:
+        if len(_recent) > 10000:
+            _recent.clear()
+        _recent[marker] = now
+
+
+def online_members(room_id):
+    """{user_id: {'name', 'role'}} of everyone with a live heartbeat in room_id"""
+    prefix = _key(room_id)
+    return {int(key[len(prefix):]): member
+            for key, member in current_app.extensions['local_store'].items(prefix)}
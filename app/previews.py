@@ -0,0 +1,151 @@
+"""
+Preview images for uploaded files.
+
+Reviewing a page of submissions used to mean downloading every screenshot
+and PDF in full. Once an upload has been committed, a 'generate_preview' job
+queued with run_after_commit() (app/jobs.py), never run inside the request,
+writes a small JPEG next to the file (<upload>.preview.jpg): the image
+scaled to fit PREVIEW_MAX_SIZE pixels, or the first page of a PDF rendered
+at that size. Review pages show it through send_preview(), which serves it
+with a one-year private, immutable Cache-Control. An upload's path never
+changes, so neither does its preview.
+
+Images need Pillow and PDFs additionally PyMuPDF (both in requirements.txt);
+on an install without them no previews are made and the pages show download
+links only. `flask previews build` creates previews for files uploaded
+before this existed (or after installing the packages).
+"""
+
+import os
+
+import click
+from flask import abort, current_app, send_file
+from flask.cli import AppGroup
+
+from app.jobs import job_handler
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: no previews
+    Image = None
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF before 1.24
+    except ImportError:  # optional: no PDF previews
+        fitz = None
+
+PREVIEW_SUFFIX = '.preview.jpg'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+PDF_SUFFIXES = ('.pdf',)
+PREVIEW_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+previews_cli = AppGroup('previews', help='Create preview images for uploaded files.')
+
+
+def preview_path(path):
+    return path + PREVIEW_SUFFIX
+
+
+def can_preview(path):
+    """Whether a preview can be made for path with the packages installed"""
+    if not path or Image is None or path.endswith(PREVIEW_SUFFIX):
+        return False
+    suffix = os.path.splitext(path)[1].lower()
+    return suffix in IMAGE_SUFFIXES or (suffix in PDF_SUFFIXES and fitz is not None)
+
+
+def has_preview(path):
+    return bool(path) and os.path.exists(preview_path(path))
+
+
+def generate_preview(path, max_size, quality):
+    """Write path's preview and return its path; None if the file can't be previewed"""
+    if not can_preview(path) or not os.path.exists(path):
+        return None
+    try:
+        if path.lower().endswith(PDF_SUFFIXES):
+            image = _render_first_page(path, max_size)
+        else:
+            image = _load_image(path, max_size)
+        if image is None:
+            return None
+        image.thumbnail((max_size, max_size))
+        target = preview_path(path)
+        # Write beside the target and rename, so a preview is never served half-written
+        image.save(target + '.tmp', 'JPEG', quality=quality, optimize=True)
+        os.replace(target + '.tmp', target)
+        return target
+    except Exception as e:
+        # Corrupt or unsupported content: retrying won't help, the page keeps its download link
+        current_app.logger.warning('Could not create a preview for %s: %s', path, e)
+        return None
+
+
+def _load_image(path, max_size):
+    image = Image.open(path)
+    # JPEGs can be decoded at a fraction of their size, far cheaper than decoding in full
+    image.draft('RGB', (max_size, max_size))
+    return _flatten(ImageOps.exif_transpose(image))
+
+
+def _render_first_page(path, max_size):
+    with fitz.open(path) as document:
+        if document.page_count == 0:
+            return None
+        page = document[0]
+        zoom = max_size / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _flatten(image):
+    # JPEG has no alpha: put transparent images on white rather than black
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+@job_handler('generate_preview', serialized=False)
+def generate_preview_job(path):
+    upload_folder = os.path.realpath(current_app.config['UPLOAD_FOLDER'])
+    if os.path.commonpath([os.path.realpath(path), upload_folder]) != upload_folder:
+        current_app.logger.warning('Not previewing %s: outside the upload folder', path)
+        return
+    generate_preview(path, current_app.config['PREVIEW_MAX_SIZE'], current_app.config['PREVIEW_QUALITY'])
+
+
+def send_preview(path):
+    """Serve path's preview with a long private cache lifetime; 404 until it exists"""
+    if not has_preview(path):
+        abort(404)
+    response = send_file(preview_path(path), mimetype='image/jpeg')
+    response.headers['Cache-Control'] = PREVIEW_CACHE_CONTROL
+    return response
+
+
+def init_previews(app):
+    app.jinja_env.globals['has_preview'] = has_preview
+    app.cli.add_command(previews_cli)
+
+
+@previews_cli.command('build')
+@click.option('--force', is_flag=True, help='Recreate previews that already exist.')
+def build_command(force):
+    """Create missing previews for everything in the upload folder"""
+    if Image is None:
+        raise click.ClickException('Install Pillow (and PyMuPDF for PDFs) to create previews')
+    config = current_app.config
+    created = 0
+    for name in sorted(os.listdir(config['UPLOAD_FOLDER'])):
+        path = os.path.join(config['UPLOAD_FOLDER'], name)
+        if not os.path.isfile(path) or not can_preview(path) or (has_preview(path) and not force):
+            continue
+        if generate_preview(path, config['PREVIEW_MAX_SIZE'], config['PREVIEW_QUALITY']):
+            created += 1
+    click.echo(f'Created {created} previews' + ('' if fitz is not None else ' (images only; install PyMuPDF for PDFs)'))
@@ -0,0 +1,132 @@
+"""
+Notification retention.
+
+Expired notifications and read notifications past their retention window are
+deleted (or moved to notification_archive) in bounded batches, each committed
+separately so a purge never holds the SQLite write lock for long. Policies are
+per notification_type; the 'default' policy covers every type without one of
+its own. Override them with the NOTIFICATION_RETENTION config dict, e.g.
+
+    NOTIFICATION_RETENTION = {'error': {'action': 'archive', 'read_after_days': 90}}
+
+Run it from cron with `flask --app run notifications purge`.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, and_, or_, literal
+
+from app import db
+from models.models import Notification, NotificationArchive, NotificationCounter
+
+# action: 'delete' or 'archive'
+# expired_grace_days: keep expired notifications this long after expiry
+# read_after_days: drop read notifications this long after creation (None keeps them)
+DEFAULT_POLICIES = {
+    'default': {'action': 'delete', 'expired_grace_days': 0, 'read_after_days': 30},
+    'warning': {'action': 'delete', 'expired_grace_days': 0, 'read_after_days': 14},
+    'error': {'action': 'archive', 'expired_grace_days': 7, 'read_after_days': 90},
+}
+
+DEFAULT_BATCH_SIZE = 500
+
+# notification column -> notification_archive column
+ARCHIVED_COLUMNS = {
+    'id': 'notification_id', 'user_id': 'user_id', 'title': 'title', 'message': 'message',
+    'notification_type': 'notification_type', 'is_read': 'is_read', 'created_at': 'created_at',
+    'expires_at': 'expires_at',
+}
+
+
+def retention_policies():
+    """Default policies merged with the app's NOTIFICATION_RETENTION overrides"""
+    policies = {name: dict(policy) for name, policy in DEFAULT_POLICIES.items()}
+    for name, override in current_app.config.get('NOTIFICATION_RETENTION', {}).items():
+        policies[name] = dict(policies.get(name, policies['default']), **override)
+    for name, policy in policies.items():
+        if policy['action'] not in ('delete', 'archive'):
+            raise ValueError(f"Unknown retention action {policy['action']!r} for notification type {name!r}")
+    return policies
+
+
+def _eligible(policy, now):
+    """WHERE clause matching notifications this policy reclaims"""
+    conditions = [Notification.expires_at <= now - timedelta(days=policy['expired_grace_days'])]
+    if policy.get('read_after_days') is not None:
+        conditions.append(and_(
+            Notification.is_read == True,
+            Notification.created_at <= now - timedelta(days=policy['read_after_days']),
+        ))
+    return or_(*conditions)
+
+
+def purge_notifications(batch_size=None, dry_run=False, now=None):
+    """Apply the retention policies and return a report of reclaimed rows per type.
+
+    Report: {'policies': {type: {'action', 'deleted', 'archived', 'batches'}},
+             'counters_refreshed': n, 'total': n}
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config.get('NOTIFICATION_RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    policies = retention_policies()
+    named_types = [name for name in policies if name != 'default']
+
+    report = {'policies': {}, 'counters_refreshed': 0, 'total': 0}
+    for name, policy in policies.items():
+        if name == 'default':
+            of_type = Notification.notification_type.notin_(named_types) if named_types else literal(True)
+        else:
+            of_type = Notification.notification_type == name
+        where = and_(of_type, _eligible(policy, now))
+        stats = {'action': policy['action'], 'deleted': 0, 'archived': 0, 'batches': 0}
+
+        if dry_run:
+            stats['deleted'] = db.session.query(Notification.id).filter(where).count()
+        else:
+            while True:
+                ids = [row.id for row in db.session.execute(
+                    select(Notification.id).where(where).order_by(Notification.id).limit(batch_size)
+                )]
+                if not ids:
+                    break
+                if policy['action'] == 'archive':
+                    db.session.execute(NotificationArchive.__table__.insert().from_select(
+                        list(ARCHIVED_COLUMNS.values()),
+                        select(*[Notification.__table__.c[column] for column in ARCHIVED_COLUMNS])
+                        .where(Notification.id.in_(ids))
+                    ))
+                    stats['archived'] += len(ids)
+                db.session.execute(Notification.__table__.delete().where(Notification.id.in_(ids)))
+                db.session.commit()
+                stats['deleted'] += len(ids)
+                stats['batches'] += 1
+                if len(ids) < batch_size:
+                    break
+
+        report['policies'][name] = stats
+        report['total'] += stats['deleted']
+
+    if not dry_run:
+        report['counters_refreshed'] = refresh_expired_counters(batch_size, now)
+    return report
+
+
+def refresh_expired_counters(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Recount unread counters that include notifications which have since expired"""
+    now = now or datetime.utcnow()
+    refreshed = 0
+    while True:
+        user_ids = [row.user_id for row in db.session.execute(
+            select(NotificationCounter.user_id)
+            .where(NotificationCounter.next_expiry_at <= now)
+            .limit(batch_size)
+        )]
+        if not user_ids:
+            break
+        NotificationCounter.recount(user_ids)
+        db.session.commit()
+        refreshed += len(user_ids)
+        if len(user_ids) < batch_size:
+            break
+    return refreshed
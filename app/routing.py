@@ -0,0 +1,84 @@
+"""
+Read/write routing between the primary database and a read replica.
+
+With DATABASE_REPLICA_URL set, views decorated with @read_replica (and jobs
+running inside replica_reads()) send their SELECTs to the replica bind;
+flushes and INSERT/UPDATE/DELETE statements always go to the primary. After
+a request commits a write, that browser reads from the primary for
+REPLICA_STICKY_SECONDS so users see their own changes despite replica lag.
+Without a replica everything runs on the primary as before.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+STICKY_SESSION_KEY = '_primary_until'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends replica-routed reads to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_configured():
+    return REPLICA_BIND in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _pinned_to_primary():
+    return has_request_context() and flask_session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+@contextmanager
+def replica_reads():
+    """Route reads in this block to the replica, unless this user just wrote something"""
+    token = _use_replica.set(replica_configured() and not _pinned_to_primary())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_replica(view):
+    """Serve a read-only view from the replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_writer_to_primary(session):
+    if session.info.pop('wrote', False) and has_request_context() and replica_configured():
+        flask_session[STICKY_SESSION_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_rolled_back_writes(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,156 @@
+"""
+What a teacher can see: their classes, the subjects in them and their students.
+
+A teacher's classes come from two places (teacher_class_subjects and the
+older teacher_classes link) and the subjects they teach in a class from
+teacher_class_subjects or their selected subjects. TeacherScope resolves all
+of that with three queries and keeps only ids, so it can be cached per
+teacher across requests (TEACHER_SCOPE_CACHE_TTL) and every teacher page and
+permission check reuses the same answer.
+
+Call invalidate_teacher_scope(teacher_id) after changing a teacher's class or
+subject mappings, and invalidate_teacher_scopes() after changing a class's
+students or subjects. Both also invalidate the forum room memberships built
+on top of the scope (app/membership.py). TeacherScope.version keys the
+cached "My Classes" dashboard fragment (app/fragments.py).
+"""
+
+from flask import current_app, g
+from flask_login import current_user
+from sqlalchemy import select, union, exists, or_
+from sqlalchemy.orm import joinedload
+
+from app import db
+from .fragments import invalidate_fragments
+from models.models import User, Class, Subject, teacher_classes, teacher_subjects, class_subjects, teacher_class_subjects
+
+
+class TeacherScope:
+    """Ids of a teacher's classes, their subjects and students"""
+
+    def __init__(self, teacher_id, class_ids, subject_ids, teaching_subject_ids, student_ids):
+        self.teacher_id = teacher_id
+        self.class_ids = tuple(class_ids)
+        self.subject_ids = subject_ids                    # class id -> subject ids offered in the class
+        self.teaching_subject_ids = teaching_subject_ids  # class id -> subject ids this teacher teaches there
+        self.student_ids = student_ids                    # class id -> student ids
+        # Changes whenever any of the ids do; keys the cached dashboard fragments
+        self.version = hash((self.class_ids, tuple(sorted(subject_ids.items())),
+                             tuple(sorted(teaching_subject_ids.items())), tuple(sorted(student_ids.items()))))
+        self._class_id_set = frozenset(self.class_ids)
+        self._student_id_set = frozenset(sid for ids in student_ids.values() for sid in ids)
+
+    @classmethod
+    def load(cls, teacher_id):
+        tcs = teacher_class_subjects
+        linked = union(
+            select(tcs.c.class_id).where(tcs.c.teacher_id == teacher_id),
+            select(teacher_classes.c.class_id).where(teacher_classes.c.teacher_id == teacher_id),
+        ).subquery()
+        class_ids = db.session.scalars(
+            select(Class.id).where(Class.id.in_(select(linked.c.class_id))).order_by(Class.id)
+        ).all()
+
+        subject_ids = {class_id: [] for class_id in class_ids}
+        teaching_subject_ids = {class_id: [] for class_id in class_ids}
+        student_ids = {class_id: [] for class_id in class_ids}
+        if class_ids:
+            teaches = or_(
+                exists().where(tcs.c.teacher_id == teacher_id,
+                               tcs.c.class_id == class_subjects.c.class_id,
+                               tcs.c.subject_id == class_subjects.c.subject_id),
+                exists().where(teacher_subjects.c.teacher_id == teacher_id,
+                               teacher_subjects.c.subject_id == class_subjects.c.subject_id),
+            )
+            rows = db.session.execute(
+                select(class_subjects.c.class_id, class_subjects.c.subject_id, teaches)
+                .where(class_subjects.c.class_id.in_(class_ids))
+                .order_by(class_subjects.c.class_id, class_subjects.c.subject_id)
+            )
+            for class_id, subject_id, teaching in rows:
+                subject_ids[class_id].append(subject_id)
+                if teaching:
+                    teaching_subject_ids[class_id].append(subject_id)
+
+            rows = db.session.execute(
+                select(User.id, User.class_id)
+                .where(User.class_id.in_(class_ids), User.user_type == 'student')
+                .order_by(User.id)
+            )
+            for student_id, class_id in rows:
+                student_ids[class_id].append(student_id)
+
+        freeze = lambda mapping: {key: tuple(ids) for key, ids in mapping.items()}
+        return cls(teacher_id, class_ids, freeze(subject_ids), freeze(teaching_subject_ids), freeze(student_ids))
+
+    def teaches_class(self, class_id):
+        return class_id in self._class_id_set
+
+    def teaches_student(self, student_id):
+        return student_id in self._student_id_set
+
+    @property
+    def all_student_ids(self):
+        return self._student_id_set
+
+    def classes(self, *options):
+        """The teacher's Class rows in scope order, loaded with one query"""
+        if not self.class_ids:
+            return []
+        by_id = {c.id: c for c in Class.query.options(*options).filter(Class.id.in_(self.class_ids))}
+        return [by_id[class_id] for class_id in self.class_ids if class_id in by_id]
+
+    def students(self, *options):
+        """The students in the teacher's classes, with their class loaded"""
+        if not self._student_id_set:
+            return []
+        return User.query.options(joinedload(User.student_class), *options).filter(
+            User.id.in_(self._student_id_set)
+        ).order_by(User.name).all()
+
+    def class_summaries(self):
+        """Per-class subjects and student counts for the teacher dashboards"""
+        classes = self.classes()
+        wanted = {sid for ids in self.subject_ids.values() for sid in ids}
+        subjects = {s.id: s for s in Subject.query.filter(Subject.id.in_(wanted))} if wanted else {}
+        return [{
+            'class': class_obj,
+            'available_subjects': [subjects[sid] for sid in self.subject_ids[class_obj.id] if sid in subjects],
+            'teaching_subjects': [subjects[sid] for sid in self.teaching_subject_ids[class_obj.id] if sid in subjects],
+            'student_count': len(self.student_ids[class_obj.id]),
+        } for class_obj in classes]
+
+
+def teacher_scope(user=None):
+    """TeacherScope for user (default: the current user), cached per teacher"""
+    teacher_id = (user or current_user).id
+    memo = g.setdefault('teacher_scopes', {})
+    scope = memo.get(teacher_id)
+    if scope is not None:
+        return scope
+
+    cache = current_app.extensions['teacher_scope_cache']
+    scope = cache.get(teacher_id) if cache.ttl else None
+    if scope is None:
+        version = cache.version(teacher_id)
+        scope = TeacherScope.load(teacher_id)
+        cache.set(teacher_id, scope, version=version)
+    memo[teacher_id] = scope
+    return scope
+
+
+def invalidate_teacher_scope(teacher_id):
+    """Call after changing one teacher's class or subject mappings"""
+    current_app.extensions['teacher_scope_cache'].bump(int(teacher_id))
+    g.pop('teacher_scopes', None)
+    from .membership import invalidate_room_membership
+    invalidate_room_membership(teacher_id)
+
+
+def invalidate_teacher_scopes():
+    """Call after changing which students or subjects a class has, or renaming a subject"""
+    current_app.extensions['teacher_scope_cache'].bump_all()
+    g.pop('teacher_scopes', None)
+    invalidate_fragments('teacher-classes')
+    from .membership import invalidate_room_memberships
+    invalidate_room_memberships()
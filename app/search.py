@@ -0,0 +1,314 @@
+"""
+Full-text search over tasks, submissions and forum messages.
+
+SQLite databases get FTS5 external-content tables kept in sync by triggers;
+PostgreSQL gets stored tsvector columns with GIN indexes. Both are installed
+by db.create_all() and can be rebuilt with `flask search rebuild`. Results
+are permission-filtered in SQL, ranked (bm25 / ts_rank_cd) and paginated.
+"""
+
+import math
+import re
+
+import click
+from flask import Blueprint, render_template, request, jsonify, url_for, current_app
+from flask_login import login_required, current_user
+from markupsafe import Markup, escape
+from sqlalchemy import event, select, func, literal_column, and_, or_, true, table, column
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from models.models import Task, Assignment, Submission, ChatMessage, ChatRoom, User
+from .routing import read_replica
+from .scope import teacher_scope
+
+search = Blueprint('search', __name__)
+
+PER_PAGE = 20
+
+# Highlight markers placed by snippet()/ts_headline(); replaced after HTML-escaping
+MARK_START, MARK_END = '\x02', '\x03'
+
+# Indexed tables: (table, text columns, bm25 weights / tsvector weights)
+INDEXES = {
+    'tasks': ('task', ('title', 'description', 'instructions'), (10.0, 4.0, 1.0)),
+    'submissions': ('submission', ('content',), (1.0,)),
+    'messages': ('chat_message', ('content',), (1.0,)),
+}
+
+TYPE_LABELS = {'tasks': 'Tasks', 'submissions': 'Submissions', 'messages': 'Forum messages'}
+
+TSVECTOR_WEIGHTS = 'ABCD'
+
+
+# ---------------------------------------------------------------------------
+# Index installation
+# ---------------------------------------------------------------------------
+
+def _sqlite_ddl(name, columns):
+    fts = f'{name}_fts'
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{name}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def _postgres_ddl(name, columns):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({col}, '')), '{TSVECTOR_WEIGHTS[i]}')"
+        for i, col in enumerate(columns)
+    )
+    return [
+        f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_search_vector ON {name} USING GIN (search_vector)",
+    ]
+
+
+def install_search_index(connection):
+    """Create the search tables/columns and sync triggers that don't exist yet"""
+    dialect = connection.dialect.name
+    for name, columns, _ in INDEXES.values():
+        if dialect == 'sqlite':
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{name}_fts',)
+            ).first()
+            statements = _sqlite_ddl(name, columns)
+            if exists:
+                statements = statements[1:]
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            if not exists:
+                # Index rows written before search existed
+                connection.exec_driver_sql(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')")
+        elif dialect == 'postgresql':
+            for statement in _postgres_ddl(name, columns):
+                connection.exec_driver_sql(statement)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_after_create(target, connection, **kw):
+    try:
+        install_search_index(connection)
+    except OperationalError as e:
+        # A SQLite build without FTS5: the rest of the app works without search
+        if 'fts5' not in str(e):
+            raise
+        current_app.logger.warning('Full-text search disabled: %s', e)
+
+
+def rebuild_search_index(connection):
+    """Re-index every row (after restoring a backup or bulk edits with triggers disabled)"""
+    install_search_index(connection)
+    for name, _, _ in INDEXES.values():
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')")
+            connection.exec_driver_sql(f"INSERT INTO {name}_fts({name}_fts) VALUES ('optimize')")
+        elif connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(f'REINDEX INDEX ix_{name}_search_vector')
+
+
+@search.cli.command('rebuild')
+def rebuild_command():
+    """Create (if needed) and rebuild the full-text search index"""
+    with db.engine.begin() as connection:
+        rebuild_search_index(connection)
+    click.echo('Search index rebuilt for: ' + ', '.join(name for name, _, _ in INDEXES.values()))
+
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+def sqlite_match_query(q):
+    """Turn user input into an FTS5 query: every word must match, the last one as a prefix.
+
+    Words are quoted so FTS5 operators and column filters in the input are
+    treated as plain text.
+    """
+    words = re.findall(r'\w+', q)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _text_search(kind, q):
+    """(match clause, rank ordered best-first, snippet, join onto the FTS table or None) for an index"""
+    name, columns, weights = INDEXES[kind]
+    if db.engine.dialect.name == 'postgresql':
+        query = func.websearch_to_tsquery('english', q)
+        vector = literal_column(f'{name}.search_vector')
+        document = func.concat_ws(' ', *[literal_column(f'{name}.{col}') for col in columns])
+        snippet = func.ts_headline('english', document, query,
+                                   f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=12')
+        return vector.op('@@')(query), func.ts_rank_cd(vector, query).desc(), snippet, None
+
+    match = sqlite_match_query(q)
+    if match is None:
+        return None
+    fts = literal_column(f'{name}_fts')
+    weight_args = ', '.join(str(weight) for weight in weights)
+    rank = literal_column(f'bm25({name}_fts, {weight_args})')
+    snippet = func.snippet(fts, -1, MARK_START, MARK_END, '…', 16)
+    fts_table = table(f'{name}_fts', column('rowid'))
+    join = (fts_table, fts_table.c.rowid == literal_column(f'{name}.id'))
+    return fts.op('MATCH')(match), rank, snippet, join
+
+
+def _visible(kind, user):
+    """Permission filter: what this user may see of each result type"""
+    if user.user_type == 'admin':
+        return true()
+    if kind == 'tasks':
+        if user.user_type == 'teacher':
+            return or_(Task.created_by == user.id, Task.assigned_teacher_id == user.id)
+        return Task.id.in_(select(Assignment.task_id).where(Assignment.student_id == user.id))
+    if kind == 'submissions':
+        if user.user_type == 'teacher':
+            return or_(Task.created_by == user.id, Task.assigned_teacher_id == user.id)
+        return Assignment.student_id == user.id
+    if user.user_type == 'teacher':
+        # The same rooms RoomMembership lets the teacher read
+        return or_(
+            ChatRoom.room_type == 'teacher',
+            and_(ChatRoom.room_type == 'class', ChatRoom.class_id.in_(teacher_scope(user).class_ids)),
+        )
+    return and_(ChatRoom.room_type == 'class', ChatRoom.class_id == user.class_id)
+
+
+def _base_select(kind, user, columns):
+    if kind == 'tasks':
+        stmt = select(*columns).select_from(Task)
+    elif kind == 'submissions':
+        stmt = (select(*columns).select_from(Submission)
+                .join(Assignment, Assignment.id == Submission.assignment_id)
+                .join(Task, Task.id == Assignment.task_id)
+                .join(User, User.id == Assignment.student_id))
+    else:
+        stmt = (select(*columns).select_from(ChatMessage)
+                .join(ChatRoom, ChatRoom.id == ChatMessage.room_id)
+                .join(User, User.id == ChatMessage.user_id)
+                .where(ChatMessage.is_deleted == False, ChatRoom.is_active == True))
+    return stmt.where(_visible(kind, user))
+
+
+def _result_columns(kind, user):
+    if kind == 'tasks':
+        columns = [Task.id, Task.title, Task.deadline]
+        if user.user_type == 'student':
+            columns.append(select(Assignment.id).where(
+                Assignment.task_id == Task.id, Assignment.student_id == user.id
+            ).limit(1).scalar_subquery().label('assignment_id'))
+        return columns
+    if kind == 'submissions':
+        return [Submission.id, Submission.assignment_id, Submission.submitted_at, Task.title, User.name]
+    return [ChatMessage.id, ChatMessage.created_at, ChatRoom.id.label('room_id'), ChatRoom.name.label('room_name'),
+            ChatRoom.room_type, ChatRoom.class_id, User.name]
+
+
+def _apply_search(stmt, parts):
+    where, _, _, join = parts
+    if join is not None:
+        stmt = stmt.join(*join)
+    return stmt.where(where)
+
+
+def count_results(kind, q, user):
+    parts = _text_search(kind, q)
+    if parts is None:
+        return 0
+    stmt = _apply_search(_base_select(kind, user, [func.count()]), parts)
+    return db.session.execute(stmt).scalar()
+
+
+def find_results(kind, q, user, page=1, per_page=PER_PAGE):
+    """Ranked page of results for one type as a list of dicts"""
+    parts = _text_search(kind, q)
+    if parts is None:
+        return []
+    _, rank, snippet, _ = parts
+    stmt = _apply_search(_base_select(kind, user, _result_columns(kind, user) + [snippet.label('snippet')]), parts)
+    stmt = stmt.order_by(rank).limit(per_page).offset((page - 1) * per_page)
+    return [_present(kind, row, user) for row in db.session.execute(stmt)]
+
+
+def _highlight(snippet):
+    return Markup(str(escape(snippet or '')).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def _present(kind, row, user):
+    if kind == 'tasks':
+        if user.user_type == 'student':
+            url = url_for('student.view_task', assignment_id=row.assignment_id) if row.assignment_id else None
+        elif user.user_type == 'teacher':
+            url = url_for('teacher.task_progress', task_id=row.id)
+        else:
+            url = url_for('admin.assign_task_to_users', task_id=row.id)
+        return {'type': kind, 'id': row.id, 'title': row.title, 'url': url,
+                'meta': f"Due {row.deadline.strftime('%Y-%m-%d %H:%M')}", 'snippet': _highlight(row.snippet)}
+    if kind == 'submissions':
+        if user.user_type == 'student':
+            url = url_for('student.view_task', assignment_id=row.assignment_id)
+        else:
+            url = url_for('teacher.view_submission', assignment_id=row.assignment_id)
+        return {'type': kind, 'id': row.id, 'title': f'{row.name} — {row.title}', 'url': url,
+                'meta': f"Submitted {row.submitted_at.strftime('%Y-%m-%d %H:%M')}" if row.submitted_at else '',
+                'snippet': _highlight(row.snippet)}
+    if user.user_type == 'admin':
+        url = url_for('forum.admin_view_forum', room_id=row.room_id)
+    elif row.room_type == 'teacher':
+        url = url_for('forum.teachers_forum')
+    else:
+        url = url_for('forum.class_forum', class_id=row.class_id)
+    return {'type': kind, 'id': row.id, 'title': f'{row.name} in {row.room_name}', 'url': url,
+            'meta': row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else '',
+            'snippet': _highlight(row.snippet)}
+
+
+def _search_request():
+    q = request.args.get('q', '').strip()
+    kind = request.args.get('type')
+    page = max(request.args.get('page', 1, type=int), 1)
+    counts = {k: count_results(k, q, current_user) for k in INDEXES} if q else {k: 0 for k in INDEXES}
+    if kind not in INDEXES:
+        # Open the first tab that has hits
+        kind = next((k for k in INDEXES if counts[k]), 'tasks')
+    results = find_results(kind, q, current_user, page) if counts[kind] else []
+    pages = max(math.ceil(counts[kind] / PER_PAGE), 1)
+    return q, kind, page, pages, counts, results
+
+
+@search.route('/search')
+@login_required
+@read_replica
+def search_page():
+    q, kind, page, pages, counts, results = _search_request()
+    return render_template('search.html', q=q, kind=kind, page=page, pages=pages, counts=counts,
+                           results=results, type_labels=TYPE_LABELS)
+
+
+@search.route('/api/search')
+@login_required
+@read_replica
+def api_search():
+    q, kind, page, pages, counts, results = _search_request()
+    return jsonify({
+        'query': q,
+        'type': kind,
+        'page': page,
+        'pages': pages,
+        'counts': counts,
+        'results': [dict(result, snippet=str(result['snippet'])) for result in results],
+    })
@@ -0,0 +1,205 @@
+"""
+Server-side sessions.
+
+With Flask's default signed-cookie sessions every flash message, the
+Flask-Login identifiers and the CSRF token travel in the Cookie header of
+every request. Here the cookie only carries a random 32-character session id.
+The payload lives in a store chosen by SESSION_BACKEND:
+
+- local: the shared LocalStore (app/local_store.py). This is the default
+  without DATABASE_URL.
+- database: the server_session table in the main database. This is the
+  default with DATABASE_URL, so every instance sees the same sessions.
+- cookie: Flask's signed cookies, as before.
+
+Expiry slides: PERMANENT_SESSION_LIFETIME is the idle timeout, and an active
+session is pushed forward at most once per SESSION_REFRESH_INTERVAL, so
+unchanged sessions are not rewritten on every request. Expired sessions are
+swept by the stores as they write and by `flask auth purge-sessions`.
+"""
+
+import re
+import secrets
+import time
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import select, update, delete
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+
+_SID = re.compile(r'^[A-Za-z0-9_-]{32}$')
+
+
+def new_session_id():
+    return secrets.token_urlsafe(24)
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and when its stored copy expires"""
+
+    def __init__(self, initial=None, sid=None, expires_at=0.0):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.new = sid is None
+        self.sid = sid or new_session_id()
+        self.expires_at = expires_at
+        self.previous_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """Move the session to a new id, e.g. on login, so a planted id is worthless"""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = new_session_id()
+        self.modified = True
+
+
+class LocalSessionStore:
+    """Sessions in the LocalStore shared by this machine's workers"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, sid):
+        entry = self.store.get(f'session:{sid}')
+        return (entry['data'], entry['expires_at']) if entry else None
+
+    def save(self, sid, data, lifetime):
+        expires_at = time.time() + lifetime
+        self.store.set(f'session:{sid}', {'data': data, 'expires_at': expires_at}, lifetime)
+        return expires_at
+
+    def delete(self, sid):
+        self.store.delete(f'session:{sid}')
+
+    def purge(self):
+        return self.store.purge()
+
+
+class DatabaseSessionStore:
+    """Sessions in the server_session table, on their own short transactions"""
+
+    PURGE_INTERVAL = 300  # seconds between opportunistic sweeps, per process
+
+    def __init__(self, batch_size=1000):
+        from models.models import ServerSession
+        self.table = ServerSession.__table__
+        self.batch_size = batch_size
+        self._last_purge = time.time()
+
+    def load(self, sid):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.id == sid, self.table.c.expires_at > datetime.utcnow())
+            ).first()
+        if row is None:
+            return None
+        return row.data, time.time() + (row.expires_at - datetime.utcnow()).total_seconds()
+
+    def save(self, sid, data, lifetime):
+        expires_at = datetime.utcnow() + timedelta(seconds=lifetime)
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                update(self.table).where(self.table.c.id == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(self.table.insert().values(id=sid, data=data, expires_at=expires_at))
+        if time.time() - self._last_purge > self.PURGE_INTERVAL:
+            self.purge(max_batches=1)
+        return time.time() + lifetime
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def purge(self, max_batches=None):
+        """Delete expired sessions in batches of batch_size; returns how many were removed"""
+        self._last_purge = time.time()
+        removed = batches = 0
+        while max_batches is None or batches < max_batches:
+            with db.engine.begin() as connection:
+                expired = select(self.table.c.id).where(
+                    self.table.c.expires_at <= datetime.utcnow()
+                ).limit(self.batch_size)
+                ids = connection.execute(expired).scalars().all()
+                if ids:
+                    connection.execute(delete(self.table).where(self.table.c.id.in_(ids)))
+            removed += len(ids)
+            batches += 1
+            if len(ids) < self.batch_size:
+                break
+        return removed
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID.match(sid):
+            stored = self.store.load(sid)
+            if stored is not None:
+                data, expires_at = stored
+                try:
+                    return StoredSession(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+                except ValueError:
+                    pass
+        return StoredSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        response.vary.add('Cookie')
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        refresh_due = session.expires_at - time.time() < lifetime - app.config['SESSION_REFRESH_INTERVAL']
+        if not (session.modified or refresh_due):
+            return
+        session.expires_at = self.store.save(session.sid, self.serializer.dumps(dict(session)), lifetime)
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app):
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        return None
+    if backend == 'database':
+        store = DatabaseSessionStore()
+    elif backend == 'local':
+        store = LocalSessionStore(app.extensions['local_store'])
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend!r} (expected local, database or cookie)')
+    app.session_interface = ServerSessionInterface(store)
+    app.extensions['session_store'] = store
+    return store
+
+
+def regenerate_session(session):
+    """Give the session a new id if it is server-side (no-op with cookie sessions)"""
+    if isinstance(session, StoredSession):
+        session.regenerate()
@@ -2,10 +2,17 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from models.models import Assignment, Submission, Task, Class, User
+from .database import serialized_write, write_transaction
 from .forms import SubmissionForm
+from .jobs import run_after_commit
+from .previews import can_preview
+from .assignments import transition, mark_overdue, InvalidTransition, work_queue, queue_status_counts, WORK_QUEUE_PAGE_SIZE
+import math
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from sqlalchemy import select
+import click
 
 student = Blueprint('student', __name__)
 
@@ -27,24 +34,28 @@ def dashboard():
         ).all()
         
         # Create assignments for tasks that don't have one for this student
-        new_assignments = []
-        for task in class_tasks:
-            existing_assignment = Assignment.query.filter_by(
-                task_id=task.id,
+        class_task_ids = [task.id for task in class_tasks]
+        
+        def unassigned_task_ids():
+            assigned_task_ids = {task_id for (task_id,) in db.session.query(Assignment.task_id).filter_by(
                 student_id=current_user.id
-            ).first()
-            
-            if not existing_assignment:
-                # Create new assignment for this student
-                assignment = Assignment(
-                    task_id=task.id,
-                    student_id=current_user.id,
-                    status='pending'
-                )
-                db.session.add(assignment)
-                new_assignments.append(task)
+            )}
+            return [task_id for task_id in class_task_ids if task_id not in assigned_task_ids]
         
-        db.session.commit()
+        new_assignments = []
+        if unassigned_task_ids():
+            # Re-check under the write lock: another worker may be serving this student too
+            with write_transaction():
+                for task_id in unassigned_task_ids():
+                    # Create new assignment for this student
+                    assignment = Assignment(
+                        task_id=task_id,
+                        student_id=current_user.id,
+                        status='pending'
+                    )
+                    db.session.add(assignment)
+                    new_assignments.append(task_id)
+            new_assignments = [task for task in class_tasks if task.id in new_assignments]
         
         # Create notifications for new assignments
         from app.notifications import notify_task_assigned
@@ -53,36 +64,12 @@ def dashboard():
             teacher_name = creator.name if creator else 'Your teacher'
             notify_task_assigned(current_user.id, task.title, teacher_name)
     
-    # Get all assignments for the student
-    assignments = Assignment.query.filter_by(student_id=current_user.id).all()
-    
-    # Filter out assignments where the task has passed deadline
-    valid_assignments = []
-    current_time = datetime.utcnow()
-    for assignment in assignments:
-        if assignment.task and assignment.task.deadline > current_time:
-            valid_assignments.append(assignment)
-        elif not assignment.task:
-            # Task was deleted, remove the assignment
-            db.session.delete(assignment)
-    
-    db.session.commit()
-    
-    # Sort by priority and deadline
-    priority_order = {
-        'urgent_important': 1,
-        'important_not_urgent': 2,
-        'urgent_not_important': 3,
-        'high_priority': 4,
-        'medium_priority': 5,
-        'low_priority': 6,
-        'long_term': 7,
-        'group_task': 8,
-        'optional': 9,
-        'not_important_not_urgent': 10
-    }
-    
-    valid_assignments.sort(key=lambda x: (priority_order.get(x.task.priority, 99), x.task.deadline))
+    # Only tasks still open; the database orders and pages the queue
+    page = max(request.args.get('page', 1, type=int), 1)
+    now = datetime.utcnow()
+    status_counts = queue_status_counts(current_user.id, due_after=now)
+    pages = max(math.ceil(sum(status_counts.values()) / WORK_QUEUE_PAGE_SIZE), 1)
+    assignments = work_queue(current_user.id, page, due_after=now) if status_counts else []
     
     # Get count of students in the same class
     class_students_count = 0
@@ -90,7 +77,10 @@ def dashboard():
         class_students_count = User.query.filter_by(class_id=student_class.id).count()
     
     return render_template('student_dashboard.html', 
-                           assignments=valid_assignments,
+                           assignments=assignments,
+                           status_counts=status_counts,
+                           page=page,
+                           pages=pages,
                            class_students_count=class_students_count)
 
 @student.route('/task/<int:assignment_id>')
@@ -108,6 +98,7 @@ def view_task(assignment_id):
 
 @student.route('/start_task/<int:assignment_id>')
 @login_required
+@serialized_write
 def start_task(assignment_id):
     if current_user.user_type != 'student':
         return redirect(url_for('main.dashboard'))
@@ -117,13 +108,18 @@ def start_task(assignment_id):
         flash('Access denied')
         return redirect(url_for('student.dashboard'))
     
-    assignment.status = 'in_progress'
+    try:
+        transition(assignment, 'in_progress', actor=current_user)
+    except InvalidTransition:
+        flash('This task has already been submitted.')
+        return redirect(url_for('student.view_task', assignment_id=assignment_id))
     db.session.commit()
     flash('Task started!')
     return redirect(url_for('student.view_task', assignment_id=assignment_id))
 
 @student.route('/submit_task/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
+@serialized_write(methods=('POST',))
 def submit_task(assignment_id):
     if current_user.user_type != 'student':
         return redirect(url_for('main.dashboard'))
@@ -148,12 +144,20 @@ def submit_task(assignment_id):
         submission = Submission(
             assignment_id=assignment.id,
             content=form.content.data,
-            file_path=file_path
+            file_path=file_path,
+            submitted_at=datetime.utcnow()
         )
         db.session.add(submission)
-        assignment.status = 'completed'
-        assignment.submitted_at = submission.submitted_at
+        if not transition(assignment, 'completed', actor=current_user, at=submission.submitted_at):
+            # Resubmission: the assignment stays completed, as of the latest submission
+            assignment.submitted_at = submission.submitted_at
         db.session.commit()
+        # Signature for near-duplicate detection on the review page
+        run_after_commit('submission_signature', submission_id=submission.id)
+        if can_preview(file_path):
+            # Reviewers see a thumbnail instead of downloading the whole file; it's
+            # rendered off the request, after the write lock has been released
+            run_after_commit('generate_preview', path=file_path)
         flash('Task submitted successfully!')
         return redirect(url_for('student.dashboard'))
 
@@ -188,4 +192,14 @@ def download_student_task_file(task_id):
         return f"<h1>Error: File not found</h1><p>File not found at path: {task.file_path}</p>", 404
 
     print(f"DEBUG: Sending file: {task.file_path}")
-    return send_file(task.file_path, as_attachment=True)
\ No newline at end of file
+    return send_file(task.file_path, as_attachment=True)
+
+
+@student.cli.command('mark-overdue')
+@click.option('--class-id', type=int, help='Only students of this class')
+def mark_overdue_command(class_id):
+    """Move pending assignments past their deadline to overdue"""
+    where = () if class_id is None else (Assignment.student_id.in_(select(User.id).where(User.class_id == class_id)),)
+    moved = mark_overdue(*where)
+    db.session.commit()
+    click.echo(f'Assignments marked overdue: {moved}')
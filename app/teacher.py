@@ -1,10 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app, abort
 from flask_login import login_required, current_user
 from app import db
-from models.models import Task, Assignment, User, Submission, Class, Subject, teacher_class_subjects
+from models.models import Task, Assignment, User, Submission, Class, Subject, loader_profile
 from .forms import TaskForm, AssignmentForm, TeacherSubjectForm
+from .file_cleanup import remove_files_later
+from .scope import teacher_scope, invalidate_teacher_scope
+from .assignments import task_timings
+from .jobs import enqueue
+from .previews import send_preview
+from .duplicates import near_duplicates
+from . import cascade
 from ml.priority_predictor import predict_priority
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from datetime import datetime
+from statistics import median
 import os
 from werkzeug.utils import secure_filename
 
@@ -32,24 +42,8 @@ def dashboard():
             unique_tasks[task.id] = task
     tasks = list(unique_tasks.values())
 
-    # Get teacher's classes from teacher_class_subjects table
-    teacher_classes = []
-    class_subject_mapping = db.session.query(teacher_class_subjects).filter_by(teacher_id=current_user.id).all()
-    for tc in class_subject_mapping:
-        class_obj = Class.query.get(tc.class_id)
-        if class_obj and class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Also get from teaching_classes relationship (backwards compatibility)
-    for class_obj in current_user.teaching_classes:
-        if class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    # Remove duplicates in case a student is in multiple classes
-    students = list(set(students))
+    scope = teacher_scope()
+    students = scope.students()
 
     student_stats = []
     for student in students:
@@ -68,43 +62,11 @@ def dashboard():
             'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         })
 
-    # Get teacher's classes with subject information
-    teacher_classes_info = []
-
-    for class_obj in teacher_classes:
-        # Get subjects available in this class
-        available_subjects = class_obj.subjects
-        # Get subjects the teacher is assigned to teach in this class (from teacher_class_subjects table)
-        teaching_subjects = []
-        for subject in available_subjects:
-            # Check if there's an entry in teacher_class_subjects for this teacher, class, and subject
-            entry = db.session.query(teacher_class_subjects).filter_by(
-                teacher_id=current_user.id, 
-                class_id=class_obj.id, 
-                subject_id=subject.id
-            ).first()
-            if entry:
-                teaching_subjects.append(subject)
-        
-        # Also include subjects from selected_subjects (for backwards compatibility)
-        selected_subject_ids = [s.id for s in current_user.selected_subjects]
-        for subject in available_subjects:
-            if subject.id in selected_subject_ids and subject not in teaching_subjects:
-                teaching_subjects.append(subject)
-
-        teacher_classes_info.append({
-            'class': class_obj,
-            'available_subjects': available_subjects,
-            'teaching_subjects': teaching_subjects,
-            'student_count': len(class_obj.students)
-        })
-    
-    print(f"DEBUG: Teacher {current_user.name} has {len(teacher_classes_info)} classes")
-    
+    # The template asks the scope for class summaries only when its cached fragment is stale
     return render_template('teacher_dashboard.html',
                          tasks=tasks,
                          student_stats=student_stats,
-                         teacher_classes_info=teacher_classes_info)
+                         scope=scope)
 
 @teacher.route('/select_subjects', methods=['GET', 'POST'])
 @login_required
@@ -115,7 +77,7 @@ def select_subjects():
     form = TeacherSubjectForm()
 
     # Get all subjects from the teacher's classes
-    teacher_classes = current_user.teaching_classes
+    teacher_classes = teacher_scope().classes(selectinload(Class.subjects))
     available_subjects = []
     for class_obj in teacher_classes:
         for subject in class_obj.subjects:
@@ -141,6 +103,7 @@ def select_subjects():
 
         current_user.selected_subjects.extend(selected_subjects)
         db.session.commit()
+        invalidate_teacher_scope(current_user.id)
 
         selected_count = len(form.subjects.data)
         flash(f'Successfully updated your teaching subjects! You now teach {selected_count} subject(s).')
@@ -154,26 +117,10 @@ def create_task():
     if current_user.user_type != 'teacher':
         return redirect(url_for('main.dashboard'))
 
-    # Get classes that the teacher teaches
-    teacher_classes = []
-    
-    # First, check teacher_class_subjects table (new way)
-    class_subject_mapping = db.session.query(teacher_class_subjects).filter_by(teacher_id=current_user.id).all()
-    for tc in class_subject_mapping:
-        class_obj = Class.query.get(tc.class_id)
-        if class_obj and class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Also check teaching_classes relationship (backwards compatibility)
-    for class_obj in current_user.teaching_classes:
-        if class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Get all students from teacher's classes
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    students = list(set(students))
+    # Get classes that the teacher teaches and their students
+    scope = teacher_scope()
+    teacher_classes = scope.classes()
+    students = scope.students()
 
     form = TaskForm()
     form.assigned_classes.choices = [(c.id, c.name) for c in teacher_classes]
@@ -207,59 +154,21 @@ def create_task():
             created_by=current_user.id
         )
         db.session.add(task)
-        db.session.commit()
 
-        # Add assigned classes to the task (for tracking which classes the task is assigned to)
+        # Record which classes the task is for
         if form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj and class_obj not in task.assigned_classes:
-                    task.assigned_classes.append(class_obj)
-            db.session.commit()
-
-        # Create assignments for students
-        assigned_students = []
-        
-        # First, assign to specific students if selected
+            class_ids = set(form.assigned_classes.data)
+            task.assigned_classes = [c for c in teacher_classes if c.id in class_ids]
+        db.session.flush()
+
+        # Assigning and notifying the selected students, or else everyone in the
+        # selected classes, runs as a background job
         if form.assigned_students.data:
-            for student_id in form.assigned_students.data:
-                student = User.query.get(int(student_id))
-                if student:
-                    # Check if assignment already exists
-                    existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                    if not existing:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
-        
-        # Then, assign to students in selected classes (if no specific students selected)
-        if not form.assigned_students.data and form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        # Check if assignment already exists
-                        existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                        if not existing:
-                            assignment = Assignment(
-                                task_id=task.id,
-                                student_id=student.id
-                            )
-                            db.session.add(assignment)
-                            assigned_students.append(student.id)
-        
+            enqueue('task_fan_out', task_id=task.id, student_ids=form.assigned_students.data)
+        elif form.assigned_classes.data:
+            enqueue('task_fan_out', task_id=task.id)
         db.session.commit()
 
-        # Create notifications for assigned students
-        from app.notifications import notify_task_assigned
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notify_task_assigned(student_id, task.title, current_user.name)
-
         flash('Task created successfully!', 'success')
         return redirect(url_for('teacher.dashboard'))
     else:
@@ -287,32 +196,17 @@ def assign_task(task_id):
         return redirect(url_for('teacher.dashboard'))
     
     # Get students from the teacher's classes only
-    teacher_classes = current_user.teaching_classes
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    # Remove duplicates in case a student is in multiple classes
-    students = list(set(students))
+    students = teacher_scope().students()
 
     form = AssignmentForm()
     form.students.choices = [(str(s.id), s.name) for s in students]
     
     if form.validate_on_submit():
-        selected_students = request.form.getlist('students')
-        assigned_students = []
-        for student_id in selected_students:
-            assignment = Assignment(task_id=task.id, student_id=int(student_id))
-            db.session.add(assignment)
-            assigned_students.append(int(student_id))
+        # Students who already have the task are skipped by the job
+        selected_students = [int(student_id) for student_id in request.form.getlist('students')]
+        enqueue('task_fan_out', task_id=task.id, student_ids=selected_students)
         db.session.commit()
         
-        # Create notifications for assigned students
-        from app.notifications import notify_task_assigned
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notify_task_assigned(student_id, task.title, current_user.name)
-        
         flash('Task assigned successfully!')
         return redirect(url_for('teacher.dashboard'))
     
@@ -329,8 +223,13 @@ def task_progress(task_id):
         flash('Access denied')
         return redirect(url_for('teacher.dashboard'))
 
-    assignments = Assignment.query.filter_by(task_id=task_id).all()
-    return render_template('task_progress.html', task=task, assignments=assignments)
+    assignments = Assignment.query.filter_by(task_id=task_id).options(*loader_profile('task_progress')).all()
+    timings = task_timings(task_id)
+    medians = [median(values) if values else None
+               for values in ([t[0] for t in timings.values() if t[0] is not None],
+                              [t[1] for t in timings.values() if t[1] is not None])]
+    return render_template('task_progress.html', task=task, assignments=assignments,
+                           timings=timings, median_to_start=medians[0], median_to_submit=medians[1])
 
 @teacher.route('/view_submission/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
@@ -406,6 +305,18 @@ def download_file(submission_id):
 
     return send_file(submission.file_path, as_attachment=True)
 
+@teacher.route('/submission_preview/<int:submission_id>')
+@login_required
+def submission_preview(submission_id):
+    if current_user.user_type != 'teacher':
+        abort(403)
+
+    submission = Submission.query.get_or_404(submission_id)
+    if submission.assignment.task.created_by != current_user.id:
+        abort(403)
+
+    return send_preview(submission.file_path)
+
 @teacher.route('/download_task_file/<int:task_id>')
 @login_required
 def download_task_file(task_id):
@@ -435,10 +346,10 @@ def edit_task(task_id):
         return redirect(url_for('teacher.dashboard'))
 
     # Get classes that the teacher teaches
-    teacher_classes = current_user.teaching_classes
+    teacher_classes = teacher_scope().classes()
 
     form = TaskForm()
-    form.assigned_classes.choices = [(str(c.id), c.name) for c in teacher_classes]
+    form.assigned_classes.choices = [(c.id, c.name) for c in teacher_classes]
 
     # Populate form with existing task data
     if request.method == 'GET':
@@ -448,13 +359,12 @@ def edit_task(task_id):
         form.priority.data = task.priority
         form.instructions.data = task.instructions
 
-        # Pre-select assigned classes (find classes that have students assigned to this task)
-        current_assignments = Assignment.query.filter_by(task_id=task.id).all()
-        assigned_class_ids = set()
-        for assignment in current_assignments:
-            if assignment.student.class_id:
-                assigned_class_ids.add(assignment.student.class_id)
-        form.assigned_classes.data = list(assigned_class_ids)
+        # Pre-select assigned classes: the task's classes plus those of students assigned to it
+        student_class_ids = db.session.scalars(
+            select(User.class_id).join(Assignment, Assignment.student_id == User.id)
+            .where(Assignment.task_id == task.id, User.class_id.is_not(None)).distinct()
+        )
+        form.assigned_classes.data = list({c.id for c in task.assigned_classes} | set(student_class_ids))
 
     if form.validate_on_submit():
         # Use ML to suggest priority if not set or changed
@@ -464,12 +374,13 @@ def edit_task(task_id):
 
         # Handle file upload
         file_path = task.file_path  # Keep existing file by default
+        old_files = []
         if form.task_file.data:
             filename = secure_filename(form.task_file.data.filename)
             if filename:
-                # Remove old file if exists
-                if task.file_path and os.path.exists(task.file_path):
-                    os.remove(task.file_path)
+                # The old file is removed once the new path is committed
+                if task.file_path:
+                    old_files.append(task.file_path)
 
                 # Create unique filename
                 import uuid
@@ -477,6 +388,11 @@ def edit_task(task_id):
                 file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
                 form.task_file.data.save(file_path)
 
+        # Students are told about the edit only if something they see changed
+        edited = (task.title, task.description, task.deadline, task.priority, task.instructions, task.file_path) != (
+            form.title.data, form.description.data, form.deadline.data, form.priority.data,
+            form.instructions.data, file_path)
+
         # Update task
         task.title = form.title.data
         task.description = form.description.data
@@ -485,43 +401,22 @@ def edit_task(task_id):
         task.instructions = form.instructions.data
         task.file_path = file_path
 
-        # Update assignments
+        # Update assignments incrementally: only students who left or joined the selected
+        # classes change; everyone else keeps their status and submissions
         if form.assigned_classes.data:
-            # Remove existing assignments
-            Assignment.query.filter_by(task_id=task.id).delete()
-            db.session.commit()
-
-            # Create new assignments for students in selected classes
-            assigned_students = []
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
-
-            db.session.commit()
-
-            # Create notifications for newly assigned students
-            from app.notifications import notify_task_assigned, notify_task_updated
-            for student_id in assigned_students:
-                student = User.query.get(student_id)
-                if student:
-                    notify_task_assigned(student_id, task.title, current_user.name)
-        else:
-            # If no classes selected, remove all assignments and send update notification
-            assigned_students = []
-            for assignment in Assignment.query.filter_by(task_id=task.id).all():
-                assigned_students.append(assignment.student_id)
-
-            # Create notifications for students whose task was updated
-            from app.notifications import notify_task_updated
-            if assigned_students:
-                notify_task_updated(assigned_students, task.title, current_user.name)
+            class_ids = set(form.assigned_classes.data)
+            task.assigned_classes = [c for c in teacher_classes if c.id in class_ids]
+            db.session.flush()
+            in_classes = select(User.id).where(User.class_id.in_(class_ids), User.user_type == 'student')
+            removed = cascade.delete_assignments(Assignment.task_id == task.id,
+                                                 Assignment.student_id.not_in(in_classes))
+            old_files.extend(removed.files)
+        if edited or form.assigned_classes.data:
+            # Notifies the retained students of the edit, then assigns and notifies newcomers
+            enqueue('task_fan_out', task_id=task.id, assign=bool(form.assigned_classes.data),
+                    updated_by=current_user.name if edited else None)
+        db.session.commit()
+        remove_files_later(old_files)
         flash('Task updated successfully!')
         return redirect(url_for('teacher.dashboard'))
 
@@ -543,24 +438,10 @@ def delete_task(task_id):
         return redirect(url_for('teacher.dashboard'))
     
     try:
-        # Remove associated file if exists
-        if task.file_path and os.path.exists(task.file_path):
-            os.remove(task.file_path)
-        
-        # Delete all related assignments and submissions
-        assignments = Assignment.query.filter_by(task_id=task.id).all()
-        for assignment in assignments:
-            # Remove submission files
-            submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
-            for submission in submissions:
-                if submission.file_path and os.path.exists(submission.file_path):
-                    os.remove(submission.file_path)
-                db.session.delete(submission)
-            db.session.delete(assignment)
-        
-        # Delete the task
-        db.session.delete(task)
+        result = cascade.delete_tasks([task.id])
         db.session.commit()
+        # Files go only once the rows are gone, and off the request thread
+        remove_files_later(result.files)
         flash('Task and all related data deleted successfully!')
     except Exception as e:
         db.session.rollback()
@@ -579,16 +460,23 @@ def review_submissions(task_id):
         flash('Access denied')
         return redirect(url_for('teacher.dashboard'))
     
-    assignments = Assignment.query.filter_by(task_id=task_id).all()
+    assignments = Assignment.query.filter_by(task_id=task_id).options(*loader_profile('review_submissions')).all()
     
     # Get submission data for each assignment
     submissions_data = []
     for assignment in assignments:
-        submission = Submission.query.filter_by(assignment_id=assignment.id).first()
+        submission = min(assignment.submissions, key=lambda s: s.id) if assignment.submissions else None
         submissions_data.append({
             'assignment': assignment,
             'submission': submission,
             'student': assignment.student
         })
     
-    return render_template('review_submissions.html', task=task, submissions_data=submissions_data)
+    # Candidate copies, from the stored signatures rather than by comparing every pair
+    students = {assignment.student_id: assignment.student for assignment in assignments}
+    duplicates = [dict(pair, names=tuple(students[sid].name if sid in students else 'Unknown student'
+                                         for sid in pair['students']))
+                  for pair in near_duplicates(task.id, current_app.config['SIMILARITY_THRESHOLD'])]
+    
+    return render_template('review_submissions.html', task=task, submissions_data=submissions_data,
+                           duplicates=duplicates)
@@ -0,0 +1,49 @@
+"""
+Login throttling.
+
+Failed sign-ins are counted per account (the submitted email, whether or not
+it exists) and per client IP in the shared LocalStore, in windows of
+LOGIN_THROTTLE_WINDOW seconds that start at the first failure. Past the free
+attempts each further failure doubles the wait before the next attempt is even checked (1s, 2s,
+4s, ... up to LOGIN_THROTTLE_MAX_DELAY), so a burst of bad passwords costs a
+counter lookup instead of a password hash. A successful sign-in clears the
+account's counter. The IP allowance is much larger than the account one
+because a whole school can share one address; set TRUSTED_PROXIES when the
+app runs behind a load balancer so the client address is used.
+"""
+
+import math
+import time
+
+from flask import current_app
+
+
+def _keys(email, ip):
+    return f'login:account:{(email or "").strip().lower()}', f'login:ip:{ip}'
+
+
+def login_retry_after(email, ip):
+    """Seconds until email/ip may try to sign in again (0: go ahead)"""
+    store = current_app.extensions['local_store']
+    now = time.time()
+    until = max((store.get(f'{key}:until') or 0) for key in _keys(email, ip))
+    return max(0, math.ceil(until - now))
+
+
+def record_login_failure(email, ip):
+    store = current_app.extensions['local_store']
+    config = current_app.config
+    account_key, ip_key = _keys(email, ip)
+    for key, free_attempts in ((account_key, config['LOGIN_THROTTLE_ACCOUNT_ATTEMPTS']),
+                               (ip_key, config['LOGIN_THROTTLE_IP_ATTEMPTS'])):
+        failures = store.incr(key, config['LOGIN_THROTTLE_WINDOW'])
+        if failures > free_attempts:
+            delay = min(config['LOGIN_THROTTLE_MAX_DELAY'], 2 ** min(failures - free_attempts - 1, 30))
+            store.set(f'{key}:until', time.time() + delay, delay)
+
+
+def record_login_success(email, ip):
+    store = current_app.extensions['local_store']
+    account_key, _ = _keys(email, ip)
+    store.delete(account_key)
+    store.delete(f'{account_key}:until')
@@ -0,0 +1,11 @@
+"""
+Load dataset generator and benchmark suite for SMART Edu Task Manager.
+
+- dataset.py   builds a configurable synthetic school with bulk inserts
+- hot_paths.py drives the busiest pages through the Flask test client and
+               records latency percentiles and query counts as JSON
+- query_counts.py checks that relationship-heavy pages issue a constant number
+               of queries as the dataset grows
+- sqlite_stress.py simulates a class submitting at once from separate processes
+               against one SQLite file
+"""
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Synthetic load dataset generator.
+
+Builds a school of configurable size (classes, students, teachers, tasks and
+the assignment/submission/notification/chat history that goes with them)
+using bulk inserts, so production-scale behaviour can be reproduced locally.
+
+Usage:
+    python -m benchmarks.dataset --database instance/load.db --classes 20 --students-per-class 40
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+
+from app import db
+from models.models import (User, Class, Subject, Task, Assignment, Submission, Notification,
+                           NotificationCounter, ContactMessage, ChatRoom, ChatMessage, teacher_classes,
+                           class_subjects, teacher_subjects, teacher_class_subjects, task_classes,
+                           PRIORITY_RANKS, UNRANKED_PRIORITY)
+
+# Every generated account shares this password so benchmarks can log in
+DEFAULT_PASSWORD = 'loadtest123'
+EMAIL_DOMAIN = 'loadtest.smartedu.com'
+
+DEFAULT_SPEC = {
+    'classes': 10,
+    'students_per_class': 30,
+    'teachers': None,               # defaults to one teacher per two classes (at least one)
+    'subjects_per_class': 4,
+    'tasks': 200,
+    'notifications_per_user': 25,   # mean, exponentially distributed
+    'messages_per_room': 150,       # mean, exponentially distributed
+    'contact_messages': 50,
+    'seed': 42,
+}
+
+# Relative frequency of each priority, roughly what teachers pick in practice
+PRIORITY_WEIGHTS = {
+    'urgent_important': 15,
+    'important_not_urgent': 10,
+    'urgent_not_important': 5,
+    'high_priority': 15,
+    'medium_priority': 30,
+    'low_priority': 10,
+    'long_term': 5,
+    'group_task': 5,
+    'optional': 3,
+    'not_important_not_urgent': 2,
+}
+
+WORDS = (
+    'algebra analysis answer biology calculate chapter chemistry compare complete concept '
+    'describe diagram discuss energy equation essay evaluate example experiment explain '
+    'exercise fraction function geography geometry grammar graph history homework hypothesis '
+    'introduction language literature map measure method notes observe paragraph physics '
+    'poem practice presentation problem project question reading report research result '
+    'revision science solution source statistics summary theory vocabulary worksheet write'
+).split()
+
+BATCH_SIZE = 5000
+
+
+def _sentence(rng, min_words=6, max_words=18):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng, min_sentences=2, max_sentences=6):
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _bulk_insert(table, rows):
+    """Insert rows with executemany in fixed-size batches (every row must carry the same keys)"""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def generate_school(**overrides):
+    """Populate the current app's database with a synthetic school.
+
+    Must be called inside an app context. Returns a summary dict with row
+    counts and a few ids that benchmarks use to build URLs.
+    """
+    spec = dict(DEFAULT_SPEC)
+    spec.update({k: v for k, v in overrides.items() if v is not None})
+    rng = random.Random(spec['seed'])
+    now = datetime.utcnow()
+
+    db.create_all()
+    password_hash = generate_password_hash(DEFAULT_PASSWORD)
+    tag = f"{spec['seed']}-{_next_id(User)}"
+
+    # Users: one admin, teachers and students
+    n_classes = spec['classes']
+    n_teachers = spec['teachers'] or max(1, n_classes // 2)
+    user_id = _next_id(User)
+    users = []
+
+    admin_id = user_id
+    users.append({
+        'id': admin_id, 'name': 'Load Admin', 'email': f'admin-{tag}@{EMAIL_DOMAIN}',
+        'password_hash': password_hash, 'user_type': 'admin', 'class_id': None, 'created_at': now - timedelta(days=400),
+    })
+    user_id += 1
+
+    class_id = _next_id(Class)
+    class_ids = list(range(class_id, class_id + n_classes))
+    classes = [{
+        'id': cid, 'name': f'Load Class {tag}-{i + 1}', 'description': _sentence(rng),
+        'created_by': admin_id, 'created_at': now - timedelta(days=365),
+    } for i, cid in enumerate(class_ids)]
+
+    teacher_ids = []
+    for i in range(n_teachers):
+        teacher_ids.append(user_id)
+        users.append({
+            'id': user_id, 'name': f'Teacher {i + 1}', 'email': f'teacher{i + 1}-{tag}@{EMAIL_DOMAIN}',
+            'password_hash': password_hash, 'user_type': 'teacher', 'class_id': None,
+            'created_at': now - timedelta(days=rng.randint(30, 400)),
+        })
+        user_id += 1
+
+    students_by_class = {}
+    for cid in class_ids:
+        students_by_class[cid] = []
+        for _ in range(spec['students_per_class']):
+            n = user_id - admin_id
+            students_by_class[cid].append(user_id)
+            users.append({
+                'id': user_id, 'name': f'Student {n}', 'email': f'student{n}-{tag}@{EMAIL_DOMAIN}',
+                'password_hash': password_hash, 'user_type': 'student', 'class_id': cid,
+                'created_at': now - timedelta(days=rng.randint(1, 400)),
+            })
+            user_id += 1
+
+    _bulk_insert(User.__table__, users)
+    _bulk_insert(Class.__table__, classes)
+
+    # Subjects per class, each taught by one teacher; teachers cover classes round-robin
+    subject_id = _next_id(Subject)
+    subjects, class_subject_rows, tcs_rows = [], [], []
+    teacher_class_pairs, teacher_subject_pairs = set(), set()
+    teachers_by_class = {}
+    for index, cid in enumerate(class_ids):
+        teachers_by_class[cid] = set()
+        for s in range(spec['subjects_per_class']):
+            teacher_id = teacher_ids[(index + s) % n_teachers]
+            subjects.append({
+                'id': subject_id, 'name': f'Subject {s + 1}', 'description': _sentence(rng),
+                'created_by': admin_id, 'created_at': now - timedelta(days=365),
+            })
+            class_subject_rows.append({'class_id': cid, 'subject_id': subject_id})
+            tcs_rows.append({'teacher_id': teacher_id, 'class_id': cid, 'subject_id': subject_id})
+            teacher_class_pairs.add((teacher_id, cid))
+            teacher_subject_pairs.add((teacher_id, subject_id))
+            teachers_by_class[cid].add(teacher_id)
+            subject_id += 1
+
+    _bulk_insert(Subject.__table__, subjects)
+    _bulk_insert(class_subjects, class_subject_rows)
+    _bulk_insert(teacher_class_subjects, tcs_rows)
+    _bulk_insert(teacher_classes, [{'teacher_id': t, 'class_id': c} for t, c in sorted(teacher_class_pairs)])
+    _bulk_insert(teacher_subjects, [{'teacher_id': t, 'subject_id': s} for t, s in sorted(teacher_subject_pairs)])
+
+    # Tasks: most target one class, some span two or three; deadlines from two months ago to a month ahead
+    task_id = _next_id(Task)
+    assignment_id = _next_id(Assignment)
+    submission_id = _next_id(Submission)
+    priorities = list(PRIORITY_WEIGHTS)
+    weights = list(PRIORITY_WEIGHTS.values())
+    tasks, task_class_rows, assignments, submissions = [], [], [], []
+    for _ in range(spec['tasks']):
+        target_classes = rng.sample(class_ids, min(n_classes, rng.choices([1, 2, 3], [75, 20, 5])[0]))
+        creator = rng.choice(sorted(teachers_by_class[target_classes[0]]))
+        created_at = now - timedelta(days=rng.uniform(1, 90))
+        deadline = now + timedelta(days=rng.uniform(-60, 30))
+        if deadline < created_at:
+            created_at = deadline - timedelta(days=rng.uniform(1, 14))
+        priority = rng.choices(priorities, weights)[0]
+        tasks.append({
+            'id': task_id, 'title': _sentence(rng, 3, 7).rstrip('.'), 'description': _paragraph(rng),
+            'instructions': _paragraph(rng, 1, 3), 'deadline': deadline, 'priority': priority,
+            # Core inserts skip Task's @validates hook, so rank here as it would
+            'priority_rank': PRIORITY_RANKS.get(priority, UNRANKED_PRIORITY),
+            'created_by': creator, 'created_at': created_at,
+        })
+        past_deadline = deadline < now
+        for cid in target_classes:
+            task_class_rows.append({'task_id': task_id, 'class_id': cid})
+            for student_id in students_by_class[cid]:
+                if past_deadline:
+                    status = rng.choices(['completed', 'overdue', 'in_progress', 'pending'], [70, 20, 5, 5])[0]
+                else:
+                    status = rng.choices(['completed', 'in_progress', 'pending'], [30, 25, 45])[0]
+                submitted_at = None
+                if status == 'completed':
+                    submitted_at = created_at + (min(deadline, now) - created_at) * rng.random()
+                    graded = rng.random() < 0.4
+                    submissions.append({
+                        'id': submission_id, 'assignment_id': assignment_id,
+                        'content': _paragraph(rng, 1, 8), 'submitted_at': submitted_at,
+                        'score': max(0, min(100, int(rng.gauss(75, 12)))) if graded else None,
+                        'feedback': _sentence(rng) if graded else None,
+                        'feedback_provided_at': submitted_at + timedelta(days=rng.uniform(0, 5)) if graded else None,
+                        'graded_by': creator if graded else None,
+                    })
+                    submission_id += 1
+                assignments.append({
+                    'id': assignment_id, 'task_id': task_id, 'student_id': student_id, 'status': status,
+                    'assigned_at': created_at, 'submitted_at': submitted_at,
+                })
+                assignment_id += 1
+        task_id += 1
+
+    _bulk_insert(Task.__table__, tasks)
+    _bulk_insert(task_classes, task_class_rows)
+    _bulk_insert(Assignment.__table__, assignments)
+    _bulk_insert(Submission.__table__, submissions)
+
+    # Notifications: a long tail per user, most of them read, many carrying an expiry
+    notification_types = ['info', 'success', 'warning', 'task']
+    notifications = []
+    for user in users:
+        for _ in range(int(rng.expovariate(1.0 / spec['notifications_per_user']))):
+            created_at = now - timedelta(hours=rng.uniform(0, 24 * 120))
+            expires_at = None
+            if rng.random() < 0.6:
+                expires_at = created_at + timedelta(hours=rng.choice([24, 72, 168]))
+            notifications.append({
+                'user_id': user['id'], 'title': _sentence(rng, 2, 5).rstrip('.'), 'message': _sentence(rng),
+                'notification_type': rng.choice(notification_types), 'is_read': rng.random() < 0.7,
+                'created_at': created_at, 'expires_at': expires_at,
+            })
+    _bulk_insert(Notification.__table__, notifications)
+    NotificationCounter.recount(db.session.query(User.id).filter(User.id >= users[0]['id']))
+
+    # Forum: one room per class plus the teachers room
+    room_id = _next_id(ChatRoom)
+    rooms, messages = [], []
+    room_members = {}
+    for cls in classes:
+        cid = cls['id']
+        rooms.append({
+            'id': room_id, 'name': f"Class Forum: {cls['name']}", 'room_type': 'class', 'class_id': cid,
+            'created_by': admin_id, 'created_at': now - timedelta(days=365), 'is_active': True,
+        })
+        room_members[room_id] = students_by_class[cid] + sorted(teachers_by_class[cid])
+        room_id += 1
+    teacher_room_id = None
+    if not ChatRoom.query.filter_by(room_type='teacher').first():
+        teacher_room_id = room_id
+        rooms.append({
+            'id': room_id, 'name': 'Teachers Forum', 'room_type': 'teacher', 'class_id': None,
+            'created_by': admin_id, 'created_at': now - timedelta(days=365), 'is_active': True,
+        })
+        room_members[room_id] = teacher_ids
+    _bulk_insert(ChatRoom.__table__, rooms)
+
+    for rid, members in room_members.items():
+        count = int(rng.expovariate(1.0 / spec['messages_per_room'])) if spec['messages_per_room'] else 0
+        stamps = sorted(now - timedelta(minutes=rng.uniform(0, 60 * 24 * 90)) for _ in range(count))
+        for created_at in stamps:
+            messages.append({
+                'room_id': rid, 'user_id': rng.choice(members), 'content': _sentence(rng, 3, 25),
+                'created_at': created_at, 'is_deleted': rng.random() < 0.02,
+            })
+    _bulk_insert(ChatMessage.__table__, messages)
+
+    categories = ['general', 'support', 'bug', 'feature', 'partnership']
+    _bulk_insert(ContactMessage.__table__, [{
+        'name': f'Visitor {i + 1}', 'email': f'visitor{i + 1}@{EMAIL_DOMAIN}', 'subject': _sentence(rng, 2, 6),
+        'message': _paragraph(rng), 'category': rng.choice(categories), 'is_read': rng.random() < 0.5,
+        'created_at': now - timedelta(days=rng.uniform(0, 180)),
+    } for i in range(spec['contact_messages'])])
+
+    db.session.commit()
+
+    # Pick representative accounts for benchmarks: the busiest teacher and a student in the biggest class
+    teacher_task_counts = {}
+    for task in tasks:
+        teacher_task_counts[task['created_by']] = teacher_task_counts.get(task['created_by'], 0) + 1
+    busiest_teacher = max(teacher_task_counts, key=teacher_task_counts.get) if tasks else teacher_ids[0]
+    submission_counts = {}
+    assignment_task = {a['id']: a['task_id'] for a in assignments}
+    for submission in submissions:
+        tid = assignment_task[submission['assignment_id']]
+        submission_counts[tid] = submission_counts.get(tid, 0) + 1
+    teacher_tasks = [t['id'] for t in tasks if t['created_by'] == busiest_teacher]
+    review_task = max(teacher_tasks, key=lambda t: submission_counts.get(t, 0)) if teacher_tasks else None
+
+    return {
+        'spec': spec,
+        'password': DEFAULT_PASSWORD,
+        'counts': {
+            'users': len(users), 'classes': len(classes), 'subjects': len(subjects), 'tasks': len(tasks),
+            'assignments': len(assignments), 'submissions': len(submissions),
+            'notifications': len(notifications), 'chat_messages': len(messages),
+        },
+        'accounts': {
+            'admin': users[0]['email'],
+            'teacher': next(u['email'] for u in users if u['id'] == busiest_teacher),
+            'student': next(u['email'] for u in users if u['id'] == students_by_class[class_ids[0]][0]),
+        },
+        'ids': {
+            'review_task': review_task,
+            'class_room': rooms[0]['id'],
+            'teacher_room': teacher_room_id,
+            'class': class_ids[0],
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic school for load testing.')
+    parser.add_argument('--database', required=True, help='SQLite file or database URL to populate')
+    parser.add_argument('--classes', type=int)
+    parser.add_argument('--students-per-class', type=int)
+    parser.add_argument('--teachers', type=int)
+    parser.add_argument('--subjects-per-class', type=int)
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--notifications-per-user', type=int)
+    parser.add_argument('--messages-per-room', type=int)
+    parser.add_argument('--contact-messages', type=int)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    uri = args.database if '://' in args.database else 'sqlite:///' + os.path.abspath(args.database)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        summary = generate_school(
+            classes=args.classes, students_per_class=args.students_per_class, teachers=args.teachers,
+            subjects_per_class=args.subjects_per_class, tasks=args.tasks,
+            notifications_per_user=args.notifications_per_user, messages_per_room=args.messages_per_room,
+            contact_messages=args.contact_messages, seed=args.seed,
+        )
+
+    print(f"Load dataset written to {uri}")
+    for name, count in summary['counts'].items():
+        print(f"  {name}: {count}")
+    print(f"Accounts (password '{summary['password']}'):")
+    for role, email in summary['accounts'].items():
+        print(f"  {role}: {email}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the application's hot paths.
+
+Builds a synthetic school (in a temporary database, or added to the SQLite
+file given with --database), logs in as an admin, a teacher and a student
+through the Flask test client and replays the busiest pages, recording
+latency percentiles and SQL query counts per request. Results are written as
+JSON so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.hot_paths --classes 20 --students-per-class 40 --iterations 50
+    python -m benchmarks.hot_paths --compare benchmarks/results/<older>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flask
+import sqlalchemy
+from flask import url_for
+from sqlalchemy import event
+
+from app import create_app, db
+from benchmarks.dataset import generate_school
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# (name, role, endpoint, url argument builder from the dataset summary)
+SCENARIOS = [
+    ('main.dashboard[student]', 'student', 'main.dashboard', lambda ids: {}),
+    ('main.dashboard[teacher]', 'teacher', 'main.dashboard', lambda ids: {}),
+    ('student.dashboard', 'student', 'student.dashboard', lambda ids: {}),
+    ('teacher.review_submissions', 'teacher', 'teacher.review_submissions', lambda ids: {'task_id': ids['review_task']}),
+    ('teacher.task_progress', 'teacher', 'teacher.task_progress', lambda ids: {'task_id': ids['review_task']}),
+    ('forum.api_get_messages', 'student', 'forum.api_get_messages', lambda ids: {'room_id': ids['class_room']}),
+    ('notifications.get_notifications', 'student', 'notifications.get_notifications', lambda ids: {}),
+    ('admin.dashboard', 'admin', 'admin.dashboard', lambda ids: {}),
+    ('admin.manage_users', 'admin', 'admin.manage_users', lambda ids: {}),
+    ('admin.manage_tasks', 'admin', 'admin.manage_tasks', lambda ids: {}),
+    ('admin.manage_classes', 'admin', 'admin.manage_classes', lambda ids: {}),
+    ('admin.manage_subjects', 'admin', 'admin.manage_subjects', lambda ids: {}),
+    ('admin.view_contact_messages', 'admin', 'admin.view_contact_messages', lambda ids: {}),
+]
+
+
+class QueryCounter:
+    """Counts statements sent to the database while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies_ms, query_counts, errors):
+    latencies = sorted(latencies_ms)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'latency_ms': {
+            'min': round(latencies[0], 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+        },
+        'queries': {
+            'min': min(query_counts),
+            'max': max(query_counts),
+            'mean': round(sum(query_counts) / len(query_counts), 2),
+        },
+    }
+
+
+def make_app(database_uri, extra_config=None):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SESSION_COOKIE_SECURE': False,
+        'WTF_CSRF_ENABLED': False,
+        'SERVER_NAME': 'bench.local',
+    }
+    config.update(extra_config or {})
+    return create_app(config)
+
+
+def login(app, email, password):
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login failed for {email} (status {response.status_code})')
+    return client
+
+
+def run_scenarios(app, summary, iterations=30, warmup=3, scenarios=None):
+    """Replay each scenario and return {name: stats}"""
+    clients = {role: login(app, email, summary['password']) for role, email in summary['accounts'].items()}
+    results = {}
+    for name, role, endpoint, build_args in scenarios or SCENARIOS:
+        with app.app_context():
+            url = url_for(endpoint, **build_args(summary['ids']))
+            engine = db.engine
+        client = clients[role]
+        latencies, query_counts, errors = [], [], 0
+        for i in range(warmup + iterations):
+            with QueryCounter(engine) as counter:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000.0
+            if i < warmup:
+                continue
+            if response.status_code >= 400:
+                errors += 1
+            latencies.append(elapsed)
+            query_counts.append(counter.count)
+        results[name] = summarize(latencies, query_counts, errors)
+    return results
+
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results, baseline=None):
+    header = f"{'scenario':<34}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}"
+    if baseline:
+        header += f"{'Δp50':>10}{'Δqueries':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in results.items():
+        line = (f"{name:<34}{stats['latency_ms']['p50']:>10.2f}{stats['latency_ms']['p95']:>10.2f}"
+                f"{stats['latency_ms']['p99']:>10.2f}{stats['queries']['mean']:>10.1f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            delta_p50 = stats['latency_ms']['p50'] - previous['latency_ms']['p50']
+            delta_queries = stats['queries']['mean'] - previous['queries']['mean']
+            line += f"{delta_p50:>+10.2f}{delta_queries:>+10.1f}"
+        if stats['errors']:
+            line += f"  ({stats['errors']} errors)"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths against a synthetic school.')
+    parser.add_argument('--database', help='SQLite file to add the generated school to and keep; a temp file if omitted')
+    parser.add_argument('--classes', type=int)
+    parser.add_argument('--students-per-class', type=int)
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--notifications-per-user', type=int)
+    parser.add_argument('--messages-per-room', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='Where to write the JSON results (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='Previous results JSON to diff against')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if args.database:
+        database_path = os.path.abspath(args.database)
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='smartedu-bench-')
+        database_path = os.path.join(tmpdir, 'bench.db')
+
+    app = make_app('sqlite:///' + database_path)
+    with app.app_context():
+        started = time.perf_counter()
+        summary = generate_school(
+            classes=args.classes, students_per_class=args.students_per_class, tasks=args.tasks,
+            notifications_per_user=args.notifications_per_user, messages_per_room=args.messages_per_room,
+            seed=args.seed,
+        )
+        generation_seconds = time.perf_counter() - started
+    print(f"Dataset ready in {generation_seconds:.1f}s: " +
+          ', '.join(f'{k}={v}' for k, v in summary['counts'].items()))
+
+    results = run_scenarios(app, summary, iterations=args.iterations, warmup=args.warmup)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'flask': flask.__version__,
+            'sqlalchemy': sqlalchemy.__version__,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'dataset': {'spec': summary['spec'], 'counts': summary['counts']},
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{report['meta']['revision']}-{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Query-count regression check for relationship-heavy pages.
+
+Renders each page against a small and a large synthetic school and fails if
+the number of SQL statements per request differs between the two, i.e. if a
+template has started lazy-loading a relationship once per row again.
+
+Usage:
+    python -m benchmarks.query_counts
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.dataset import generate_school
+from benchmarks.hot_paths import make_app, run_scenarios, SCENARIOS
+
+# Pages whose query count must not depend on the number of rows they render
+CHECKED_SCENARIOS = [
+    'main.dashboard[student]',
+    'student.dashboard',
+    'teacher.review_submissions',
+    'teacher.task_progress',
+    'admin.manage_tasks',
+]
+
+SMALL = {'classes': 2, 'students_per_class': 5, 'tasks': 10}
+LARGE = {'classes': 6, 'students_per_class': 25, 'tasks': 60}
+
+
+def measure(spec):
+    tmpdir = tempfile.mkdtemp(prefix='smartedu-queries-')
+    app = make_app('sqlite:///' + os.path.join(tmpdir, 'queries.db'))
+    with app.app_context():
+        summary = generate_school(notifications_per_user=5, messages_per_room=10, **spec)
+    scenarios = [s for s in SCENARIOS if s[0] in CHECKED_SCENARIOS]
+    results = run_scenarios(app, summary, iterations=1, warmup=1, scenarios=scenarios)
+    return {name: stats['queries']['max'] for name, stats in results.items()}, summary['counts']
+
+
+def main():
+    small, small_counts = measure(SMALL)
+    large, large_counts = measure(LARGE)
+    print(f"small dataset: {small_counts['assignments']} assignments, large dataset: {large_counts['assignments']} assignments")
+
+    failures = []
+    for name in CHECKED_SCENARIOS:
+        status = 'ok' if small[name] == large[name] else 'FAIL'
+        print(f"{name:<34}{small[name]:>6}{large[name]:>6}  {status}")
+        if status == 'FAIL':
+            failures.append(name)
+
+    if failures:
+        print(f"\nQuery count grows with row count for: {', '.join(failures)}")
+        sys.exit(1)
+    print('\nAll checked pages issue a constant number of queries.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Regression check for the notification retention job.
+
+SQLite gives a new row max(rowid) + 1, so once a purge has removed the
+newest notifications their ids are handed out again. Archiving must not
+depend on those ids being unique: this purges an archived notification,
+creates another that reuses its id, and purges again.
+
+Usage:
+    python -m benchmarks.retention_check
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db
+from app.retention import purge_notifications
+from benchmarks.hot_paths import make_app
+from models.models import User, Notification, NotificationArchive
+
+
+def expired_error(user_id, now):
+    notification = Notification(user_id=user_id, title='Failed', message='Something failed',
+                                notification_type='error', created_at=now - timedelta(days=30),
+                                expires_at=now - timedelta(days=20))
+    db.session.add(notification)
+    db.session.commit()
+    return notification.id
+
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='smartedu-retention-')
+    app = make_app('sqlite:///' + os.path.join(tmpdir, 'retention.db'))
+    with app.app_context():
+        db.create_all()
+        user = User(name='Retention Check', email='retention@example.com', user_type='student')
+        user.set_password('retention123')
+        db.session.add(user)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        ids = []
+        for _ in range(2):
+            ids.append(expired_error(user.id, now))
+            report = purge_notifications(now=now)
+            print(f"notification {ids[-1]}: archived {report['policies']['error']['archived']}")
+
+        archived = sorted(db.session.scalars(db.select(NotificationArchive.notification_id)).all())
+        if archived != sorted(ids) or Notification.query.count():
+            print(f"\nExpected notifications {sorted(ids)} in the archive, found {archived}")
+            sys.exit(1)
+    reused = ' (the id was reused)' if ids[0] == ids[1] else ''
+    print(f'\nBoth purges archived their notification{reused}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for SQLite deployments.
+
+Simulates a class submitting at the same moment: one process per student
+(like separate gunicorn workers sharing the database file) logs in, waits on
+a barrier, then loads the dashboard and posts a submission (--rounds times). Runs once with
+SQLITE_PRODUCTION_MODE off and once with it on, each against a fresh copy of
+the dataset, and reports failed requests ("database is locked") and latency.
+
+Usage:
+    python -m benchmarks.sqlite_stress --students 40
+    python -m benchmarks.sqlite_stress --modes production
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import url_for
+
+from benchmarks.dataset import generate_school
+from benchmarks.hot_paths import make_app, login, percentile
+from app import db
+from models.models import User, Assignment
+
+MODES = {
+    'default': {'SQLITE_PRODUCTION_MODE': False},
+    'production': {'SQLITE_PRODUCTION_MODE': True},
+}
+
+
+def student_worker(database_uri, mode_config, email, password, assignment_id, rounds, barrier, results):
+    """One simulated student in its own process: dashboard, then submission, `rounds` times"""
+    config = dict(mode_config, PROPAGATE_EXCEPTIONS=True)
+    app = make_app(database_uri, config)
+    outcome = {'email': email, 'errors': [], 'latency_ms': []}
+    try:
+        client = login(app, email, password)
+    except Exception as e:
+        outcome['errors'].append(f'login: {e}')
+        barrier.wait()
+        results.put(outcome)
+        return
+
+    with app.app_context():
+        requests = [
+            ('GET', url_for('student.dashboard'), None),
+            ('POST', url_for('student.submit_task', assignment_id=assignment_id),
+             {'content': f'Stress submission from {email}'}),
+        ]
+
+    barrier.wait()
+    for method, url, data in requests * rounds:
+        started = time.perf_counter()
+        try:
+            response = client.open(url, method=method, data=data)
+            if response.status_code >= 400:
+                outcome['errors'].append(f'{method} {url}: HTTP {response.status_code}')
+        except Exception as e:
+            outcome['errors'].append(f'{method} {url}: {type(e).__name__}: {str(e).splitlines()[0]}')
+        outcome['latency_ms'].append((time.perf_counter() - started) * 1000.0)
+    results.put(outcome)
+
+
+def prepare(database_uri, mode_config, students, seed):
+    """Generate a one-class school and pick an assignment for each student to submit"""
+    app = make_app(database_uri, mode_config)
+    with app.app_context():
+        summary = generate_school(classes=1, students_per_class=students, tasks=5,
+                                  notifications_per_user=5, messages_per_room=5, seed=seed)
+        pairs = []
+        for user in User.query.filter_by(class_id=summary['ids']['class'], user_type='student').order_by(User.id):
+            assignment = Assignment.query.filter_by(student_id=user.id).order_by(Assignment.id).first()
+            if assignment:
+                pairs.append((user.email, assignment.id))
+        db.engine.dispose()
+    return summary, pairs
+
+
+def run_mode(mode, students, rounds, seed):
+    tmpdir = tempfile.mkdtemp(prefix=f'smartedu-stress-{mode}-')
+    database_uri = 'sqlite:///' + os.path.join(tmpdir, 'stress.db')
+    summary, pairs = prepare(database_uri, MODES[mode], students, seed)
+
+    barrier = multiprocessing.Barrier(len(pairs))
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=student_worker, args=(
+            database_uri, MODES[mode], email, summary['password'], assignment_id, rounds, barrier, results
+        ))
+        for email, assignment_id in pairs
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(ms for outcome in outcomes for ms in outcome['latency_ms'])
+    errors = [error for outcome in outcomes for error in outcome['errors']]
+    return {
+        'students': len(pairs),
+        'requests': len(latencies),
+        'errors': errors,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'max': latencies[-1] if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent submissions against a SQLite database.')
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['default', 'production'])
+    parser.add_argument('--rounds', type=int, default=1, help='Dashboard + submission cycles per student')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for mode in args.modes:
+        result = run_mode(mode, args.students, args.rounds, args.seed)
+        print(f"{mode:<11} students={result['students']} requests={result['requests']} "
+              f"errors={len(result['errors'])} p50={result['p50'] or 0:.1f}ms "
+              f"p95={result['p95'] or 0:.1f}ms max={result['max'] or 0:.1f}ms")
+        for error in sorted(set(result['errors']))[:5]:
+            print(f"    {error}")
+        if mode == 'production' and result['errors']:
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script to create the assignment_event table that logs assignment status changes
+Run this once on existing databases; the log starts empty and fills as students work
+"""
+
+from app import create_app, db
+from models.models import AssignmentEvent
+
+def create_assignment_events_table():
+    """Create assignment_event and its index"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            AssignmentEvent.__table__.create(db.engine, checkfirst=True)
+            print(f"[OK] Assignment event table ready with {AssignmentEvent.query.count()} events")
+            
+        except Exception as e:
+            print(f"[ERROR] Error creating assignment event table: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Creating assignment event table...")
+    create_assignment_events_table()
+    print("Done!")
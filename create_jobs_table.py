@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script to create the job table used by the background job queue (app/jobs.py)
+Run this once on existing databases before setting JOBS_MODE=worker
+"""
+
+from app import create_app, db
+from models.models import Job
+
+def create_jobs_table():
+    """Create job and its index"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            Job.__table__.create(db.engine, checkfirst=True)
+            print(f"[OK] Job table ready with {Job.query.count()} jobs")
+            
+        except Exception as e:
+            print(f"[ERROR] Error creating job table: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Creating job table...")
+    create_jobs_table()
+    print("Done!")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Script to create the notification archive table and the retention indexes
+Run this once on existing databases before scheduling `flask notifications purge`
+Also rebuilds archives created when notification_archive.id was the notification's id
+"""
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from models.models import Notification, NotificationArchive
+
+ARCHIVE_COLUMNS = 'user_id, title, message, notification_type, is_read, created_at, expires_at, archived_at'
+
+def rebuild_old_archive():
+    """Move an archive keyed by the notification id into the current table; True if there was one"""
+    inspector = inspect(db.engine)
+    if 'notification_archive' not in inspector.get_table_names():
+        return False
+    if 'notification_id' in {column['name'] for column in inspector.get_columns('notification_archive')}:
+        return False
+    with db.engine.begin() as connection:
+        for index in inspector.get_indexes('notification_archive'):
+            connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+        connection.exec_driver_sql("ALTER TABLE notification_archive RENAME TO notification_archive_old")
+        if connection.dialect.name == 'postgresql':
+            # The primary key's name would clash with the new table's
+            connection.exec_driver_sql("ALTER TABLE notification_archive_old "
+                                       "RENAME CONSTRAINT notification_archive_pkey TO notification_archive_old_pkey")
+        NotificationArchive.__table__.create(connection)
+        connection.exec_driver_sql(
+            f"INSERT INTO notification_archive (notification_id, {ARCHIVE_COLUMNS}) "
+            f"SELECT id, {ARCHIVE_COLUMNS} FROM notification_archive_old ORDER BY archived_at, id"
+        )
+        connection.exec_driver_sql("DROP TABLE notification_archive_old")
+    return True
+
+def create_notification_archive():
+    """Create notification_archive and the notification indexes used by the retention job"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            if rebuild_old_archive():
+                print("[OK] Rebuilt notification_archive with its own ids")
+            # create_all skips indexes of tables that already exist
+            db.create_all()
+            for index in Notification.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+            print(f"[OK] Notification archive ready with {NotificationArchive.query.count()} records")
+            
+        except Exception as e:
+            print(f"[ERROR] Error creating notification archive: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Creating notification archive...")
+    create_notification_archive()
+    print("Done!")
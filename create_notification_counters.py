@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Script to create and backfill the per-user unread notification counters
+Run this once after upgrading; counters are maintained automatically afterwards
+"""
+
+from app import create_app, db
+from models.models import User, NotificationCounter
+
+def create_notification_counters():
+    """Create the notification_counter table and recount every user's unread notifications"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            db.create_all()
+            NotificationCounter.recount(db.session.query(User.id))
+            db.session.commit()
+            print(f"[OK] Notification counters backfilled for {NotificationCounter.query.count()} users")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error backfilling notification counters: {e}")
+            return False
+
+    return True
+
+if __name__ == "__main__":
+    print("Backfilling notification counters...")
+    create_notification_counters()
+    print("Done!")
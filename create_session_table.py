@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script to create the server_session table used by SESSION_BACKEND=database
+Run this once on existing databases before switching sessions to the database
+"""
+
+from app import create_app, db
+from models.models import ServerSession
+
+def create_session_table():
+    """Create server_session and its expiry index"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            ServerSession.__table__.create(db.engine, checkfirst=True)
+            print(f"[OK] Session table ready with {ServerSession.query.count()} sessions")
+            
+        except Exception as e:
+            print(f"[ERROR] Error creating session table: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Creating session table...")
+    create_session_table()
+    print("Done!")
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script to create the submission_signature table used to find similar submissions
+Run this once on existing databases, then `flask --app run duplicates index` to sign earlier submissions
+"""
+
+from app import create_app, db
+from models.models import SubmissionSignature
+
+def create_submission_signatures_table():
+    """Create submission_signature and its index"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            SubmissionSignature.__table__.create(db.engine, checkfirst=True)
+            print(f"[OK] Submission signature table ready with {SubmissionSignature.query.count()} signatures")
+            
+        except Exception as e:
+            print(f"[ERROR] Error creating submission signature table: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Creating submission signature table...")
+    create_submission_signatures_table()
+    print("Done!")
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Script to add the version column to chat_room on existing databases
+The forum messages API derives its ETag from it
+"""
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+
+def migrate():
+    """Add chat_room.version if it is missing"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('chat_room')}
+            if 'version' in columns:
+                print("[OK] chat_room.version already exists")
+                return True
+            db.session.execute(db.text("ALTER TABLE chat_room ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+            db.session.commit()
+            print("[OK] Added chat_room.version")
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error adding chat_room.version: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Migrating chat_room...")
+    migrate()
+    print("Done!")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Script to add task.priority_rank on existing databases
+Fills it from task.priority and creates the index the student work queue reads
+"""
+
+from sqlalchemy import case, inspect
+
+from app import create_app, db
+from models.models import Assignment, Task, PRIORITY_RANKS, UNRANKED_PRIORITY
+
+def migrate():
+    """Add and backfill task.priority_rank, then create the work queue index"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('task')}
+            if 'priority_rank' not in columns:
+                db.session.execute(db.text(
+                    f"ALTER TABLE task ADD COLUMN priority_rank SMALLINT NOT NULL DEFAULT {UNRANKED_PRIORITY}"
+                ))
+                print("[OK] Added task.priority_rank")
+            # Re-rank every task so a changed PRIORITY_RANKS can be applied by running this again
+            rank = case(PRIORITY_RANKS, value=Task.__table__.c.priority, else_=UNRANKED_PRIORITY)
+            result = db.session.execute(Task.__table__.update().values(priority_rank=rank))
+            db.session.commit()
+            print(f"[OK] Ranked {result.rowcount} tasks")
+            
+            for index in Assignment.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+            # Created by earlier versions of this script; the work queue never used it
+            db.session.execute(db.text("DROP INDEX IF EXISTS ix_task_priority_deadline"))
+            db.session.commit()
+            print("[OK] Work queue index is in place")
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error migrating task.priority_rank: {e}")
+            return False
+    
+    return True
+
+if __name__ == "__main__":
+    print("Migrating task...")
+    migrate()
+    print("Done!")
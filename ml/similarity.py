@@ -0,0 +1,136 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing.
+
+A text becomes a set of word shingles (runs of SHINGLE_SIZE words), each
+hashed to 32 bits. Its MinHash signature holds, for NUM_PERM random hash
+functions, the smallest hash over its shingles; the fraction of positions
+where two signatures agree estimates the Jaccard similarity of the two
+shingle sets. Signatures for many texts are computed together in NumPy,
+one matrix operation per chunk of shingles.
+
+Comparing every pair of n signatures is quadratic (45k pairs for 300
+submissions). lsh_pairs() instead cuts each signature into BANDS bands of
+ROWS values and only considers texts that agree on a whole band. Pairs at
+similarity s collide in at least one band with probability
+1 - (1 - s**ROWS)**BANDS: about 0.9 at s = 0.6, under 0.01 at s = 0.2.
+Candidates are then checked against their estimated similarity.
+"""
+
+import re
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+import numpy as np
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF before 1.24
+    except ImportError:  # optional: no text from PDFs
+        fitz = None
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SEED = 20240901  # signatures are only comparable when made with the same seed
+
+# Universal hashing (a * x + b) mod P with a, b, x < 2**32: the products fit in uint64
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.iinfo(np.uint32).max
+
+# Shingles hashed per matrix operation: NUM_PERM x CHUNK uint64 values (8 MB)
+CHUNK = 8192
+
+_WORD = re.compile(r'\w+')
+_DOCX_TEXT = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t'
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Distinct 32-bit hashes of the text's word shingles (case and punctuation ignored)"""
+    words = _WORD.findall((text or '').lower())
+    if not words:
+        return np.empty(0, dtype=np.uint32)
+    if len(words) < size:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    # crc32 rather than hash(), which differs between processes
+    return np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint32, count=len(shingles))
+
+
+def minhash_signatures(shingle_sets):
+    """(len(shingle_sets), NUM_PERM) uint32 signatures; rows of empty sets are all _EMPTY"""
+    signatures = np.full((len(shingle_sets), NUM_PERM), _EMPTY, dtype=np.uint32)
+    lengths = np.array([len(s) for s in shingle_sets], dtype=np.int64)
+    if not lengths.sum():
+        return signatures
+    owners = np.repeat(np.arange(len(shingle_sets)), lengths)
+    hashes = np.concatenate([np.asarray(s, dtype=np.uint64) for s in shingle_sets if len(s)])
+    for start in range(0, len(hashes), CHUNK):
+        chunk = hashes[start:start + CHUNK]
+        chunk_owners = owners[start:start + CHUNK]
+        permuted = ((_A[:, None] * chunk[None, :] + _B[:, None]) % _PRIME).astype(np.uint32)
+        # Owners are contiguous, so each document's minimum is a reduceat over its run
+        starts = np.flatnonzero(np.r_[True, chunk_owners[1:] != chunk_owners[:-1]])
+        minima = np.minimum.reduceat(permuted, starts, axis=1).T
+        docs = chunk_owners[starts]
+        signatures[docs] = np.minimum(signatures[docs], minima)
+    return signatures
+
+
+def estimated_similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return float(np.mean(a == b))
+
+
+def lsh_pairs(signatures, threshold):
+    """[(i, j, similarity)] for rows whose estimated similarity is at least threshold, most similar first"""
+    signatures = np.asarray(signatures, dtype=np.uint32)
+    if len(signatures) < 2:
+        return []
+    candidates = set()
+    for band in range(BANDS):
+        rows = np.ascontiguousarray(signatures[:, band * ROWS:(band + 1) * ROWS])
+        _, buckets = np.unique(rows, axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind='stable')
+        sorted_buckets = buckets[order]
+        # Runs of equal bucket ids are the texts that agree on this band
+        bounds = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1], True])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end - start > 1:
+                members = order[start:end]
+                candidates.update((int(i), int(j)) for k, i in enumerate(members) for j in members[k + 1:])
+    pairs = []
+    for i, j in candidates:
+        i, j = min(i, j), max(i, j)
+        similarity = estimated_similarity(signatures[i], signatures[j])
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+    pairs.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+    return pairs
+
+
+def extract_text(path):
+    """Plain text of an uploaded .txt, .docx or (with PyMuPDF) .pdf file; '' for anything else"""
+    lowered = (path or '').lower()
+    try:
+        if lowered.endswith(('.txt', '.md')):
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                return f.read()
+        if lowered.endswith('.docx'):
+            with zipfile.ZipFile(path) as archive:
+                root = ElementTree.fromstring(archive.read('word/document.xml'))
+            return ' '.join(node.text for node in root.iter(_DOCX_TEXT) if node.text)
+        if lowered.endswith('.pdf') and fitz is not None:
+            with fitz.open(path) as document:
+                return ' '.join(page.get_text() for page in document)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, ElementTree.ParseError, RuntimeError):
+        return ''
+    return ''
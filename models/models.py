@@ -1,11 +1,40 @@
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
 from flask_login import UserMixin
+from sqlalchemy import inspect, event, select, literal, func, case, and_, or_, exists
+from sqlalchemy.orm import Session, joinedload, selectinload, make_transient_to_detached, validates, contains_eager
 from app import db, login_manager
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Column snapshots of recently loaded users, keyed by user id (see USER_CACHE_TTL)
+    user_id = int(user_id)
+    user_cache = current_app.extensions['user_cache']
+    if user_cache.ttl:
+        columns = user_cache.get(user_id)
+        if columns is not None:
+            return _hydrate_user(columns)
+
+    version = user_cache.version(user_id)
+    user = User.query.get(user_id)
+    if user is not None:
+        user_cache.set(user_id, {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs},
+                       version=version)
+    return user
+
+def _hydrate_user(columns):
+    """Attach a User built from cached columns to the session without a query.
+
+    Relationships stay lazy, so current_user.teaching_classes etc. load on access as before.
+    """
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+def invalidate_cached_user(user_id):
+    """Call after changing or deleting a user so the next request reloads it"""
+    current_app.extensions['user_cache'].bump(int(user_id))
 
 # Association table for teacher-class many-to-many relationship
 teacher_classes = db.Table('teacher_classes',
@@ -82,12 +111,28 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+# Dashboard order of Task.priority values; Task.priority_rank stores it so work queues sort in SQL
+PRIORITY_RANKS = {
+    'urgent_important': 1,
+    'important_not_urgent': 2,
+    'urgent_not_important': 3,
+    'high_priority': 4,
+    'medium_priority': 5,
+    'low_priority': 6,
+    'long_term': 7,
+    'group_task': 8,
+    'optional': 9,
+    'not_important_not_urgent': 10,
+}
+UNRANKED_PRIORITY = 99
+
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     deadline = db.Column(db.DateTime, nullable=False)
     priority = db.Column(db.String(50), nullable=False)
+    priority_rank = db.Column(db.SmallInteger, nullable=False, default=UNRANKED_PRIORITY)  # set from priority
     instructions = db.Column(db.Text)
     file_path = db.Column(db.String(500))  # Path to uploaded task file
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -99,6 +144,11 @@ class Task(db.Model):
     assigned_classes = db.relationship('Class', secondary=task_classes, backref='tasks', lazy=True)
     assigned_teacher = db.relationship('User', backref='assigned_tasks', foreign_keys=[assigned_teacher_id], lazy=True)
 
+    @validates('priority')
+    def _sync_priority_rank(self, key, priority):
+        self.priority_rank = PRIORITY_RANKS.get(priority, UNRANKED_PRIORITY)
+        return priority
+
     @property
     def is_overdue(self):
         from datetime import datetime
@@ -115,6 +165,11 @@ class Assignment(db.Model):
     # Relationships
     submissions = db.relationship('Submission', backref='assignment', lazy=True)
 
+    # A student's assignments, joined to their tasks for the work queue
+    __table_args__ = (
+        db.Index('ix_assignment_student_task', 'student_id', 'task_id'),
+    )
+
     @property
     def is_overdue(self):
         from datetime import datetime
@@ -123,6 +178,23 @@ class Assignment(db.Model):
             return False
         return datetime.utcnow() > self.task.deadline and self.status != 'completed'
 
+class AssignmentEvent(db.Model):
+    """Append-only log of assignment status changes (app/assignments.py writes it).
+
+    One narrow row per transition: which assignment entered which status, when and,
+    for user actions, who made the change. Time-to-start and time-to-submit come from
+    these timestamps.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    actor_id = db.Column(db.Integer, nullable=True)  # None for system transitions such as overdue sweeps
+    
+    __table_args__ = (
+        db.Index('ix_assignment_event_assignment', 'assignment_id', 'created_at'),
+    )
+
 class Submission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
@@ -136,6 +208,14 @@ class Submission(db.Model):
     feedback_provided_at = db.Column(db.DateTime, nullable=True)  # When feedback was provided
     graded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Teacher who graded
 
+class SubmissionSignature(db.Model):
+    """MinHash signature of a submission's text, for near-duplicate detection (app/duplicates.py)"""
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False, index=True)  # copied from the assignment: one task's signatures load together
+    signature = db.Column(db.LargeBinary, nullable=False)  # ml.similarity.NUM_PERM little-endian uint32 values
+    shingle_count = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -149,6 +229,12 @@ class Notification(db.Model):
     # Relationships
     user = db.relationship('User', backref='notifications', lazy=True)
     
+    # Used by the retention job to find expired and old read rows
+    __table_args__ = (
+        db.Index('ix_notification_expires_at', 'expires_at'),
+        db.Index('ix_notification_read_created', 'is_read', 'created_at'),
+    )
+    
     def is_expired(self):
         if self.expires_at is None:
             return False
@@ -175,32 +261,203 @@ class Notification(db.Model):
     @staticmethod
     def create_system_notification(title, message, notification_type='info', target_users='all', expires_in_hours=24):
         """Create system notifications for multiple users"""
-        from models.models import User
-        
         if target_users == 'all':
-            users = User.query.all()
+            recipients = db.session.query(User.id)
         elif target_users == 'teachers':
-            users = User.query.filter_by(user_type='teacher').all()
+            recipients = db.session.query(User.id).filter_by(user_type='teacher')
         elif target_users == 'students':
-            users = User.query.filter_by(user_type='student').all()
+            recipients = db.session.query(User.id).filter_by(user_type='student')
         else:
-            return []
-        
-        notifications = []
-        for user in users:
-            expires_at = datetime.utcnow() + timedelta(hours=expires_in_hours)
-            notification = Notification(
-                user_id=user.id,
-                title=title,
-                message=message,
-                notification_type=notification_type,
-                expires_at=expires_at
-            )
-            db.session.add(notification)
-            notifications.append(notification)
+            return 0
         
+        expires_at = datetime.utcnow() + timedelta(hours=expires_in_hours)
+        created = Notification.bulk_create(recipients, title, message, notification_type, expires_at)
         db.session.commit()
-        return notifications
+        return created
+    
+    @staticmethod
+    def bulk_create(recipients, title, message, notification_type='info', expires_at=None):
+        """Create the same notification for many users with one INSERT ... SELECT.
+
+        recipients is a query/select of user ids or a list of ids. Unread counters are
+        updated set-based in the same transaction; the caller commits. Returns the
+        number of notifications created.
+        """
+        now = datetime.utcnow()
+        user_ids = _user_id_subquery(recipients)
+        result = db.session.execute(Notification.__table__.insert().from_select(
+            ['user_id', 'title', 'message', 'notification_type', 'is_read', 'created_at', 'expires_at'],
+            select(
+                user_ids.c[0],
+                literal(title, db.String),
+                literal(message, db.Text),
+                literal(notification_type, db.String),
+                literal(False, db.Boolean),
+                literal(now, db.DateTime),
+                literal(expires_at, db.DateTime),
+            )
+        ))
+        if expires_at is None or expires_at > now:
+            _adjust_unread_counters(db.session, select(user_ids.c[0]), 1, expires_at, now)
+        return result.rowcount
+
+class NotificationArchive(db.Model):
+    """Notifications moved out of the live table by the retention job (app/retention.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    # Id the notification had. Not unique: SQLite hands a purged row's id to the next notification
+    notification_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False)
+    is_read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class NotificationCounter(db.Model):
+    """Unread, non-expired notification count per user, kept in step with the notification table.
+
+    The count stays exact until next_expiry_at (the earliest expiry among the counted
+    notifications); a row read after that point is recounted first. version changes on
+    every update and backs the unread-count ETag.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    next_expiry_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def unread_for(user_id):
+        """Return (unread_count, version) for a user with a primary-key lookup"""
+        counters = NotificationCounter.__table__
+        query = select(counters.c.unread_count, counters.c.next_expiry_at, counters.c.version).where(
+            counters.c.user_id == user_id
+        )
+        row = db.session.execute(query).first()
+        if row is None or (row.next_expiry_at is not None and row.next_expiry_at <= datetime.utcnow()):
+            NotificationCounter.recount([user_id])
+            db.session.commit()
+            row = db.session.execute(query).first()
+        return row.unread_count, row.version
+    
+    @staticmethod
+    def recount(recipients):
+        """Recompute counters from the notification table for the given users; the caller commits"""
+        now = datetime.utcnow()
+        counters = NotificationCounter.__table__
+        live = _live_unread_clause(counters.c.user_id, now)
+        user_ids = select(_user_id_subquery(recipients).c[0])
+        db.session.execute(counters.update().where(counters.c.user_id.in_(user_ids)).values(
+            unread_count=select(func.count(Notification.__table__.c.id)).where(live).scalar_subquery(),
+            next_expiry_at=select(func.min(Notification.__table__.c.expires_at)).where(live).scalar_subquery(),
+            version=counters.c.version + 1,
+        ))
+        _insert_missing_counters(db.session, user_ids, now)
+    
+    @staticmethod
+    def reset(user_id):
+        """Zero a user's counter after all of their notifications were marked read"""
+        counters = NotificationCounter.__table__
+        db.session.execute(counters.update().where(counters.c.user_id == user_id).values(
+            unread_count=0, next_expiry_at=None, version=counters.c.version + 1
+        ))
+
+def _user_id_subquery(recipients):
+    if isinstance(recipients, (list, tuple, set)):
+        recipients = db.session.query(User.id).filter(User.id.in_(list(recipients)))
+    return recipients.subquery()
+
+def _live_unread_clause(user_id_column, now):
+    notifications = Notification.__table__
+    return and_(
+        notifications.c.user_id == user_id_column,
+        notifications.c.is_read == False,
+        or_(notifications.c.expires_at.is_(None), notifications.c.expires_at > now),
+    )
+
+def _insert_missing_counters(session, user_ids, now):
+    """Create counter rows, counted from scratch, for users in user_ids that don't have one"""
+    counters = NotificationCounter.__table__
+    users = User.__table__
+    live = _live_unread_clause(users.c.id, now)
+    source = select(
+        users.c.id,
+        select(func.count(Notification.__table__.c.id)).where(live).scalar_subquery(),
+        select(func.min(Notification.__table__.c.expires_at)).where(live).scalar_subquery(),
+        literal(1, db.Integer),
+    ).where(
+        users.c.id.in_(user_ids),
+        ~exists().where(counters.c.user_id == users.c.id),
+    )
+    session.connection().execute(
+        _insert_ignoring_conflicts(session, counters).from_select(
+            ['user_id', 'unread_count', 'next_expiry_at', 'version'], source
+        )
+    )
+
+def _insert_ignoring_conflicts(session, table):
+    # Two transactions may both create a user's first counter row
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    return table.insert()
+
+def _adjust_unread_counters(session, user_ids, delta, expires_at, now):
+    """Add delta to the counters of user_ids (a select or list of ids), in the current transaction"""
+    counters = NotificationCounter.__table__
+    if isinstance(user_ids, (list, tuple, set)):
+        user_ids = list(user_ids)
+    values = {
+        'unread_count': case((counters.c.unread_count + delta < 0, 0), else_=counters.c.unread_count + delta),
+        'version': counters.c.version + 1,
+    }
+    if delta > 0 and expires_at is not None:
+        expiry = literal(expires_at, db.DateTime)
+        values['next_expiry_at'] = case(
+            (counters.c.next_expiry_at.is_(None), expiry),
+            (counters.c.next_expiry_at > expiry, expiry),
+            else_=counters.c.next_expiry_at,
+        )
+    session.connection().execute(counters.update().where(counters.c.user_id.in_(user_ids)).values(**values))
+    if delta > 0:
+        # Users without a counter yet get one counted from scratch (it already includes these rows)
+        _insert_missing_counters(session, user_ids, now)
+
+@event.listens_for(Session, 'after_flush')
+def _track_unread_notifications(session, flush_context):
+    """Keep notification counters in step with ORM inserts, read-state changes and deletes"""
+    now = datetime.utcnow()
+    changes = {}  # (delta, expires_at) -> user ids
+
+    def record(notification, delta):
+        if notification.expires_at is None or notification.expires_at > now:
+            key = (delta, notification.expires_at if delta > 0 else None)
+            changes.setdefault(key, set()).add(notification.user_id)
+
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read:
+            record(obj, 1)
+    for obj in session.dirty:
+        if isinstance(obj, Notification):
+            history = inspect(obj).attrs.is_read.history
+            if history.has_changes():
+                was_read = bool(history.deleted[0]) if history.deleted else False
+                if not was_read and obj.is_read:
+                    record(obj, -1)
+                elif was_read and not obj.is_read:
+                    record(obj, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and not obj.is_read:
+            record(obj, -1)
+
+    # One set-based statement per distinct adjustment, however many users it covers
+    for (delta, expires_at), user_ids in changes.items():
+        _adjust_unread_counters(session, user_ids, delta, expires_at, now)
 
 class ContactMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -226,6 +483,8 @@ class ChatRoom(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Moves whenever a message is posted, edited or deleted; backs the messages API ETag
+    version = db.Column(db.Integer, nullable=False, default=0)
     
     # Relationships
     creator = db.relationship('User', backref='created_rooms', lazy=True)
@@ -288,3 +547,89 @@ class ChatMessage(db.Model):
     def formatted_time(self):
         """Return formatted time for display"""
         return self.created_at.strftime('%Y-%m-%d %H:%M')
+
+def bump_room_versions(session, room_ids):
+    """Move the version of rooms (ids or a SELECT of ids) whose messages changed, in the current transaction"""
+    rooms = ChatRoom.__table__
+    session.connection().execute(rooms.update().where(rooms.c.id.in_(room_ids)).values(version=rooms.c.version + 1))
+
+@event.listens_for(Session, 'after_flush')
+def _track_room_messages(session, flush_context):
+    """Bump room versions for ORM message inserts, edits, soft deletes and deletes"""
+    room_ids = {obj.room_id for obj in session.new if isinstance(obj, ChatMessage)}
+    room_ids.update(obj.room_id for obj in session.deleted if isinstance(obj, ChatMessage))
+    for obj in session.dirty:
+        if isinstance(obj, ChatMessage):
+            attrs = inspect(obj).attrs
+            if attrs.content.history.has_changes() or attrs.is_deleted.history.has_changes():
+                room_ids.add(obj.room_id)
+    if room_ids:
+        bump_room_versions(session, list(room_ids))
+
+
+class ServerSession(db.Model):
+    """Server-side session payloads for SESSION_BACKEND=database (app/sessions.py)"""
+    id = db.Column(db.String(64), primary_key=True)  # the session cookie value
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class Job(db.Model):
+    """Background work queued by enqueue() and run by `flask jobs worker` (app/jobs.py).
+
+    Finished jobs are deleted, so the table only holds work that is waiting,
+    running, or has used up its attempts.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)  # name the handler was registered under
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before; moved back on retry
+    locked_by = db.Column(db.String(100))  # worker that claimed it
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Workers look for the oldest ready job with status = 'queued' AND run_at <= now
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+
+# Eager-loading profiles for relationship-heavy pages.
+# Views apply them with query.options(*loader_profile('name')) so templates that walk
+# assignment.task / assignment.student / assignment.submissions don't issue a query per row.
+# Built on first use because backref attributes only exist once the mappers are configured.
+_loader_profiles = {}
+
+
+def _build_loader_profiles():
+    return {
+        # student_dashboard.html: task details, status and the first submission's score
+        # (the work queue already joins Assignment.task to sort by it)
+        'student_dashboard': (
+            contains_eager(Assignment.task),
+            selectinload(Assignment.submissions),
+        ),
+        # review_submissions.html: student name plus the submission for each assignment
+        'review_submissions': (
+            joinedload(Assignment.student),
+            selectinload(Assignment.submissions),
+        ),
+        # task_progress.html: student name for each assignment
+        'task_progress': (
+            joinedload(Assignment.student),
+        ),
+        # admin_tasks.html: completion counts per task
+        'admin_tasks': (
+            selectinload(Task.assignments),
+        ),
+    }
+
+
+def loader_profile(name):
+    """Return the loader options registered under name"""
+    if not _loader_profiles:
+        _loader_profiles.update(_build_loader_profiles())
+    return _loader_profiles[name]
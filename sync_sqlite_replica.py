@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script to refresh a local SQLite copy used as the read replica
+Useful for development and tests: point DATABASE_REPLICA_URL at the copy
+(e.g. sqlite:////path/to/instance/replica.db) and re-run this to catch it up
+"""
+
+import sqlite3
+import sys
+
+from sqlalchemy.engine import make_url
+
+from app import create_app
+
+def sync_sqlite_replica(replica_path=None):
+    """Copy the primary SQLite database to the replica file with the online backup API"""
+    app = create_app()
+    primary = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if primary.get_backend_name() != 'sqlite':
+        print("[ERROR] The primary database is not SQLite; use your database's replication instead")
+        return False
+    if replica_path is None:
+        if not app.config.get('DATABASE_REPLICA_URL'):
+            print("[ERROR] Pass a replica path or set DATABASE_REPLICA_URL")
+            return False
+        replica_path = make_url(app.config['DATABASE_REPLICA_URL']).database
+    
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica_path)
+    try:
+        # Consistent snapshot even while the app keeps writing to the primary
+        source.backup(target)
+        print(f"[OK] Replica {replica_path} synced from {primary.database}")
+    finally:
+        target.close()
+        source.close()
+    return True
+
+if __name__ == "__main__":
+    sync_sqlite_replica(sys.argv[1] if len(sys.argv) > 1 else None)